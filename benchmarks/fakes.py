@@ -0,0 +1,315 @@
+# benchmarks/fakes.py
+"""
+Local stand-ins for Gemini, Azure Speech, B2 and the articles DB, so the
+pipeline can be benchmarked without credentials or network.
+
+Every fake goes through a FakeService, which adds latency, random errors and
+429-style throttling, and counts what happened.
+"""
+import json
+import random
+import re
+import threading
+import time
+import types
+import uuid
+from html import escape
+
+from pipeline.hls_segmenter import parse_frame_header
+
+
+class ServiceError(RuntimeError):
+    pass
+
+
+class ThrottledError(RuntimeError):
+    """Message matches rate_limit.is_throttle_error, like a real 429."""
+
+    code = 429
+
+
+class FakeService:
+    """
+    Latency, failures and throttling for one fake backend.
+
+    latency: mean seconds per call (uniform +-50% jitter), plus per_unit
+    seconds for each unit of work (characters, bytes, rows).
+    error_rate: share of calls that fail with ServiceError.
+    max_concurrency / rpm: above these the call fails with a 429 instead.
+    """
+
+    def __init__(self, name: str, latency: float = 0.0, per_unit: float = 0.0, error_rate: float = 0.0,
+                 max_concurrency: int = 0, rpm: float = 0, seed: int = None):
+        self.name = name
+        self.latency = latency
+        self.per_unit = per_unit
+        self.error_rate = error_rate
+        self.max_concurrency = max_concurrency
+        self.rpm = rpm
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._window = []  # call start times in the last minute
+        self.calls = 0
+        self.errors = 0
+        self.throttled = 0
+
+    def call(self, units: float = 0):
+        """Simulate one request; raises like the real service would."""
+        now = time.monotonic()
+        with self._lock:
+            self.calls += 1
+            if self.rpm:
+                self._window = [t for t in self._window if now - t < 60.0]
+            over_rpm = self.rpm and len(self._window) >= self.rpm
+            over_concurrency = self.max_concurrency and self._in_flight >= self.max_concurrency
+            if over_rpm or over_concurrency:
+                self.throttled += 1
+                raise ThrottledError(f"{self.name}: 429 Too Many Requests")
+            if self.rpm:
+                self._window.append(now)
+            self._in_flight += 1
+            fail = self._random.random() < self.error_rate
+            delay = self.latency * self._random.uniform(0.5, 1.5) + self.per_unit * units
+        try:
+            if delay > 0:
+                time.sleep(delay)
+            if fail:
+                with self._lock:
+                    self.errors += 1
+                raise ServiceError(f"{self.name}: simulated failure")
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"calls": self.calls, "errors": self.errors, "throttled": self.throttled}
+
+
+# --- Gemini ---
+
+_VOICE = re.compile(r'<voice name="([^"]+)">')
+_PACING = re.compile(r'<prosody rate="([^"]+)">')
+_SINGLE_ARTICLE = re.compile(r'Article:\s*"""(.*)"""', re.DOTALL)
+_BATCH_ARTICLE = re.compile(r"<<<ARTICLE (\d+)>>>\n(.*?)\n<<<END ARTICLE \1>>>", re.DOTALL)
+
+
+def fake_ssml(article_text: str, voice1: str, voice2: str, pacing: str = "medium") -> str:
+    """Well-formed two-voice SSML reading the article's sentences in turns."""
+    sentences = [s.strip() for s in re.split(r"(?<=[.!?])\s+", article_text) if s.strip()] or ["No content."]
+    turns = []
+    for i in range(0, len(sentences), 2):
+        voice = voice1 if (i // 2) % 2 == 0 else voice2
+        text = escape(" ".join(sentences[i:i + 2]))
+        turns.append(f'<voice name="{voice}"><prosody rate="{pacing}">{text}<break time="300ms"/></prosody></voice>')
+    return ('<speak version="1.0" xmlns="http://www.w3.org/2001/10/synthesis" xml:lang="en-IN">'
+            + "".join(turns) + "</speak>")
+
+
+class FakeGeminiModel:
+    """Drop-in for genai.GenerativeModel: answers build_prompt / build_batch_prompt."""
+
+    def __init__(self, service: FakeService):
+        self.service = service
+
+    def generate_content(self, prompt: str, generation_config=None):
+        self.service.call(units=len(prompt))
+        voices = list(dict.fromkeys(_VOICE.findall(prompt)))[:2] or ["en-IN-NeerjaNeural", "en-IN-PrabhatNeural"]
+        voice1, voice2 = voices[0], voices[-1]
+        pacing_match = _PACING.search(prompt)
+        pacing = pacing_match.group(1) if pacing_match else "medium"
+
+        batch = _BATCH_ARTICLE.findall(prompt)
+        if batch:
+            text = json.dumps([fake_ssml(article, voice1, voice2, pacing) for _, article in batch])
+        else:
+            m = _SINGLE_ARTICLE.search(prompt)
+            text = fake_ssml(m.group(1) if m else "", voice1, voice2, pacing)
+        return types.SimpleNamespace(text=text)
+
+
+# --- Azure Speech ---
+
+# One MPEG-1 Layer III frame, 48 kHz mono 192 kbps (Audio48Khz192KBitRateMonoMp3)
+_MP3_FRAME = bytes([0xFF, 0xFB, 0xB4, 0xC0]) + bytes(572)
+_FRAME_SECONDS = parse_frame_header(_MP3_FRAME).duration
+# Roughly how long it takes to read one character of text aloud
+SECONDS_PER_CHAR = 0.06
+
+
+def fake_mp3(ssml: str) -> bytes:
+    """Silent MP3 whose duration scales with the spoken text in the SSML."""
+    spoken = re.sub(r"<[^>]+>", "", ssml)
+    frames = max(1, int(len(spoken) * SECONDS_PER_CHAR / _FRAME_SECONDS))
+    return _MP3_FRAME * frames
+
+
+class _Signal:
+    def __init__(self):
+        self._handlers = []
+
+    def connect(self, handler):
+        self._handlers.append(handler)
+
+    def fire(self, evt):
+        for handler in self._handlers:
+            handler(evt)
+
+
+class _Future:
+    def __init__(self, fn):
+        self._done = threading.Event()
+        self._result = None
+
+        def run():
+            self._result = fn()
+            self._done.set()
+        threading.Thread(target=run, daemon=True).start()
+
+    def get(self):
+        self._done.wait()
+        return self._result
+
+
+def fake_speechsdk(service: FakeService, chunk_bytes: int = 32 * 1024):
+    """
+    Module-like stand-in for azure.cognitiveservices.speech covering what
+    azure_tts uses: file and in-memory synthesis, and the synthesizing /
+    completed / canceled events of streaming synthesis.
+    """
+    sdk = types.SimpleNamespace()
+    sdk.ResultReason = types.SimpleNamespace(SynthesizingAudioCompleted="SynthesizingAudioCompleted",
+                                             Canceled="Canceled")
+    sdk.SpeechSynthesisOutputFormat = types.SimpleNamespace(Audio48Khz192KBitRateMonoMp3="mp3")
+
+    class SpeechConfig:
+        def __init__(self, subscription=None, region=None):
+            pass
+
+        def set_speech_synthesis_output_format(self, fmt):
+            pass
+
+    class AudioConfig:
+        def __init__(self, filename=None):
+            self.filename = filename
+
+    class SpeechSynthesisCancellationDetails:
+        def __init__(self, result):
+            self.reason = "Error"
+            self.error_code = getattr(result, "error_code", "ServiceError")
+            self.error_details = result.error_details
+
+    class SpeechSynthesizer:
+        def __init__(self, speech_config=None, audio_config=None):
+            self.audio_config = audio_config
+            self.synthesizing = _Signal()
+            self.synthesis_completed = _Signal()
+            self.synthesis_canceled = _Signal()
+
+        def _run(self, ssml):
+            audio = fake_mp3(ssml)
+            try:
+                # Latency is spread over the chunks, as with a real streaming response
+                service.call(units=len(ssml))
+            except Exception as e:
+                result = types.SimpleNamespace(reason=sdk.ResultReason.Canceled, audio_data=b"",
+                                               error_details=str(e), error_code=type(e).__name__)
+                self.synthesis_canceled.fire(types.SimpleNamespace(result=result))
+                return result
+            for start in range(0, len(audio), chunk_bytes):
+                self.synthesizing.fire(types.SimpleNamespace(
+                    result=types.SimpleNamespace(audio_data=audio[start:start + chunk_bytes])))
+            if self.audio_config is not None and self.audio_config.filename:
+                with open(self.audio_config.filename, "wb") as f:
+                    f.write(audio)
+            result = types.SimpleNamespace(reason=sdk.ResultReason.SynthesizingAudioCompleted, audio_data=audio)
+            self.synthesis_completed.fire(types.SimpleNamespace(result=result))
+            return result
+
+        def speak_ssml_async(self, ssml):
+            return _Future(lambda: self._run(ssml))
+
+        def stop_speaking_async(self):
+            return _Future(lambda: None)
+
+    sdk.SpeechConfig = SpeechConfig
+    sdk.audio = types.SimpleNamespace(AudioConfig=AudioConfig)
+    sdk.SpeechSynthesizer = SpeechSynthesizer
+    sdk.SpeechSynthesisCancellationDetails = SpeechSynthesisCancellationDetails
+    return sdk
+
+
+# --- B2 ---
+
+class FakeBucket:
+    """Bucket with the upload calls b2_uploader makes; keeps only names and sizes."""
+
+    class _FileVersion:
+        def __init__(self, file_name):
+            self.file_name = file_name
+            self.id_ = uuid.uuid4().hex
+
+    def __init__(self, service: FakeService):
+        self.service = service
+        self._lock = threading.Lock()
+        self.objects = {}
+
+    def _store(self, file_name, size):
+        self.service.call(units=size)
+        with self._lock:
+            self.objects[file_name] = size
+        return self._FileVersion(file_name)
+
+    def upload_local_file(self, local_file, file_name, content_type=None, **kwargs):
+        with open(local_file, "rb") as f:
+            size = len(f.read())
+        return self._store(file_name, size)
+
+    def upload_bytes(self, data_bytes, file_name, content_type=None, **kwargs):
+        return self._store(file_name, len(data_bytes))
+
+
+# --- DB ---
+
+class FakeDatabase:
+    """
+    In-memory articles table keyed by content_key, with the functions the
+    pipeline imports from db_pusher: push_articles_to_db, existing_articles and
+    fetch_recent_embeddings.
+    """
+
+    def __init__(self, service: FakeService):
+        self.service = service
+        self._lock = threading.Lock()
+        self.rows = {}  # content_key -> {"article_id", "audio_key", "embedding"}
+        self._next_id = 1
+
+    def push_articles_to_db(self, df, batch_size: int = None):
+        records = df.to_dict("records")
+        self.service.call(units=len(records))
+        ids = []
+        with self._lock:
+            for rec in records:
+                key = rec.get("content_key") or rec.get("pipeline_key") or uuid.uuid4().hex
+                row = self.rows.get(key)
+                if row is None:
+                    row = {"article_id": self._next_id}
+                    self._next_id += 1
+                    self.rows[key] = row
+                row["audio_key"] = rec.get("audio_url") or rec.get("audio_key")
+                row["embedding"] = rec.get("embedding")
+                ids.append(row["article_id"])
+        return ids
+
+    def existing_articles(self, content_keys) -> dict:
+        self.service.call(units=len(content_keys))
+        with self._lock:
+            return {key: dict(self.rows[key]) for key in content_keys if key in self.rows}
+
+    def fetch_recent_embeddings(self, hours: float, limit: int):
+        self.service.call()
+        with self._lock:
+            rows = [r for r in self.rows.values() if r.get("audio_key") and r.get("embedding") is not None]
+        rows = rows[-limit:]
+        return [r["audio_key"] for r in rows], [r["embedding"] for r in rows]
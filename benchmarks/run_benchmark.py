@@ -0,0 +1,323 @@
+# benchmarks/run_benchmark.py
+"""
+Offline benchmark: runs the real pipeline (threaded or asyncio mode) over a
+synthetic article set, with Gemini, Azure, B2 and the DB replaced by the
+local fakes in benchmarks/fakes.py, and reports articles/sec, per-stage
+latency percentiles and peak RSS.
+
+    python benchmarks/run_benchmark.py --articles 200
+    python benchmarks/run_benchmark.py --mode async --latency azure=2 --throttle gemini=2
+    python benchmarks/run_benchmark.py --set HLS_STREAMING=true --json results.json
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from benchmarks.fakes import FakeService, FakeGeminiModel, fake_speechsdk, FakeBucket, FakeDatabase
+from pipeline.config import Config
+from pipeline.log import setup_logging
+from pipeline import ssml_creator, azure_tts, b2_uploader, db_pusher, dedup, orchestrator, tracing
+
+# Mean seconds per call; per-unit costs make long articles and big uploads slower
+DEFAULT_SERVICES = {
+    "gemini": {"latency": 0.8, "per_unit": 0.00002},   # per prompt character
+    "azure": {"latency": 1.0, "per_unit": 0.0002},     # per SSML character
+    "b2": {"latency": 0.05, "per_unit": 0.00000002},   # per byte
+    "db": {"latency": 0.02, "per_unit": 0.0005},       # per row
+}
+
+_WORDS = (
+    "government market city council report growth rain festival school match court police "
+    "company launch budget river election health farmers prices minister students hospital "
+    "traffic bridge record season policy energy water village award technology"
+).split()
+
+
+# --- synthetic input ---
+
+def synthetic_article(rng: random.Random, dim: int) -> dict:
+    sentences = []
+    for _ in range(rng.randint(4, 12)):
+        words = [rng.choice(_WORDS) for _ in range(rng.randint(8, 20))]
+        sentences.append(" ".join(words).capitalize() + ".")
+    embedding = ",".join(f"{v:.6f}" for v in (rng.gauss(0, 1) for _ in range(dim)))
+    return {
+        "title": " ".join(rng.choice(_WORDS) for _ in range(6)).title() + f" {rng.randint(1, 10**6)}",
+        "description": " ".join(sentences),
+        "news_source": rng.choice(["Daily Gazette", "Capitol News", "TechWire", "Metro Times"]),
+        "topic": rng.choice(["politics", "culture|local", "technology", "sports", "business"]),
+        "published_date": "2025-11-04",
+        "embedding": f"[{embedding}]",
+    }
+
+
+def write_synthetic_csv(path: str, n: int, duplicate_rate: float = 0.0, dim: int = 768, seed: int = 0):
+    """n articles; duplicate_rate of them re-word an earlier article (same embedding, new source)."""
+    import pandas as pd
+
+    rng = random.Random(seed)
+    rows = []
+    for _ in range(n):
+        if rows and rng.random() < duplicate_rate:
+            row = dict(rng.choice(rows))
+            row["title"] = row["title"] + " (updated)"
+            row["news_source"] = "Wire Copy"
+        else:
+            row = synthetic_article(rng, dim)
+        rows.append(row)
+    pd.DataFrame(rows).to_csv(path, index=False)
+
+
+# --- per-stage timing ---
+
+class StageTimer:
+    """Wall time of every stage call, by stage name."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = {}
+
+    def record(self, stage: str, seconds: float):
+        with self._lock:
+            self.samples.setdefault(stage, []).append(seconds)
+
+    def wrap(self, stage: str, fn):
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.record(stage, time.perf_counter() - start)
+        return timed
+
+    def summary(self) -> dict:
+        with self._lock:
+            out = {}
+            for stage, values in self.samples.items():
+                p50, p95, p99 = np.percentile(values, [50, 95, 99])
+                out[stage] = {"calls": len(values), "p50": round(float(p50), 4),
+                              "p95": round(float(p95), 4), "p99": round(float(p99), 4)}
+            return out
+
+
+def instrument_stages(timer: StageTimer):
+    """Time stage calls in both engines (threaded: the stage functions; async: _run_stage)."""
+    for stage, attr in (
+        ("ssml", "stage_generate_ssml"),
+        ("ssml", "stage_generate_ssml_batch"),
+        ("tts", "stage_synthesize"),
+        ("hls", "stage_convert_hls"),
+        ("upload", "stage_upload_hls"),
+        ("upload", "stage_stream_to_hls"),
+    ):
+        setattr(orchestrator, attr, timer.wrap(stage, getattr(orchestrator, attr)))
+
+    from pipeline.async_orchestrator import AsyncPipelineRunner
+    run_stage = AsyncPipelineRunner._run_stage
+
+    async def timed_run_stage(self, name, job):
+        start = time.perf_counter()
+        try:
+            return await run_stage(self, name, job)
+        finally:
+            timer.record(name, time.perf_counter() - start)
+
+    AsyncPipelineRunner._run_stage = timed_run_stage
+
+
+# --- wiring ---
+
+def install_fakes(services: dict) -> dict:
+    """Point every external call of the pipeline at the fakes; returns the fake objects."""
+    model = FakeGeminiModel(services["gemini"])
+    ssml_creator.get_model = lambda: model
+    Config.GOOGLE_API_KEY = Config.GOOGLE_API_KEY or "benchmark"
+
+    azure_tts.speechsdk = fake_speechsdk(services["azure"])
+    Config.AZURE_SPEECH_KEY = Config.AZURE_SPEECH_KEY or "benchmark"
+    Config.AZURE_SPEECH_REGION = Config.AZURE_SPEECH_REGION or "benchmark"
+
+    bucket = FakeBucket(services["b2"])
+    b2_uploader.get_b2_session().set_bucket(bucket)
+
+    db = FakeDatabase(services["db"])
+    db_pusher.push_articles_to_db = db.push_articles_to_db
+    orchestrator.existing_articles = db.existing_articles
+    dedup.fetch_recent_embeddings = db.fetch_recent_embeddings
+    return {"bucket": bucket, "db": db}
+
+
+def _parse_value(current, text: str):
+    if isinstance(current, bool):
+        return text.lower() in ("1", "true", "yes")
+    if isinstance(current, (int, float)):
+        return type(current)(text)
+    return text
+
+
+def apply_overrides(pairs: list):
+    for pair in pairs:
+        key, _, value = pair.partition("=")
+        if not hasattr(Config, key):
+            raise SystemExit(f"Unknown config setting: {key}")
+        setattr(Config, key, _parse_value(getattr(Config, key), value))
+
+
+def _service_options(pairs: list, option: str) -> dict:
+    out = {}
+    for pair in pairs:
+        service, _, value = pair.partition("=")
+        if service not in DEFAULT_SERVICES or not value:
+            raise SystemExit(f"--{option} expects SERVICE=VALUE with SERVICE in {', '.join(DEFAULT_SERVICES)}")
+        out[service] = float(value)
+    return out
+
+
+def build_services(args) -> dict:
+    latency = _service_options(args.latency, "latency")
+    errors = _service_options(args.error_rate, "error-rate")
+    throttle = _service_options(args.throttle, "throttle")
+    rpm = _service_options(args.rpm, "rpm")
+    services = {}
+    for i, (name, defaults) in enumerate(DEFAULT_SERVICES.items()):
+        scale = latency.get(name, defaults["latency"]) / defaults["latency"]
+        services[name] = FakeService(
+            name,
+            latency=latency.get(name, defaults["latency"]),
+            per_unit=defaults["per_unit"] * scale,
+            error_rate=errors.get(name, 0.0),
+            max_concurrency=int(throttle.get(name, 0)),
+            rpm=rpm.get(name, 0),
+            seed=args.seed + i,
+        )
+    return services
+
+
+def peak_rss_mb() -> float:
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+def run(args) -> dict:
+    workdir = tempfile.mkdtemp(prefix="newspods_bench_")
+    try:
+        csv_path = args.csv
+        if not csv_path:
+            csv_path = os.path.join(workdir, "articles.csv")
+            write_synthetic_csv(csv_path, args.articles, args.duplicate_rate, seed=args.seed)
+
+        # Measure the pipeline, not the caches or an old journal
+        Config.SSML_CACHE_ENABLED = False
+        Config.AUDIO_CACHE_ENABLED = False
+        Config.JOURNAL_PATH = os.path.join(workdir, "journal.jsonl")
+        Config.OUTPUT_AUDIO_DIR = os.path.join(workdir, "audio")
+        if Config.HLS_SEGMENTER == "ffmpeg" and shutil.which("ffmpeg") is None:
+            print("⚠️ ffmpeg not found; benchmarking with HLS_SEGMENTER=native.")
+            Config.HLS_SEGMENTER = "native"
+        apply_overrides(args.set)
+
+        services = build_services(args)
+        fakes = install_fakes(services)
+        timer = StageTimer()
+        instrument_stages(timer)
+
+        if args.trace:
+            tracing.start_tracing()
+        profiler = tracing.SamplingProfiler().start() if args.profile else None
+        start = time.perf_counter()
+        try:
+            if args.mode == "async":
+                from pipeline.async_orchestrator import run_pipeline_from_csv_async_mode
+                summary = run_pipeline_from_csv_async_mode(csv_path)
+            else:
+                summary = orchestrator.run_pipeline_from_csv(csv_path)
+        finally:
+            elapsed = time.perf_counter() - start
+            if profiler is not None:
+                profiler.stop()
+                profiler.write(args.profile)
+            if args.trace:
+                tracing.stop_tracing(args.trace)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        "mode": args.mode,
+        "articles": summary["num_total"],
+        "succeeded": summary["num_success_audio"],
+        "failed": summary["num_failures"],
+        "duplicates": summary.get("duplicates"),
+        "seconds": round(elapsed, 3),
+        "articles_per_sec": round(summary["num_success_audio"] / elapsed, 3) if elapsed else None,
+        "stages": timer.summary(),
+        "services": {name: svc.stats() for name, svc in services.items()},
+        "objects_uploaded": len(fakes["bucket"].objects),
+        "rows_in_db": len(fakes["db"].rows),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "config": {k: getattr(Config, k) for k in (
+            "SSML_WORKERS", "TTS_WORKERS", "HLS_WORKERS", "UPLOAD_WORKERS", "MAX_IN_FLIGHT",
+            "GEMINI_BATCH_SIZE", "HLS_SEGMENTER", "HLS_STREAMING", "AUDIO_IN_MEMORY", "TTS_CHUNKED",
+            "DEDUP_ENABLED",
+        )},
+    }
+
+
+def print_report(report: dict):
+    print("\n📊 Benchmark")
+    print(f"  mode: {report['mode']}   articles: {report['articles']}   "
+          f"succeeded: {report['succeeded']}   failed: {report['failed']}")
+    print(f"  {report['seconds']}s  ->  {report['articles_per_sec']} articles/sec   "
+          f"peak RSS {report['peak_rss_mb']} MB")
+    print(f"  {'stage':<8}{'calls':>7}{'p50 s':>9}{'p95 s':>9}{'p99 s':>9}")
+    for stage, s in report["stages"].items():
+        print(f"  {stage:<8}{s['calls']:>7}{s['p50']:>9}{s['p95']:>9}{s['p99']:>9}")
+    for name, s in report["services"].items():
+        print(f"  {name:<8} calls {s['calls']}, errors {s['errors']}, throttled {s['throttled']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline against local fake services.")
+    parser.add_argument("--articles", type=int, default=100, help="Synthetic articles to generate")
+    parser.add_argument("--csv", default=None, help="Use this CSV instead of synthetic articles")
+    parser.add_argument("--duplicate-rate", type=float, default=0.0,
+                        help="Share of synthetic articles that repeat an earlier story")
+    parser.add_argument("--mode", choices=("threaded", "async"), default="threaded")
+    parser.add_argument("--latency", action="append", default=[], metavar="SERVICE=SECONDS",
+                        help="Mean latency per call (gemini, azure, b2, db)")
+    parser.add_argument("--error-rate", action="append", default=[], metavar="SERVICE=P",
+                        help="Share of calls that fail")
+    parser.add_argument("--throttle", action="append", default=[], metavar="SERVICE=N",
+                        help="Answer 429 above N concurrent calls")
+    parser.add_argument("--rpm", action="append", default=[], metavar="SERVICE=N",
+                        help="Answer 429 above N calls per minute")
+    parser.add_argument("--set", action="append", default=[], metavar="KEY=VALUE",
+                        help="Override a pipeline Config setting, e.g. --set TTS_WORKERS=8")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", default=None, help="Also write the report to this file")
+    parser.add_argument("--trace", default=None, help="Write a Chrome-trace/Perfetto JSON timeline")
+    parser.add_argument("--profile", default=None, help="Write sampled folded stacks of the run")
+    args = parser.parse_args()
+
+    setup_logging()
+    report = run(args)
+    print_report(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"📝 Report written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+# pipeline/artifacts.py
+import json
+import os
+import queue
+import threading
+import traceback
+from datetime import datetime, timezone
+
+from pipeline.config import Config
+from pipeline.log import get_logger
+
+# Opt-in debug artifacts per article:
+# ARTIFACTS_DIR/<key[:16]>/ssml.xml + article.json (+ errors). Only failed and
+# sampled articles are written, by one background thread after the article
+# finishes, so the stage workers never wait on this disk I/O.
+
+log = get_logger(__name__)
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def enabled() -> bool:
+    return bool(Config.ARTIFACTS_DIR)
+
+
+def sampled(key: str, rate: float = None) -> bool:
+    """Stable per-article sampling: the same article is in or out on every run."""
+    rate = Config.ARTIFACTS_SAMPLE_RATE if rate is None else rate
+    if rate <= 0:
+        return False
+    return int(key[:8], 16) / 0xFFFFFFFF < rate
+
+
+def error_context(stage: str, attempt: int, error: BaseException) -> dict:
+    """One failed attempt, for job["errors"]; the traceback only when artifacts are captured."""
+    context = {"stage": stage, "attempt": attempt, "error": f"{type(error).__name__}: {error}"}
+    if enabled():
+        context["traceback"] = "".join(traceback.format_exception(type(error), error, error.__traceback__))
+    return context
+
+
+def _artifact_files(job: dict) -> dict:
+    row = job.get("article_row", {})
+    info = {
+        "key": job.get("key"),
+        "title": row.get("title"),
+        "news_source": row.get("news_source"),
+        "success": job.get("success"),
+        "failed_stage": job.get("failed_stage"),
+        "error": job.get("error"),
+        "attempts": job.get("attempts"),
+        "errors": job.get("errors", []),
+        "completed_stages": job.get("completed_stages"),
+        "hls_prefix": job.get("hls_prefix"),
+        "audio": job.get("audio"),
+        "duplicate_of": job.get("duplicate_of"),
+        "captured_at": datetime.now(timezone.utc).isoformat(),
+    }
+    files = {"article.json": json.dumps(info, indent=2, default=str)}
+    if job.get("ssml"):
+        files["ssml.xml"] = job["ssml"]
+    return files
+
+
+class _ArtifactWriter:
+    def __init__(self, root: str):
+        self.root = root
+        self._queue = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._loop, name="artifact-writer", daemon=True)
+        self._thread.start()
+
+    def put(self, key: str, files: dict):
+        self._queue.put((key, files))
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+
+    def _loop(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            key, files = item
+            folder = os.path.join(self.root, key[:16])
+            try:
+                os.makedirs(folder, exist_ok=True)
+                for name, text in files.items():
+                    with open(os.path.join(folder, name), "w", encoding="utf-8") as f:
+                        f.write(text)
+            except OSError as e:
+                log.warning("⚠️ Could not write artifacts to %s: %s", folder, e)
+
+
+def capture(job: dict):
+    """Queue a finished job's artifacts if it failed or is sampled (no-op without ARTIFACTS_DIR)."""
+    global _writer
+    key = job.get("key")
+    if not enabled() or not key:
+        return
+    if job.get("success") and not sampled(key):
+        return
+    # Snapshot now: cleanup and the DB writer keep using the job dict
+    files = _artifact_files(job)
+    with _writer_lock:
+        if _writer is None:
+            _writer = _ArtifactWriter(Config.ARTIFACTS_DIR)
+        writer = _writer
+    writer.put(key, files)
+
+
+def flush():
+    """Wait until every queued artifact is on disk (end of run)."""
+    global _writer
+    with _writer_lock:
+        writer, _writer = _writer, None
+    if writer is not None:
+        writer.close()
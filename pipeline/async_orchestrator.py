@@ -0,0 +1,316 @@
+# pipeline/async_orchestrator.py
+import asyncio
+import functools
+import shutil
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from pipeline.config import Config
+from pipeline.retry import backoff_delay, get_breaker
+from pipeline.log import get_logger
+from pipeline.worker import stage_generate_ssml, stage_synthesize, stage_stream_to_hls, native_hls_files, cleanup_job
+from pipeline.b2_uploader import (
+    check_audio_file,
+    ffmpeg_hls_command,
+    hls_tmp_root,
+    list_hls_files,
+    read_hls_files,
+    upload_file,
+    upload_bytes,
+)
+from pipeline.db_pusher import BufferedArticleWriter
+from pipeline.orchestrator import (
+    iter_csv_records,
+    iter_job_batches,
+    open_journal,
+    journal_db_callback,
+    journal_fields,
+    success_record,
+    failure_record,
+    record_outcome,
+)
+from pipeline.journal import RESUMABLE_STAGES
+from pipeline.ssml_lint import violation_totals
+from pipeline.dedup import open_deduplicator
+from pipeline import artifacts, metrics, tracing
+
+log = get_logger(__name__)
+
+# Same stage order as the threaded engine; service name picks breaker + executor
+STAGES = (
+    ("ssml", "gemini"),
+    ("tts", "azure"),
+    ("hls", None),
+    ("upload", "b2"),
+)
+# HLS_STREAMING: synthesis, segmenting and upload happen in one stage
+STREAMING_STAGES = (
+    ("ssml", "gemini"),
+    ("upload", "azure"),
+)
+
+
+async def _run_ffmpeg_async(argv: list, input_bytes: bytes = None):
+    try:
+        proc = await asyncio.create_subprocess_exec(
+            *argv,
+            stdin=asyncio.subprocess.PIPE if input_bytes is not None else asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.PIPE,
+        )
+    except FileNotFoundError:
+        log.error("❌ FFmpeg Error: 'ffmpeg' command not found.")
+        raise
+    _, stderr = await proc.communicate(input=input_bytes)
+    if proc.returncode != 0:
+        log.error("❌ FFmpeg Error:\n%s", stderr.decode(errors="replace"))
+        raise RuntimeError("FFmpeg conversion failed.")
+
+
+async def convert_to_hls_async(local_mp3_path: str) -> str:
+    """convert_to_hls, but FFmpeg runs as an asyncio subprocess."""
+    check_audio_file(local_mp3_path)
+    out_dir = tempfile.mkdtemp(prefix="hls_")
+    try:
+        await _run_ffmpeg_async(ffmpeg_hls_command(local_mp3_path, out_dir))
+    except Exception:
+        shutil.rmtree(out_dir, ignore_errors=True)
+        raise
+    return out_dir
+
+
+async def convert_bytes_to_hls_async(mp3_bytes: bytes) -> list:
+    """convert_bytes_to_hls (stdin in, tmpfs scratch dir) as an asyncio subprocess."""
+    with tempfile.TemporaryDirectory(prefix="hls_", dir=hls_tmp_root()) as out_dir:
+        await _run_ffmpeg_async(ffmpeg_hls_command("pipe:0", out_dir, input_format="mp3"), input_bytes=mp3_bytes)
+        return read_hls_files(out_dir)
+
+
+class AsyncPipelineRunner:
+    """
+    Runs every article as a coroutine on one event loop. Blocking SDK calls
+    (Gemini, Azure, B2) go to a dedicated thread pool per service, sized to that
+    service's concurrency limit, FFmpeg runs as an asyncio subprocess, and retry
+    backoff is an asyncio.sleep, so thousands of articles can wait cheaply.
+    """
+
+    def __init__(self, journal=None):
+        self.journal = journal
+        self.executors = {
+            "gemini": ThreadPoolExecutor(Config.GEMINI_CONCURRENCY, thread_name_prefix="gemini"),
+            "azure": ThreadPoolExecutor(Config.AZURE_CONCURRENCY, thread_name_prefix="azure"),
+            "b2": ThreadPoolExecutor(Config.B2_CONCURRENCY, thread_name_prefix="b2"),
+            # journal fsyncs and other small disk writes
+            "io": ThreadPoolExecutor(2, thread_name_prefix="async-io"),
+        }
+        self.hls_slots = asyncio.Semaphore(Config.HLS_WORKERS)
+
+    def shutdown(self):
+        for ex in self.executors.values():
+            ex.shutdown(wait=True)
+
+    async def _blocking(self, service, fn, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executors[service], fn, *args)
+
+    # --- stages ---
+
+    async def _stage_hls(self, job):
+        if Config.HLS_SEGMENTER == "native":
+            # No subprocess; just frame slicing, kept off the loop thread
+            job["hls_files"] = await self._blocking("io", native_hls_files, job)
+            return
+        async with self.hls_slots:
+            if job.get("audio_bytes") is not None:
+                job["hls_files"] = await convert_bytes_to_hls_async(job["audio_bytes"])
+                return
+            hls_dir = job.pop("hls_dir", None)
+            if hls_dir:
+                shutil.rmtree(hls_dir, ignore_errors=True)
+            job["hls_dir"] = await convert_to_hls_async(job["audio_path"])
+
+    async def _stage_upload(self, job):
+        prefix = job["hls_prefix"]
+        if job.get("hls_files") is not None:
+            segments = [f for f in job["hls_files"] if not f[0].endswith(".m3u8")]
+            playlists = [f for f in job["hls_files"] if f[0].endswith(".m3u8")]
+
+            async def _upload(item):
+                return await self._blocking("b2", upload_bytes, item[1], f"{prefix}/{item[0]}")
+        else:
+            segments, playlists = list_hls_files(job["hls_dir"])
+
+            async def _upload(path):
+                return await self._blocking("b2", upload_file, str(path), f"{prefix}/{path.name}")
+
+        uploaded = list(await asyncio.gather(*(_upload(p) for p in segments)))
+        # Playlist last, only once every segment is in place
+        for playlist in playlists:
+            uploaded.append(await _upload(playlist))
+
+        job["audio"] = {
+            "original_local_path": job.get("audio_path"),
+            "hls_prefix": prefix,
+            "hls_playlist_object": f"{prefix}/index.m3u8",
+            "segment_count": len(uploaded),
+        }
+
+    async def _run_stage(self, name, job):
+        if name == "ssml":
+            await self._blocking("gemini", stage_generate_ssml, job)
+        elif name == "tts":
+            await self._blocking("azure", stage_synthesize, job)
+        elif name == "hls":
+            await self._stage_hls(job)
+        elif name == "upload" and Config.HLS_STREAMING:
+            await self._blocking("azure", stage_stream_to_hls, job)
+        elif name == "upload":
+            await self._stage_upload(job)
+
+    async def _timed_stage(self, name, job):
+        metrics.STAGE_ACTIVE.inc(stage=name)
+        started = time.perf_counter()
+        try:
+            with tracing.span(name, "stage", key=job["key"], thread=False, attempt=job["attempts"][name]):
+                await self._run_stage(name, job)
+        finally:
+            metrics.STAGE_ACTIVE.dec(stage=name)
+            metrics.STAGE_SECONDS.observe(time.perf_counter() - started, stage=name)
+
+    # --- per article ---
+
+    async def process(self, job: dict) -> dict:
+        title = job.get("article_row", {}).get("title", "untitled")
+        completed = job.setdefault("completed_stages", [])
+        attempts = job.setdefault("attempts", {})
+        try:
+            for name, service in (STREAMING_STAGES if Config.HLS_STREAMING else STAGES):
+                if name in completed:
+                    continue
+                breaker = get_breaker(service) if service else None
+                while True:
+                    if breaker is not None and not breaker.allow():
+                        with tracing.span(f"circuit open {name}", "backoff", key=job["key"], thread=False):
+                            await asyncio.sleep(breaker.retry_after())
+                        continue
+                    attempt = attempts.get(name, 0) + 1
+                    attempts[name] = attempt
+                    try:
+                        await self._timed_stage(name, job)
+                    except Exception as e:
+                        if breaker is not None:
+                            breaker.record_failure()
+                        metrics.STAGE_ERRORS.inc(stage=name, cause=metrics.error_cause(e))
+                        job.setdefault("errors", []).append(artifacts.error_context(name, attempt, e))
+                        log.warning("[%s %d/%d] Error processing article '%s': %s",
+                                    name, attempt, Config.MAX_RETRIES, title, e)
+                        log.debug("Traceback for '%s' at stage '%s'", title, name, exc_info=True)
+                        if attempt >= Config.MAX_RETRIES:
+                            log.error("Max retries reached at stage '%s' for article '%s'. Skipping.", name, title)
+                            job["success"] = False
+                            job["failed_stage"] = name
+                            job["error"] = str(e)
+                            return job
+                        metrics.STAGE_RETRIES.inc(stage=name)
+                        with tracing.span(f"backoff {name}", "backoff", key=job["key"], thread=False,
+                                          attempt=attempt):
+                            await asyncio.sleep(backoff_delay(attempt))
+                        continue
+                    if breaker is not None:
+                        breaker.record_success()
+                    break
+
+                completed.append(name)
+                if self.journal is not None and name in RESUMABLE_STAGES:
+                    record = functools.partial(self.journal.record, job["key"], name, **journal_fields(job, name))
+                    await self._blocking("io", record)
+            job["success"] = True
+            return job
+        finally:
+            cleanup_job(job)
+
+
+async def run_pipeline_from_csv_async(csv_path: str, chunk_size: int = 50, resume: bool = False,
+                                      journal_path: str = None):
+    """
+    Asyncio counterpart of orchestrator.run_pipeline_from_csv; same input,
+    journal, DB flushing and summary. Up to ASYNC_MAX_IN_FLIGHT articles are in
+    flight at once, bounded in practice by the per-service limits.
+
+    Every article gets its own Gemini request here: GEMINI_BATCH_SIZE only
+    applies to the threaded engine.
+    """
+    if Config.GEMINI_BATCH_SIZE > 1:
+        log.warning("⚠️ GEMINI_BATCH_SIZE=%d is ignored in asyncio mode; SSML is generated one article per request.",
+                    Config.GEMINI_BATCH_SIZE)
+    loop = asyncio.get_running_loop()
+    failures = []
+    num_success = 0
+    counter = {"fed": 0, "already_done": 0, "already_in_db": 0}
+    in_flight = asyncio.Semaphore(Config.ASYNC_MAX_IN_FLIGHT)
+
+    exporter = metrics.MetricsExporter().start()
+    journal, resume_state = open_journal(journal_path, resume)
+    deduper = open_deduplicator()
+    writer = BufferedArticleWriter(on_flushed=journal_db_callback(journal))
+    runner = AsyncPipelineRunner(journal=journal)
+    tasks = set()
+
+    async def _one(job):
+        nonlocal num_success
+        try:
+            job = await runner.process(job)
+            followers = deduper.settle(job) if deduper is not None else []
+            for finished in [job] + followers:
+                record_outcome(finished)
+                if finished.get("success"):
+                    writer.add(success_record(finished))
+                    num_success += 1
+                else:
+                    failures.append(failure_record(finished))
+        finally:
+            in_flight.release()
+            metrics.IN_FLIGHT.dec()
+
+    try:
+        batches = iter_job_batches(iter_csv_records(csv_path, chunk_size), resume_state, counter,
+                                   chunk_size, deduper)
+        while True:
+            # pandas reads (and dedup routes) the next chunk off the loop thread
+            batch = await loop.run_in_executor(runner.executors["io"], next, batches, None)
+            if batch is None:
+                break
+            for job in batch:
+                await in_flight.acquire()
+                metrics.IN_FLIGHT.inc()
+                task = asyncio.create_task(_one(job))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        if tasks:
+            await asyncio.gather(*tasks)
+    finally:
+        await loop.run_in_executor(None, writer.close)
+        journal.close()
+        artifacts.flush()
+        runner.shutdown()
+        exporter.stop()
+
+    failures.extend(writer.failures)
+    return {
+        "num_total": counter["fed"],
+        "num_already_done": counter["already_done"],
+        "num_already_in_db": counter["already_in_db"],
+        "num_success_audio": num_success,
+        "num_failures": len(failures),
+        "failures": failures,
+        "ssml_repairs": violation_totals(),
+        "duplicates": deduper.stats() if deduper is not None else None,
+        "metrics": metrics.REGISTRY.snapshot(),
+        "inserted_article_ids": writer.inserted_ids
+    }
+
+
+def run_pipeline_from_csv_async_mode(csv_path: str, **kwargs):
+    """Blocking wrapper for callers without an event loop (e.g. run_pipeline.py --async)."""
+    return asyncio.run(run_pipeline_from_csv_async(csv_path, **kwargs))
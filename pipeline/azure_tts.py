@@ -1,11 +1,62 @@
-from dotenv import load_dotenv
-load_dotenv()
 # pipeline/azure_tts.py
 import os
 import uuid
 import pathlib
+import queue
+import re
+import threading
+import time
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
 from pipeline.config import Config
-import azure.cognitiveservices.speech as speechsdk
+from pipeline.cache import DiskCache, content_hash
+from pipeline.rate_limit import get_limiter
+from pipeline.hls_segmenter import audio_frames
+from pipeline import metrics
+from pipeline.log import get_logger
+
+log = get_logger(__name__)
+
+# The Speech SDK loads a native library; it is imported on the first synthesis
+# so that importing the pipeline (CLI checks, dry runs) stays cheap
+speechsdk = None
+
+# Azure output format used for every synthesis; part of the audio cache key
+OUTPUT_FORMAT = "Audio48Khz192KBitRateMonoMp3"
+
+_audio_cache = None
+_audio_cache_lock = threading.Lock()
+
+
+def get_audio_cache():
+    """Process-wide LRU cache of synthesized MP3s, or None when AUDIO_CACHE_ENABLED is off."""
+    global _audio_cache
+    if not Config.AUDIO_CACHE_ENABLED:
+        return None
+    with _audio_cache_lock:
+        if _audio_cache is None:
+            _audio_cache = DiskCache(
+                Config.AUDIO_CACHE_DIR,
+                max_bytes=Config.AUDIO_CACHE_MAX_MB * 1024 * 1024,
+                max_age_seconds=0,
+                suffix=".mp3",
+                touch_on_hit=True,
+                # the HLS stage may still be reading a freshly used file
+                evict_grace_seconds=600,
+            )
+        return _audio_cache
+
+
+def _speechsdk():
+    global speechsdk
+    if speechsdk is None:
+        import azure.cognitiveservices.speech as sdk
+        speechsdk = sdk
+    return speechsdk
+
+
+def audio_cache_key(ssml: str, output_format: str = OUTPUT_FORMAT) -> str:
+    return content_hash(ssml, output_format)
 
 # def synthesize_ssml_to_file(ssml: str, out_path: str):
 #     key = Config.AZURE_SPEECH_KEY
@@ -30,27 +81,260 @@ def synthesize_ssml_to_file(ssml: str, out_path: str):
     region = Config.AZURE_SPEECH_REGION
     if not key or not region:
         raise RuntimeError("Azure TTS credentials missing in environment.")
-    
-    # 🧠 DEBUG: Print or save SSML to inspect
-    print("\n🗣 [DEBUG] Generated SSML snippet:")
-    print(ssml[:500])  # first 500 chars (to avoid full dump)
-    print("-" * 60)
+    # Full SSML of failed (or sampled) articles is kept by pipeline.artifacts
+    log.debug("🗣 Synthesizing %d chars of SSML to %s", len(ssml), out_path)
 
-    # Optionally save to a temp file for manual inspection
-    with open("debug_ssml_preview.xml", "w", encoding="utf-8") as f:
-        f.write(ssml)
+    chunks = split_ssml(ssml) if Config.TTS_CHUNKED else [ssml]
+    if len(chunks) > 1:
+        with open(out_path, "wb") as f:
+            f.write(synthesize_chunks(chunks))
+        return out_path
 
+    speechsdk = _speechsdk()
     speech_config = speechsdk.SpeechConfig(subscription=key, region=region)
     speech_config.set_speech_synthesis_output_format(
-        speechsdk.SpeechSynthesisOutputFormat.Audio48Khz192KBitRateMonoMp3
+        getattr(speechsdk.SpeechSynthesisOutputFormat, OUTPUT_FORMAT)
     )
     audio_config = speechsdk.audio.AudioConfig(filename=out_path)
     synthesizer = speechsdk.SpeechSynthesizer(speech_config=speech_config, audio_config=audio_config)
-    result = synthesizer.speak_ssml_async(ssml).get()
+    with get_limiter("azure"):
+        result = synthesizer.speak_ssml_async(ssml).get()
+        _raise_for_result(result)
+    metrics.TTS_BYTES.inc(os.path.getsize(out_path))
+    return out_path
 
-    if result.reason == speechsdk.ResultReason.SynthesizingAudioCompleted:
-        return out_path
-    else:
+
+def synthesize_ssml_to_bytes(ssml: str) -> bytes:
+    """
+    Synthesize SSML into memory (no AudioConfig file) and return the MP3 bytes.
+
+    The audio cache is still consulted and filled when enabled, so re-runs skip
+    Azure; set AUDIO_CACHE_ENABLED=false for a path that never touches disk.
+    """
+    cache = get_audio_cache()
+    key = audio_cache_key(ssml)
+    if cache is not None:
+        hit = cache.get_bytes(key)
+        if hit:
+            log.debug("♻️ Audio cache hit (%s)", key[:12])
+            return hit
+
+    chunks = split_ssml(ssml) if Config.TTS_CHUNKED else [ssml]
+    audio = synthesize_chunks(chunks) if len(chunks) > 1 else _speak_to_bytes(ssml)
+    if cache is not None:
+        cache.set_bytes(key, audio)
+    return audio
+
+
+def _speak_to_bytes(ssml: str) -> bytes:
+    """One Azure request, audio returned in memory."""
+    key_id = Config.AZURE_SPEECH_KEY
+    region = Config.AZURE_SPEECH_REGION
+    if not key_id or not region:
+        raise RuntimeError("Azure TTS credentials missing in environment.")
+
+    speechsdk = _speechsdk()
+    speech_config = speechsdk.SpeechConfig(subscription=key_id, region=region)
+    speech_config.set_speech_synthesis_output_format(
+        getattr(speechsdk.SpeechSynthesisOutputFormat, OUTPUT_FORMAT)
+    )
+    # audio_config=None keeps the audio in result.audio_data instead of a file/speaker
+    synthesizer = speechsdk.SpeechSynthesizer(speech_config=speech_config, audio_config=None)
+    with get_limiter("azure"):
+        result = synthesizer.speak_ssml_async(ssml).get()
+        _raise_for_result(result)
+    audio = bytes(result.audio_data)
+    metrics.TTS_BYTES.inc(len(audio))
+    return audio
+
+
+# --- Chunked synthesis ---
+
+_SPEAK_OPEN = re.compile(r"^\s*(?:<\?xml[^>]*\?>\s*)?(<speak\b[^>]*>)", re.DOTALL)
+_VOICE_TURN = re.compile(r"<voice\b.*?</voice>", re.DOTALL)
+
+
+def split_ssml(ssml: str, max_chars: int = None) -> list:
+    """
+    Split a two-voice script at <voice> turn boundaries into standalone
+    <speak> documents of up to max_chars each (a longer single turn becomes
+    its own document). Anything that is not a plain sequence of <voice>
+    elements under <speak> is returned unsplit, as [ssml].
+    """
+    max_chars = max_chars or Config.TTS_CHUNK_MAX_CHARS
+    if len(ssml) <= max_chars:
+        return [ssml]
+    m = _SPEAK_OPEN.match(ssml)
+    end = ssml.rfind("</speak>")
+    if not m or end == -1:
+        return [ssml]
+    speak_open, body = m.group(1), ssml[m.end():end]
+
+    turns = _VOICE_TURN.findall(body)
+    # Only split when the voices are the whole body (no stray <break> etc. between turns)
+    if len(turns) < 2 or _VOICE_TURN.sub("", body).strip():
+        return [ssml]
+
+    chunks, current = [], ""
+    overhead = len(speak_open) + len("</speak>")
+    for turn in turns:
+        if current and overhead + len(current) + len(turn) > max_chars:
+            chunks.append(current)
+            current = ""
+        current += turn
+    chunks.append(current)
+
+    documents = [f"{speak_open}{chunk}</speak>" for chunk in chunks]
+    try:
+        for doc in documents:
+            ET.fromstring(doc)
+    except ET.ParseError:
+        return [ssml]
+    return documents
+
+
+def _synthesize_chunk(index: int, total: int, ssml: str) -> bytes:
+    """
+    One chunk, no retries of its own: a failure goes to the TTS stage, whose
+    retry is scheduled without holding the worker. Finished chunks are kept in
+    the audio cache (when enabled), so that retry only redoes the failed ones.
+    """
+    cache = get_audio_cache()
+    key = audio_cache_key(ssml)
+    if cache is not None:
+        hit = cache.get_bytes(key)
+        if hit:
+            return hit
+    try:
+        audio = _speak_to_bytes(ssml)
+    except Exception as e:
+        raise RuntimeError(f"TTS chunk {index + 1}/{total} failed: {e}") from e
+    if cache is not None:
+        cache.set_bytes(key, audio)
+    return audio
+
+
+def synthesize_chunks(chunks: list, parallelism: int = None) -> bytes:
+    """
+    Synthesize SSML sub-documents in parallel and join the MP3s in order.
+    The join is at frame level: each chunk's ID3 tag and Xing/Info header are
+    dropped so the result plays as one continuous stream with correct duration.
+    """
+    parallelism = min(parallelism or Config.TTS_CHUNK_PARALLELISM, len(chunks))
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=parallelism, thread_name_prefix="tts-chunk") as pool:
+        parts = list(pool.map(
+            lambda item: _synthesize_chunk(item[0], len(chunks), item[1]),
+            enumerate(chunks),
+        ))
+    log.debug("🧩 Synthesized %d SSML chunks in parallel in %.1fs", len(chunks), time.monotonic() - started)
+    return b"".join(audio_frames(part) for part in parts)
+
+
+def stream_ssml_audio(ssml: str):
+    """
+    Generator yielding MP3 chunks while Azure is still synthesizing (the
+    synthesizer's `synthesizing` events), so playback can start long before the
+    whole article is rendered. Raises after the last chunk if synthesis failed,
+    or when Azure sends nothing for HLS_STREAM_CHUNK_TIMEOUT seconds.
+    A cache hit is yielded as a single chunk; a completed stream fills the cache.
+
+    Close the generator when giving up on it early: that stops the synthesis.
+    """
+    cache = get_audio_cache()
+    key = audio_cache_key(ssml)
+    if cache is not None:
+        hit = cache.get_bytes(key)
+        if hit:
+            log.debug("♻️ Audio cache hit (%s)", key[:12])
+            yield hit
+            return
+
+    key_id = Config.AZURE_SPEECH_KEY
+    region = Config.AZURE_SPEECH_REGION
+    if not key_id or not region:
+        raise RuntimeError("Azure TTS credentials missing in environment.")
+
+    speechsdk = _speechsdk()
+    speech_config = speechsdk.SpeechConfig(subscription=key_id, region=region)
+    speech_config.set_speech_synthesis_output_format(
+        getattr(speechsdk.SpeechSynthesisOutputFormat, OUTPUT_FORMAT)
+    )
+    synthesizer = speechsdk.SpeechSynthesizer(speech_config=speech_config, audio_config=None)
+
+    # The azure slot covers Azure rendering the audio, not the consumer working
+    # through it, so the completion callbacks give it back
+    limiter = get_limiter("azure")
+    slot = {}
+    slot_lock = threading.Lock()
+
+    def release_slot(error=None):
+        with slot_lock:
+            started = slot.pop("started", None)
+        if started is not None:
+            limiter.end(started, error)
+
+    def on_completed(evt):
+        release_slot()
+        chunks.put(None)
+
+    def on_canceled(evt):
+        error = None
+        try:
+            _raise_for_result(evt.result)
+        except Exception as e:
+            error = e
+        release_slot(error)
+        chunks.put(None)
+
+    # SDK callbacks run on its own threads; None marks the end of the stream
+    chunks = queue.Queue()
+    synthesizer.synthesizing.connect(lambda evt: chunks.put(bytes(evt.result.audio_data)))
+    synthesizer.synthesis_completed.connect(on_completed)
+    synthesizer.synthesis_canceled.connect(on_canceled)
+
+    audio = bytearray()
+    finished = False
+    error = None
+    slot["started"] = limiter.begin()
+    try:
+        future = synthesizer.speak_ssml_async(ssml)
+        while True:
+            try:
+                chunk = chunks.get(timeout=Config.HLS_STREAM_CHUNK_TIMEOUT)
+            except queue.Empty:
+                raise RuntimeError(
+                    f"Azure streaming synthesis sent no audio for {Config.HLS_STREAM_CHUNK_TIMEOUT:g}s."
+                )
+            if chunk is None:
+                break
+            if chunk:
+                audio += chunk
+                metrics.TTS_BYTES.inc(len(chunk))
+                yield chunk
+        _raise_for_result(future.get())
+        finished = True
+    except Exception as e:
+        error = e
+        raise
+    finally:
+        if not finished:
+            # Timed out, failed, or the consumer closed us: stop rendering audio nobody reads
+            try:
+                synthesizer.stop_speaking_async()
+            except Exception as e:
+                log.debug("Stopping Azure synthesis failed: %s", e)
+        # No-op once a completion callback has given the slot back
+        release_slot(error)
+
+    if cache is not None:
+        cache.set_bytes(key, bytes(audio))
+
+
+def _raise_for_result(result):
+    """Raise RuntimeError with Azure's cancellation details unless synthesis completed."""
+    speechsdk = _speechsdk()
+    if result.reason != speechsdk.ResultReason.SynthesizingAudioCompleted:
         try:
             cancellation = speechsdk.SpeechSynthesisCancellationDetails(result)
             err = (
@@ -66,9 +350,28 @@ def synthesize_ssml_to_file(ssml: str, out_path: str):
 
 
 def synthesize_ssml_to_tempfile(ssml: str, prefix: str = "news_", ext: str = ".mp3"):
+    """
+    Synthesize SSML to a local MP3 and return its path.
+
+    With the audio cache enabled the file lives in the cache (named by the SSML
+    hash, so prefix is unused) and identical SSML never reaches Azure twice.
+    """
+    cache = get_audio_cache()
+    if cache is not None:
+        key = audio_cache_key(ssml)
+        hit = cache.lookup(key)
+        if hit is not None:
+            log.debug("♻️ Audio cache hit (%s)", key[:12])
+            return str(hit)
+        tmp_path = cache.temp_path(key)
+        try:
+            synthesize_ssml_to_file(ssml, str(tmp_path))
+        except Exception:
+            cache.discard(tmp_path)
+            raise
+        return str(cache.commit(tmp_path, key))
+
     pathlib.Path(Config.OUTPUT_AUDIO_DIR).mkdir(parents=True, exist_ok=True)
     filename = f"{prefix}{uuid.uuid4().hex}{ext}"
     out_path = str(pathlib.Path(Config.OUTPUT_AUDIO_DIR) / filename)
     return synthesize_ssml_to_file(ssml, out_path)
-
-print("Azure TTS module loaded.")
\ No newline at end of file
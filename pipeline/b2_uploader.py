@@ -1,6 +1,8 @@
 # # pipeline/b2_uploader.py
 # import b2sdk.v2 as b2
 # from pipeline.config import Config
+from pipeline.rate_limit import get_limiter
+from pipeline import metrics, tracing
 # import os
 
 # def authorize_b2():
@@ -25,11 +27,20 @@
 
 # pipeline/b2_uploader.py
 import os
-import b2sdk.v2 as b2
+import shutil
+import sys
+import threading
+import time
+import uuid
 import subprocess  # Added for running FFmpeg
 import tempfile  # Added for creating a temp directory
 import pathlib  # Added for easier file path handling
+from concurrent.futures import ThreadPoolExecutor
 from pipeline.config import Config
+from pipeline.hls_segmenter import render_playlist
+from pipeline.log import get_logger
+
+log = get_logger(__name__)
 
 
 # --- Your Existing Functions (Unchanged) ---
@@ -38,18 +49,126 @@ def authorize_b2():
     """Authorize and return a B2 API client."""
     if not Config.B2_KEY_ID or not Config.B2_APP_KEY:
         raise RuntimeError("B2 credentials missing.")
+    # b2sdk is only imported once a run actually talks to B2
+    import b2sdk.v2 as b2
     info = b2.InMemoryAccountInfo()
     api = b2.B2Api(info)
     api.authorize_account("production", Config.B2_KEY_ID, Config.B2_APP_KEY)
     return api
 
 
+class LocalBucket:
+    """
+    Stand-in for a B2 bucket that writes objects under a local directory.
+    Used when B2_LOCAL_DIR is set (tests, offline runs).
+    """
+
+    class _FileVersion:
+        def __init__(self, file_name, id_):
+            self.file_name = file_name
+            self.id_ = id_
+
+    def __init__(self, root: str):
+        self.root = pathlib.Path(root)
+
+    def _target(self, file_name: str) -> pathlib.Path:
+        target = self.root / file_name
+        target.parent.mkdir(parents=True, exist_ok=True)
+        return target
+
+    def upload_local_file(self, local_file, file_name, content_type=None, **kwargs):
+        shutil.copyfile(local_file, self._target(file_name))
+        return self._FileVersion(file_name, uuid.uuid4().hex)
+
+    def upload_bytes(self, data_bytes, file_name, content_type=None, **kwargs):
+        self._target(file_name).write_bytes(data_bytes)
+        return self._FileVersion(file_name, uuid.uuid4().hex)
+
+
+class B2Session:
+    """
+    Process-wide B2 client: authorizes once, caches the bucket and is safe to
+    share between upload threads. The authorization is refreshed after
+    B2_AUTH_TTL seconds, or straight away if B2 rejects the token.
+    """
+
+    def __init__(self, bucket=None):
+        self._lock = threading.Lock()
+        self._bucket = bucket
+        self._fixed_bucket = bucket is not None
+        self._authorized_at = 0.0
+
+    def set_bucket(self, bucket):
+        """Use a ready-made bucket (e.g. LocalBucket) instead of authorizing against B2."""
+        with self._lock:
+            self._bucket = bucket
+            self._fixed_bucket = bucket is not None
+
+    def reset(self):
+        """Forget the cached authorization so the next call re-authorizes."""
+        with self._lock:
+            if not self._fixed_bucket:
+                self._bucket = None
+
+    def bucket(self):
+        with self._lock:
+            if self._fixed_bucket:
+                return self._bucket
+            expired = time.monotonic() - self._authorized_at > Config.B2_AUTH_TTL
+            if self._bucket is None or expired:
+                if Config.B2_LOCAL_DIR:
+                    self._bucket = LocalBucket(Config.B2_LOCAL_DIR)
+                else:
+                    api = authorize_b2()
+                    self._bucket = api.get_bucket_by_name(Config.B2_BUCKET_NAME)
+                self._authorized_at = time.monotonic()
+            return self._bucket
+
+    def call(self, fn):
+        """Run fn(bucket), re-authorizing once if the token was rejected."""
+        try:
+            return fn(self.bucket())
+        except Exception as e:
+            if not _is_auth_error(e):
+                raise
+            log.warning("🔑 B2 token rejected, re-authorizing...")
+            self.reset()
+            return fn(self.bucket())
+
+
+def _is_auth_error(e: Exception) -> bool:
+    if "b2sdk" not in sys.modules:
+        # No B2 client was ever built (LocalBucket or a stand-in bucket)
+        return False
+    from b2sdk.v2.exception import InvalidAuthToken, Unauthorized
+    return isinstance(e, (InvalidAuthToken, Unauthorized))
+
+
+_session = B2Session()
+
+
+def get_b2_session() -> B2Session:
+    return _session
+
+
+def content_type_for(object_name: str) -> str:
+    # Determine content type based on file extension
+    ext = os.path.splitext(object_name)[1].lower()
+    if ext == ".aac":
+        return "audio/aac"
+    elif ext == ".m3u8":
+        return "application/vnd.apple.mpegurl"
+    elif ext == ".mp3":
+        return "audio/mpeg"
+    return "b2/x-auto"  # let B2 guess
+
+
 def check_audio_file(local_path: str):
     """Check if the Azure TTS audio file exists before upload."""
     if not os.path.exists(local_path):
         raise FileNotFoundError(f"⚠️ Audio file not found: {local_path}")
     size_kb = os.path.getsize(local_path) / 1024
-    print(f"🎧 Audio file ready: {local_path} ({size_kb:.2f} KB)")
+    log.debug("🎧 Audio file ready: %s (%.2f KB)", local_path, size_kb)
 
 
 def upload_file(local_path: str, object_name: str):
@@ -57,27 +176,38 @@ def upload_file(local_path: str, object_name: str):
     if not os.path.exists(local_path):
         raise FileNotFoundError(f"⚠️ Internal Error: File not found: {local_path}")
 
-    api = authorize_b2()
-    bucket = api.get_bucket_by_name(Config.B2_BUCKET_NAME)
+    content_type = content_type_for(object_name)
 
-    # Determine content type based on file extension
-    ext = os.path.splitext(object_name)[1].lower()
-    if ext == ".aac":
-        content_type = "audio/aac"
-    elif ext == ".m3u8":
-        content_type = "application/vnd.apple.mpegurl"
-    elif ext == ".mp3":
-        content_type = "audio/mpeg"
-    else:
-        content_type = "b2/x-auto"  # let B2 guess
+    with tracing.span(f"upload {os.path.basename(object_name)}", "b2", object=object_name), get_limiter("b2"):
+        res = get_b2_session().call(lambda bucket: bucket.upload_local_file(
+            local_file=local_path,
+            file_name=object_name,
+            content_type=content_type,   # <-- correct usage
+            # file_info={}  # optional if you want custom metadata
+        ))
+
+    metrics.UPLOAD_BYTES.inc(os.path.getsize(local_path))
+    return _upload_result(res, object_name)
+
+
+def upload_bytes(data: bytes, object_name: str):
+    """Upload an in-memory buffer (e.g. an HLS segment) to B2 without touching disk."""
+    content_type = content_type_for(object_name)
+
+    with tracing.span(f"upload {os.path.basename(object_name)}", "b2", object=object_name, bytes=len(data)), \
+            get_limiter("b2"):
+        res = get_b2_session().call(lambda bucket: bucket.upload_bytes(
+            data_bytes=data,
+            file_name=object_name,
+            content_type=content_type,
+        ))
 
-    res = bucket.upload_local_file(
-        local_file=local_path,
-        file_name=object_name,
-        content_type=content_type,   # <-- correct usage
-        # file_info={}  # optional if you want custom metadata
-    )
+    metrics.UPLOAD_BYTES.inc(len(data))
+    return _upload_result(res, object_name)
 
+
+def _upload_result(res, object_name: str) -> dict:
+    metrics.UPLOAD_OBJECTS.inc()
     file_id = getattr(res, "id_", None) or getattr(res, "file_id", None)
 
     return {
@@ -88,82 +218,309 @@ def upload_file(local_path: str, object_name: str):
 
 
 
-# --- New HLS Orchestrator Function ---
+# --- HLS Conversion / Upload ---
 
-def upload_as_hls(local_mp3_path: str, b2_object_prefix: str):
+def ffmpeg_hls_command(local_mp3_path: str, out_dir: str, input_format: str = None) -> list:
     """
-    Converts a local MP3 file to HLS and uploads all segments to B2.
+    FFmpeg argv that turns local_mp3_path into out_dir/index.m3u8 + seg_XXX.aac.
+    Pass "pipe:0" with input_format="mp3" to read the audio from stdin.
+    """
+    # Define HLS output files
+    playlist_path = os.path.join(out_dir, "index.m3u8")
+    segment_filename = os.path.join(out_dir, "seg_%03d.aac")
+
+    # -i: input file
+    # -vn: no video
+    # -acodec aac: convert audio to AAC (standard for HLS)
+    # -hls_time 4: create 4-second segments
+    # -hls_playlist_type vod: create a "Video on Demand" playlist (all segments listed)
+    # -hls_segment_filename: pattern for segment files
+    # index.m3u8: name of the master playlist
+    input_args = ["-f", input_format] if input_format else []
+    return [
+        "ffmpeg",
+        "-y",
+        *input_args,
+        "-i", local_mp3_path,
+        "-vn",
+        "-acodec", "aac",
+        "-hls_time", "4",
+        "-hls_playlist_type", "vod",
+        "-hls_segment_filename", segment_filename,
+        playlist_path
+    ]
+
+
+def convert_to_hls(local_mp3_path: str, out_dir: str = None) -> str:
+    """
+    Converts a local MP3 file to HLS segments + index.m3u8 with FFmpeg.
 
     Args:
         local_mp3_path (str): The path to the source MP3 file.
-        b2_object_prefix (str): The "folder" on B2 to upload to.
-                                  e.g., "audio/hls/article_123"
+        out_dir (str): Directory for the HLS files. A new temp dir is created if omitted;
+                       the caller owns it and must remove it.
+
+    Returns:
+        str: The directory holding index.m3u8 and the seg_XXX.aac files.
     """
-    print(f"\n--- Starting HLS Conversion for {local_mp3_path} ---")
+    log.debug("Starting HLS conversion for %s", local_mp3_path)
 
     # 1. Check if source MP3 exists
     check_audio_file(local_mp3_path)
 
-    # 2. Create a temporary directory to store HLS segments
-    with tempfile.TemporaryDirectory() as temp_dir:
-        print(f"Working in temporary directory: {temp_dir}")
-
-        # Define HLS output files
-        playlist_path = os.path.join(temp_dir, "index.m3u8")
-        segment_filename = os.path.join(temp_dir, "seg_%03d.aac")
-
-        # 3. Run FFmpeg command
-        # -i: input file
-        # -vn: no video
-        # -acodec aac: convert audio to AAC (standard for HLS)
-        # -hls_time 4: create 4-second segments
-        # -hls_playlist_type vod: create a "Video on Demand" playlist (all segments listed)
-        # -hls_segment_filename: pattern for segment files
-        # index.m3u8: name of the master playlist
-        ffmpeg_command = [
-            "ffmpeg",
-            "-i", local_mp3_path,
-            "-vn",
-            "-acodec", "aac",
-            "-hls_time", "4",
-            "-hls_playlist_type", "vod",
-            "-hls_segment_filename", segment_filename,
-            playlist_path
-        ]
+    # 2. Directory to store HLS segments
+    if out_dir is None:
+        out_dir = tempfile.mkdtemp(prefix="hls_")
+
+    # 3. Run FFmpeg command
+    try:
+        subprocess.run(ffmpeg_hls_command(local_mp3_path, out_dir), check=True, capture_output=True, text=True)
+        log.debug("✅ FFmpeg wrote HLS to %s", out_dir)
+    except subprocess.CalledProcessError as e:
+        log.error("❌ FFmpeg Error:\n%s", e.stderr)
+        raise RuntimeError("FFmpeg conversion failed.")
+    except FileNotFoundError:
+        log.error("❌ FFmpeg Error: 'ffmpeg' command not found. "
+                  "Please ensure FFmpeg is installed and in your system's PATH.")
+        raise
+
+    return out_dir
 
+
+def hls_tmp_root():
+    """Where in-memory mode lets FFmpeg write segments: HLS_TMP_DIR, else /dev/shm (tmpfs) if present."""
+    if Config.HLS_TMP_DIR:
+        return Config.HLS_TMP_DIR
+    return "/dev/shm" if os.path.isdir("/dev/shm") else None
+
+
+def convert_bytes_to_hls(mp3_bytes: bytes) -> list:
+    """
+    In-memory variant of convert_to_hls: the MP3 goes to FFmpeg on stdin, the
+    segments are written to a tmpfs scratch dir and read straight back.
+
+    Returns:
+        list: [(file name, bytes), ...] segments in playback order, playlist last.
+    """
+    with tempfile.TemporaryDirectory(prefix="hls_", dir=hls_tmp_root()) as out_dir:
         try:
-            print("🏃 Running FFmpeg...")
-            subprocess.run(ffmpeg_command, check=True, capture_output=True, text=True)
-            print("✅ FFmpeg conversion successful.")
+            subprocess.run(
+                ffmpeg_hls_command("pipe:0", out_dir, input_format="mp3"),
+                input=mp3_bytes, check=True, capture_output=True,
+            )
         except subprocess.CalledProcessError as e:
-            print(f"❌ FFmpeg Error:")
-            print(e.stderr)
+            log.error("❌ FFmpeg Error:\n%s", e.stderr.decode(errors="replace"))
             raise RuntimeError("FFmpeg conversion failed.")
         except FileNotFoundError:
-            print("❌ FFmpeg Error: 'ffmpeg' command not found.")
-            print("Please ensure FFmpeg is installed and in your system's PATH.")
+            log.error("❌ FFmpeg Error: 'ffmpeg' command not found. "
+                      "Please ensure FFmpeg is installed and in your system's PATH.")
             raise
+        return read_hls_files(out_dir)
 
-        # 4. Loop through generated files and upload them
-        print(f"🚀 Uploading HLS segments to B2 folder: {b2_object_prefix}/")
 
-        # Use pathlib to find all generated HLS files
-        temp_dir_path = pathlib.Path(temp_dir)
-        hls_files = [f for f in temp_dir_path.glob('*') if f.name.endswith('.m3u8') or f.name.endswith('.aac')]
+def read_hls_files(hls_dir: str) -> list:
+    """[(file name, bytes), ...] for every segment in order, then the playlist(s)."""
+    segments, playlists = list_hls_files(hls_dir)
+    return [(path.name, path.read_bytes()) for path in segments + playlists]
 
-        if not hls_files:
-            raise RuntimeError("HLS conversion produced no files.")
 
-        uploaded_files = []
-        for file_path in hls_files:
-            object_name = f"{b2_object_prefix}/{file_path.name}"
-            print(f"  > Uploading {file_path.name} to {object_name}...")
+def list_hls_files(hls_dir: str):
+    """(segments, playlists) in hls_dir, segments in playback order."""
+    hls_dir_path = pathlib.Path(hls_dir)
+    segments = sorted(f for f in hls_dir_path.glob('*.aac'))
+    playlists = sorted(f for f in hls_dir_path.glob('*.m3u8'))
+    if not segments or not playlists:
+        raise RuntimeError("HLS conversion produced no files.")
+    return segments, playlists
 
-            result = upload_file(
-                local_path=str(file_path),
-                object_name=object_name
-            )
-            uploaded_files.append(result)
 
-        print(f"--- ✅ Successfully uploaded {len(uploaded_files)} HLS files for {local_mp3_path} ---")
-        return uploaded_files
+def upload_hls_dir(hls_dir: str, b2_object_prefix: str, parallelism: int = None):
+    """
+    Uploads every .aac segment found in hls_dir to B2 in parallel, then the
+    index.m3u8 playlist last, so the playlist never points at missing segments.
+
+    Args:
+        hls_dir (str): Directory produced by convert_to_hls.
+        b2_object_prefix (str): The "folder" on B2 to upload to.
+                                  e.g., "audio/hls/article_123"
+        parallelism (int): Concurrent segment uploads (B2_UPLOAD_PARALLELISM).
+    """
+    log.debug("🚀 Uploading HLS segments to B2 folder: %s/", b2_object_prefix)
+
+    segments, playlists = list_hls_files(hls_dir)
+
+    def _upload(file_path):
+        return upload_file(
+            local_path=str(file_path),
+            object_name=f"{b2_object_prefix}/{file_path.name}"
+        )
+
+    parallelism = parallelism or Config.B2_UPLOAD_PARALLELISM
+    with ThreadPoolExecutor(max_workers=min(parallelism, len(segments))) as pool:
+        # list() re-raises the first failed upload
+        uploaded_files = list(pool.map(_upload, segments))
+
+    for playlist in playlists:
+        uploaded_files.append(_upload(playlist))
+
+    log.info("✅ Uploaded %d HLS files to %s/", len(uploaded_files), b2_object_prefix)
+    return uploaded_files
+
+
+def upload_hls_buffers(hls_files: list, b2_object_prefix: str, parallelism: int = None):
+    """
+    upload_hls_dir for in-memory HLS output ([(name, bytes), ...] from
+    convert_bytes_to_hls): segments in parallel, index.m3u8 last.
+    """
+    log.debug("🚀 Uploading HLS segments to B2 folder: %s/", b2_object_prefix)
+
+    segments = [f for f in hls_files if not f[0].endswith(".m3u8")]
+    playlists = [f for f in hls_files if f[0].endswith(".m3u8")]
+    if not segments or not playlists:
+        raise RuntimeError("HLS conversion produced no files.")
+
+    def _upload(item):
+        name, data = item
+        return upload_bytes(data, f"{b2_object_prefix}/{name}")
+
+    parallelism = parallelism or Config.B2_UPLOAD_PARALLELISM
+    with ThreadPoolExecutor(max_workers=min(parallelism, len(segments))) as pool:
+        # list() re-raises the first failed upload
+        uploaded_files = list(pool.map(_upload, segments))
+
+    for playlist in playlists:
+        uploaded_files.append(_upload(playlist))
+
+    log.info("✅ Uploaded %d HLS files to %s/", len(uploaded_files), b2_object_prefix)
+    return uploaded_files
+
+
+class HlsStreamPublisher:
+    """
+    Live publishing of one article's HLS while its audio is still being made.
+
+    add() uploads a segment in the background; as soon as a run of segments
+    from the start is uploaded, index.m3u8 is re-published as an EVENT
+    playlist listing them, so players can start on the first few seconds.
+    finish() waits for the remaining uploads and publishes the final playlist
+    with #EXT-X-ENDLIST.
+
+    Playlist uploads happen outside the lock, one at a time: whichever upload
+    thread finds nobody publishing keeps publishing the newest ready prefix
+    until it has caught up, so older playlists are skipped rather than waited
+    for. A failed publish is raised from finish(), like a failed segment.
+    """
+
+    def __init__(self, b2_object_prefix: str, parallelism: int = None, target_duration: float = None):
+        self.prefix = b2_object_prefix
+        self.target_duration = target_duration or Config.HLS_SEGMENT_SECONDS
+        self._pool = ThreadPoolExecutor(max_workers=parallelism or Config.B2_UPLOAD_PARALLELISM,
+                                        thread_name_prefix="hls-stream")
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)  # notified when a publisher stops
+        self._segments = []  # [(name, duration)] in playback order
+        self._futures = []
+        self._done = []  # upload finished, by segment index
+        self._ready = 0  # segments uploaded without a gap from the start
+        self._published = 0  # segments in the last EVENT playlist uploaded
+        self._publishing = False
+        self._closed = False
+        self._publish_error = None
+        self._started = time.monotonic()
+        self.first_segment_after = None  # seconds from start to first playlist
+
+    @property
+    def playlist_object(self) -> str:
+        return f"{self.prefix}/index.m3u8"
+
+    def add(self, name: str, data: bytes, duration: float):
+        with self._lock:
+            index = len(self._segments)
+            self._segments.append((name, duration))
+            self._done.append(False)
+        future = self._pool.submit(upload_bytes, data, f"{self.prefix}/{name}")
+        future.add_done_callback(lambda f, i=index: self._uploaded(i, f))
+        self._futures.append(future)
+
+    def _uploaded(self, index: int, future):
+        if future.exception() is not None:
+            return  # raised from finish()
+        with self._lock:
+            self._done[index] = True
+            while self._ready < len(self._done) and self._done[self._ready]:
+                self._ready += 1
+            if self._publishing or self._ready == self._published:
+                return
+            self._publishing = True
+        self._publish_pending()
+
+    def _publish_pending(self):
+        """Publish EVENT playlists until the newest ready prefix is live (one thread at a time)."""
+        while True:
+            with self._lock:
+                ready = self._ready
+                if self._closed or self._publish_error is not None or ready <= self._published:
+                    self._publishing = False
+                    self._idle.notify_all()
+                    return
+                segments = self._segments[:ready]
+            try:
+                self._publish(segments, ended=False)
+            except Exception as e:
+                log.warning("⚠️ Publishing the live playlist %s failed: %s", self.playlist_object, e)
+                with self._lock:
+                    self._publish_error = e
+                continue
+            with self._lock:
+                self._published = ready
+                if self.first_segment_after is None:
+                    self.first_segment_after = time.monotonic() - self._started
+                    log.debug("🎧 First HLS segment live after %.1fs: %s",
+                              self.first_segment_after, self.playlist_object)
+
+    def _publish(self, segments: list, ended: bool):
+        data = render_playlist(segments, playlist_type="EVENT", ended=ended,
+                               target_duration=self.target_duration)
+        upload_bytes(data, self.playlist_object)
+
+    def finish(self) -> list:
+        """Wait for every segment, publish the closed playlist; returns the upload results."""
+        try:
+            uploaded = [f.result() for f in self._futures]
+            if not uploaded:
+                raise RuntimeError("Streaming synthesis produced no HLS segments.")
+            with self._lock:
+                # No EVENT playlist may land after the closed one
+                self._closed = True
+                while self._publishing:
+                    self._idle.wait()
+                if self._publish_error is not None:
+                    raise RuntimeError(
+                        f"Publishing the live playlist failed: {self._publish_error}"
+                    ) from self._publish_error
+            self._publish(self._segments, ended=True)
+            self._published = len(self._segments)
+        finally:
+            self._pool.shutdown(wait=True)
+        uploaded.append({"object_name": self.playlist_object})
+        log.info("✅ Streamed %d HLS segments to %s/", len(self._segments), self.prefix)
+        return uploaded
+
+    def abort(self):
+        with self._lock:
+            self._closed = True
+        self._pool.shutdown(wait=True, cancel_futures=True)
+
+
+def upload_as_hls(local_mp3_path: str, b2_object_prefix: str):
+    """
+    Converts a local MP3 file to HLS and uploads all segments to B2.
+
+    Args:
+        local_mp3_path (str): The path to the source MP3 file.
+        b2_object_prefix (str): The "folder" on B2 to upload to.
+                                  e.g., "audio/hls/article_123"
+    """
+    with tempfile.TemporaryDirectory() as temp_dir:
+        convert_to_hls(local_mp3_path, out_dir=temp_dir)
+        return upload_hls_dir(temp_dir, b2_object_prefix)
@@ -0,0 +1,186 @@
+# pipeline/cache.py
+import hashlib
+import json
+import os
+import pathlib
+import threading
+import time
+import uuid
+
+
+def content_hash(*parts) -> str:
+    """Stable sha256 over any JSON-serialisable parts (order matters)."""
+    payload = json.dumps(parts, ensure_ascii=False, separators=(",", ":"), default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class DiskCache:
+    """
+    Content-addressed cache on local disk: one file per key, sharded by the
+    first two hex chars of the key (e.g. cache/ssml/ab/ab12....xml).
+
+    Entries older than max_age_seconds are treated as misses and removed.
+    When the total size goes over max_bytes the oldest entries are evicted
+    down to LOW_WATER * max_bytes, so the next scan is a while away.
+    With touch_on_hit, a hit refreshes the entry's mtime so eviction is LRU;
+    entries used within evict_grace_seconds are never evicted (another worker
+    may still be reading them).
+    Writes go to a temp file first and are renamed into place, so readers
+    never see a half-written entry.
+    """
+
+    # Eviction trims to this share of max_bytes
+    LOW_WATER = 0.9
+    # Temp files of a writer that crashed before commit() are removed after this
+    # long (or evict_grace_seconds, if longer)
+    STALE_TEMP_SECONDS = 3600
+
+    def __init__(self, directory: str, max_bytes: int, max_age_seconds: float, suffix: str = "",
+                 touch_on_hit: bool = False, evict_grace_seconds: float = 0):
+        self.directory = pathlib.Path(directory)
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self.suffix = suffix
+        self.touch_on_hit = touch_on_hit
+        self.evict_grace_seconds = evict_grace_seconds
+        self._lock = threading.Lock()
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._bytes = sum(size for _, size, _ in self._entries())
+        # Size at which the next write scans the directory (see evict())
+        self._evict_at = max_bytes
+
+    # --- paths ---
+
+    def path_for(self, key: str) -> pathlib.Path:
+        return self.directory / key[:2] / f"{key}{self.suffix}"
+
+    def _entries(self):
+        """Yield (path, size, mtime) for every cache file."""
+        for path in self.directory.glob(f"*/*{self.suffix}"):
+            try:
+                st = path.stat()
+            except FileNotFoundError:
+                continue
+            yield path, st.st_size, st.st_mtime
+
+    # --- read / write ---
+
+    def _expired(self, mtime: float) -> bool:
+        return self.max_age_seconds > 0 and time.time() - mtime > self.max_age_seconds
+
+    def lookup(self, key: str):
+        """Path of a live entry for key, or None."""
+        path = self.path_for(key)
+        try:
+            st = path.stat()
+        except FileNotFoundError:
+            return None
+        if self._expired(st.st_mtime):
+            self._remove(path, st.st_size)
+            return None
+        if self.touch_on_hit:
+            try:
+                os.utime(path)
+            except FileNotFoundError:
+                return None
+        return path
+
+    def get_text(self, key: str):
+        path = self.lookup(key)
+        if path is None:
+            return None
+        try:
+            return path.read_text(encoding="utf-8")
+        except FileNotFoundError:
+            return None
+
+    def set_text(self, key: str, value: str):
+        return self.set_bytes(key, value.encode("utf-8"))
+
+    def get_bytes(self, key: str):
+        path = self.lookup(key)
+        if path is None:
+            return None
+        try:
+            return path.read_bytes()
+        except FileNotFoundError:
+            return None
+
+    def set_bytes(self, key: str, data: bytes):
+        tmp = self.temp_path(key)
+        with open(tmp, "wb") as f:
+            f.write(data)
+        return self.commit(tmp, key)
+
+    def temp_path(self, key: str) -> pathlib.Path:
+        """Unique temp file next to key's final path, for producers that write files themselves."""
+        path = self.path_for(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        return path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
+
+    def commit(self, tmp_path, key: str) -> pathlib.Path:
+        """Atomically move a finished temp file into place as key's entry."""
+        path = self.path_for(key)
+        size = os.path.getsize(tmp_path)
+        os.replace(tmp_path, path)
+        self._added(size)
+        return path
+
+    def discard(self, tmp_path):
+        try:
+            os.unlink(tmp_path)
+        except FileNotFoundError:
+            pass
+
+    # --- eviction ---
+
+    def _remove(self, path: pathlib.Path, size: int):
+        try:
+            path.unlink()
+        except FileNotFoundError:
+            return
+        with self._lock:
+            self._bytes = max(0, self._bytes - size)
+
+    def _added(self, size: int):
+        with self._lock:
+            self._bytes += size
+            over = self._bytes > self._evict_at
+        if over:
+            self.evict()
+
+    def _remove_stale_temps(self, now: float):
+        max_age = max(self.STALE_TEMP_SECONDS, self.evict_grace_seconds)
+        for path in self.directory.glob("*/.*.tmp"):
+            try:
+                if now - path.stat().st_mtime > max_age:
+                    path.unlink()
+            except FileNotFoundError:
+                pass
+
+    def evict(self):
+        """
+        Drop expired entries and stale temp files, then the oldest entries until
+        the cache is down to LOW_WATER * max_bytes. Entries inside the grace
+        period can keep it above that; the next scan then waits until another
+        (1 - LOW_WATER) * max_bytes has been written, so a cache full of fresh
+        entries is not rescanned on every write.
+        """
+        low_water = self.max_bytes * self.LOW_WATER
+        with self._lock:
+            now = time.time()
+            self._remove_stale_temps(now)
+            entries = sorted(self._entries(), key=lambda e: e[2])
+            total = sum(size for _, size, _ in entries)
+            for path, size, mtime in entries:
+                if not self._expired(mtime) and total <= low_water:
+                    continue
+                if not self._expired(mtime) and now - mtime < self.evict_grace_seconds:
+                    continue
+                try:
+                    path.unlink()
+                    total -= size
+                except FileNotFoundError:
+                    pass
+            self._bytes = total
+            self._evict_at = max(self.max_bytes, total + self.max_bytes - low_water)
@@ -17,3 +17,135 @@ class Config:
     MAX_WORKERS = int(os.getenv("MAX_WORKERS", "4"))
     RATE_LIMIT_CONCURRENCY = int(os.getenv("RATE_LIMIT_CONCURRENCY", "2"))
     OUTPUT_AUDIO_DIR = os.getenv("OUTPUT_AUDIO_DIR", "./output_audio")
+
+    # Staged engine: worker count per stage and size of each stage's input queue
+    SSML_WORKERS = int(os.getenv("SSML_WORKERS", str(MAX_WORKERS)))
+    TTS_WORKERS = int(os.getenv("TTS_WORKERS", str(RATE_LIMIT_CONCURRENCY)))
+    HLS_WORKERS = int(os.getenv("HLS_WORKERS", str(os.cpu_count() or 2)))
+    UPLOAD_WORKERS = int(os.getenv("UPLOAD_WORKERS", str(MAX_WORKERS)))
+    STAGE_QUEUE_SIZE = int(os.getenv("STAGE_QUEUE_SIZE", "8"))
+
+    # Retry scheduling and per-service circuit breakers
+    RETRY_MAX_BACKOFF = float(os.getenv("RETRY_MAX_BACKOFF", "60"))
+    BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5"))
+    BREAKER_RESET_SECONDS = float(os.getenv("BREAKER_RESET_SECONDS", "30"))
+
+    # On-disk SSML cache (keyed by article text, voices, pacing, model and prompt version)
+    SSML_CACHE_ENABLED = os.getenv("SSML_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+    SSML_CACHE_DIR = os.getenv("SSML_CACHE_DIR", "./cache/ssml")
+    SSML_CACHE_MAX_MB = int(os.getenv("SSML_CACHE_MAX_MB", "200"))
+    SSML_CACHE_MAX_AGE_DAYS = float(os.getenv("SSML_CACHE_MAX_AGE_DAYS", "30"))
+
+    # Synthesized-audio cache (keyed by SSML + output format), LRU within a disk budget
+    AUDIO_CACHE_ENABLED = os.getenv("AUDIO_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+    AUDIO_CACHE_DIR = os.getenv("AUDIO_CACHE_DIR", os.path.join(OUTPUT_AUDIO_DIR, "cache"))
+    AUDIO_CACHE_MAX_MB = int(os.getenv("AUDIO_CACHE_MAX_MB", "2048"))
+
+    # Streaming ingestion: articles held in the pipeline at once, and incremental DB flushes
+    MAX_IN_FLIGHT = int(os.getenv("MAX_IN_FLIGHT", "64"))
+    DB_FLUSH_EVERY = int(os.getenv("DB_FLUSH_EVERY", "25"))
+    DB_FLUSH_INTERVAL = float(os.getenv("DB_FLUSH_INTERVAL", "10"))
+
+    # Bulk DB writer: rows per multi-row INSERT/transaction, pool size, retries per batch
+    DB_BATCH_SIZE = int(os.getenv("DB_BATCH_SIZE", "200"))
+    DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+    DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "5"))
+    DB_MAX_RETRIES = int(os.getenv("DB_MAX_RETRIES", "3"))
+
+    # B2 session / uploads
+    B2_UPLOAD_PARALLELISM = int(os.getenv("B2_UPLOAD_PARALLELISM", "8"))
+    B2_AUTH_TTL = float(os.getenv("B2_AUTH_TTL", str(12 * 3600)))
+    # Write objects to this local directory instead of B2 (offline runs / tests)
+    B2_LOCAL_DIR = os.getenv("B2_LOCAL_DIR")
+
+    # Per-service adaptive rate limits (halved on 429/quota errors, ramped back up on success)
+    GEMINI_CONCURRENCY = int(os.getenv("GEMINI_CONCURRENCY", str(MAX_WORKERS)))
+    GEMINI_RPM = float(os.getenv("GEMINI_RPM", "0"))
+    AZURE_CONCURRENCY = int(os.getenv("AZURE_CONCURRENCY", str(RATE_LIMIT_CONCURRENCY)))
+    AZURE_RPM = float(os.getenv("AZURE_RPM", "0"))
+    B2_CONCURRENCY = int(os.getenv("B2_CONCURRENCY", "16"))
+
+    # Append-only, fsync'd journal of stage completions used by --resume
+    JOURNAL_PATH = os.getenv("JOURNAL_PATH", "./pipeline_journal.jsonl")
+
+    # Asyncio mode (run_pipeline.py --async): articles in flight on the event loop
+    ASYNC_MAX_IN_FLIGHT = int(os.getenv("ASYNC_MAX_IN_FLIGHT", "1000"))
+
+    # Batched SSML generation: articles per Gemini request (1 = off), max length of a
+    # batchable article, and how long the SSML stage waits to fill a batch.
+    # Threaded engine only: --async sends one request per article.
+    GEMINI_BATCH_SIZE = int(os.getenv("GEMINI_BATCH_SIZE", "1"))
+    GEMINI_BATCH_MAX_CHARS = int(os.getenv("GEMINI_BATCH_MAX_CHARS", "1500"))
+    GEMINI_BATCH_WAIT = float(os.getenv("GEMINI_BATCH_WAIT", "0.5"))
+
+    # In-memory audio path: Azure -> bytes -> FFmpeg stdin -> tmpfs -> upload from buffers
+    AUDIO_IN_MEMORY = os.getenv("AUDIO_IN_MEMORY", "false").lower() in ("1", "true", "yes")
+    # Scratch dir for FFmpeg's HLS output in that mode (defaults to /dev/shm when present)
+    HLS_TMP_DIR = os.getenv("HLS_TMP_DIR")
+
+    # HLS packaging: "ffmpeg" (re-encode to AAC) or "native" (pure-Python
+    # segmenter over Azure's MP3 frames, no re-encode), and the segment length
+    HLS_SEGMENTER = os.getenv("HLS_SEGMENTER", "ffmpeg").lower()
+    HLS_SEGMENT_SECONDS = float(os.getenv("HLS_SEGMENT_SECONDS", "4"))
+
+    # Progressive streaming: segment and upload Azure's audio while it is still
+    # being synthesized, behind a live EVENT playlist (uses the native segmenter)
+    HLS_STREAMING = os.getenv("HLS_STREAMING", "false").lower() in ("1", "true", "yes")
+    # Seconds a streaming synthesis may go without sending audio before it is stopped
+    HLS_STREAM_CHUNK_TIMEOUT = float(os.getenv("HLS_STREAM_CHUNK_TIMEOUT", "60"))
+
+    # Chunked TTS: split long SSML at <voice> turns and synthesize the pieces in parallel
+    TTS_CHUNKED = os.getenv("TTS_CHUNKED", "false").lower() in ("1", "true", "yes")
+    TTS_CHUNK_MAX_CHARS = int(os.getenv("TTS_CHUNK_MAX_CHARS", "2500"))
+    TTS_CHUNK_PARALLELISM = int(os.getenv("TTS_CHUNK_PARALLELISM", "4"))
+
+    # Fix SSML rule violations (breaks outside <voice>, bad prosody, unknown tags...) locally
+    SSML_LINT_ENABLED = os.getenv("SSML_LINT_ENABLED", "true").lower() in ("1", "true", "yes")
+
+    # Expected embedding length (0 = use the most common length in each chunk)
+    EMBEDDING_DIM = int(os.getenv("EMBEDDING_DIM", "0"))
+
+    # Near-duplicate suppression on article embeddings (cosine similarity)
+    DEDUP_ENABLED = os.getenv("DEDUP_ENABLED", "false").lower() in ("1", "true", "yes")
+    DEDUP_THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", "0.95"))
+    DEDUP_HISTORY_HOURS = float(os.getenv("DEDUP_HISTORY_HOURS", "48"))
+    DEDUP_HISTORY_LIMIT = int(os.getenv("DEDUP_HISTORY_LIMIT", "20000"))
+
+    # Look up each batch's content keys in the DB and skip articles already stored
+    DB_PRECHECK = os.getenv("DB_PRECHECK", "true").lower() in ("1", "true", "yes")
+
+    # Prometheus metrics: serve /metrics on this port (0 = off) and/or rewrite this
+    # file every METRICS_FILE_INTERVAL seconds (e.g. for node_exporter's textfile collector)
+    METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+    METRICS_FILE = os.getenv("METRICS_FILE")
+    METRICS_FILE_INTERVAL = float(os.getenv("METRICS_FILE_INTERVAL", "15"))
+
+    # Chrome-trace / Perfetto span export (same as --trace) and sampling profiler
+    # folded-stack output (same as --profile); both off when unset
+    TRACE_PATH = os.getenv("TRACE_PATH")
+    TRACE_MAX_EVENTS = int(os.getenv("TRACE_MAX_EVENTS", "2000000"))
+    PROFILE_PATH = os.getenv("PROFILE_PATH")
+    PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+
+    # Logging: level for the "newspods" loggers (DEBUG shows per-segment detail and
+    # stage tracebacks) and an optional file next to stderr
+    LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+    LOG_FILE = os.getenv("LOG_FILE")
+
+    # Per-article artifact capture (SSML + error context, one folder per article key).
+    # Failed articles are always captured when ARTIFACTS_DIR is set; successful ones
+    # with probability ARTIFACTS_SAMPLE_RATE (stable per article across runs)
+    ARTIFACTS_DIR = os.getenv("ARTIFACTS_DIR")
+    ARTIFACTS_SAMPLE_RATE = float(os.getenv("ARTIFACTS_SAMPLE_RATE", "0"))
+
+    # Distributed mode (run_pipeline.py enqueue / worker): jobs in public.pipeline_jobs,
+    # claimed QUEUE_CLAIM_BATCH at a time under a QUEUE_LEASE_SECONDS lease that the
+    # worker renews every QUEUE_HEARTBEAT_SECONDS. A job whose lease expired
+    # QUEUE_MAX_ATTEMPTS times (node crashes) is marked failed instead of reclaimed.
+    QUEUE_LEASE_SECONDS = float(os.getenv("QUEUE_LEASE_SECONDS", "300"))
+    QUEUE_HEARTBEAT_SECONDS = float(os.getenv("QUEUE_HEARTBEAT_SECONDS", "60"))
+    QUEUE_CLAIM_BATCH = int(os.getenv("QUEUE_CLAIM_BATCH", "20"))
+    QUEUE_MAX_ATTEMPTS = int(os.getenv("QUEUE_MAX_ATTEMPTS", "5"))
+    QUEUE_IDLE_WAIT = float(os.getenv("QUEUE_IDLE_WAIT", "5"))
+    # Lease owner name; defaults to <hostname>-<pid>
+    QUEUE_WORKER_ID = os.getenv("QUEUE_WORKER_ID")
@@ -73,165 +73,325 @@
 #     return inserted_article_ids
 
 # pipeline/db_pusher.py
-import pandas as pd
-from sqlalchemy import create_engine, text
-from sqlalchemy.pool import NullPool
-from sqlalchemy.exc import OperationalError
+from typing import TYPE_CHECKING
 from pipeline.config import Config
+from pipeline.embeddings import embeddings_for_insert
+from pipeline.journal import article_key
+from pipeline import metrics
+from pipeline.log import get_logger
+from datetime import datetime, timedelta, timezone
+import threading
 import time
 
-def _normalize_embedding(val):
-    """
-    Convert embedding to a Python list[float] suitable for a FLOAT8[] column.
+if TYPE_CHECKING:
+    import pandas as pd
 
-    Handles:
-    - None / NaN -> None
-    - list/tuple -> list[float]
-    - string like "[0.01, 0.02, ...]" or "0.01, 0.02, ..."
-    """
-    if val is None:
-        return None
-
-    # NaN from pandas
-    if isinstance(val, float) and pd.isna(val):
-        return None
-
-    if isinstance(val, (list, tuple)):
-        return [float(x) for x in val]
-
-    if isinstance(val, str):
-        s = val.strip()
-        if not s:
-            return None
-        # Strip [] if present
-        if s[0] == "[" and s[-1] == "]":
-            s = s[1:-1].strip()
-        if not s:
-            return None
-        parts = [p.strip() for p in s.split(",") if p.strip()]
-        try:
-            return [float(p) for p in parts]
-        except ValueError:
-            # If something weird comes through, drop it instead of breaking the pipeline
-            print(f"⚠️ Could not parse embedding string, storing NULL. Sample: {val[:80]!r}")
-            return None
+log = get_logger(__name__)
+
+# pandas and SQLAlchemy are imported inside the functions that use them, so
+# importing the pipeline does not pay for them until the first DB write/read
+
+# Shared, pooled engine (created on first use and reused by every push)
+_engine = None
+_engine_lock = threading.Lock()
+_schema_checked = False
 
-    # Any other type – just ignore and store NULL to avoid blowing up the insert
-    return None
+ARTICLE_INSERT_COLS = ['title', 'description', 'news_source', 'created_at', 'audio_key', 'embedding', 'content_key']
+
+
+def get_engine():
+    """Process-wide SQLAlchemy engine with a connection pool."""
+    global _engine
+    if not Config.COCKROACHDB_CONN_STRING:
+        raise RuntimeError("COCKROACHDB_CONN_STRING is not set.")
+    with _engine_lock:
+        if _engine is None:
+            from sqlalchemy import create_engine
+            _engine = create_engine(
+                Config.COCKROACHDB_CONN_STRING,
+                pool_size=Config.DB_POOL_SIZE,
+                max_overflow=Config.DB_MAX_OVERFLOW,
+                pool_pre_ping=True,
+                pool_recycle=1800,
+                connect_args={"application_name": "news_processor"},
+            )
+        return _engine
+
+
+def _ensure_articles_schema(engine):
+    """Add articles.content_key (and its unique index) before the first upsert of this process."""
+    global _schema_checked
+    from pipeline.db_schema import ensure_content_key
+
+    with _engine_lock:
+        if not _schema_checked:
+            ensure_content_key(engine)
+            _schema_checked = True
+
+
+def _prepare_articles(df: "pd.DataFrame"):
+    """
+    Normalize column names/types for the insert.
+    Returns (article records, topics per article) in the same order as df.
+    """
+    import pandas as pd
+    articles_df = df.copy()
+    articles_df.rename(columns={
+        'content': 'description',
+        'source': 'news_source',
+        'published_date': 'created_at',
+        # if CSV/DF still has audio_url, rename it to audio_key
+        'audio_url': 'audio_key'
+    }, inplace=True)
+
+    # ensure created_at exists
+    if 'created_at' in articles_df.columns:
+        articles_df['created_at'] = pd.to_datetime(articles_df['created_at'], errors='coerce')
+        # NaT cannot be bound as a parameter; store NULL instead
+        articles_df['created_at'] = articles_df['created_at'].astype(object).where(
+            articles_df['created_at'].notna(), None
+        )
+    else:
+        articles_df['created_at'] = pd.Timestamp.now()
+
+    topics_data = articles_df.get('topic', pd.Series([[]]*len(articles_df))).tolist()
+
+    # ensure columns for insert (add audio_key)
+    if 'audio_key' not in articles_df.columns:
+        articles_df['audio_key'] = None
+
+    # content key: the pipeline's job key when present, else computed from the row
+    if 'pipeline_key' in articles_df.columns:
+        articles_df['content_key'] = articles_df['pipeline_key']
+    if 'content_key' not in articles_df.columns:
+        articles_df['content_key'] = [article_key(row) for row in articles_df.to_dict('records')]
+
+    # ensure embedding exists; float32 rows (or strings) -> list[float] for FLOAT8[]
+    if 'embedding' not in articles_df.columns:
+        articles_df['embedding'] = None
+    else:
+        articles_df['embedding'] = embeddings_for_insert(articles_df['embedding'].tolist())
+
+    return articles_df[ARTICLE_INSERT_COLS].to_dict('records'), topics_data
+
+
+def _section_rows(article_ids, topics_data):
+    import pandas as pd
+    sections_records = []
+    for article_id, topics in zip(article_ids, topics_data):
+        if not isinstance(topics, list):
+            topics = [topics] if pd.notna(topics) else []
+        for topic in topics:
+            topic_str = str(topic).strip()
+            if topic_str and topic_str.lower() != 'nan':
+                sections_records.append({'article_id': article_id, 'news_section': topic_str})
+    return sections_records
+
+
+def _insert_batch(connection, records, topics_data):
+    """
+    One multi-row upsert on content_key for the articles, and one multi-row
+    INSERT for their sections. An article that is already in the table keeps
+    its row (and article_id) and gets the new audio_key/embedding. Returns
+    article ids aligned with records.
+
+    Neither Postgres nor CockroachDB promises RETURNING rows in VALUES order,
+    so each id comes back with its content_key and is matched by that key;
+    the sections are then built from those matched ids.
+    """
+    from sqlalchemy import func
+    from sqlalchemy.dialects.postgresql import insert as pg_insert
+    from pipeline.db_schema import articles_table, articles_sections_table
+
+    # ON CONFLICT cannot touch the same row twice in one statement: last copy wins
+    unique = {}
+    for rec in records:
+        unique[rec['content_key']] = rec
+    stmt = pg_insert(articles_table).values(list(unique.values()))
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["content_key"],
+        set_={
+            "audio_key": func.coalesce(stmt.excluded.audio_key, articles_table.c.audio_key),
+            "embedding": func.coalesce(stmt.excluded.embedding, articles_table.c.embedding),
+        },
+    ).returning(articles_table.c.content_key, articles_table.c.article_id)
+    ids_by_key = {row[0]: row[1] for row in connection.execute(stmt)}
+    missing = unique.keys() - ids_by_key.keys()
+    if missing:
+        # Raising rolls the batch back instead of attaching sections to a wrong id
+        raise RuntimeError(f"Upsert returned no article id for {len(missing)} of {len(unique)} articles.")
+    article_ids = [ids_by_key[rec['content_key']] for rec in records]
+
+    sections_records = _section_rows(article_ids, topics_data)
+    if sections_records:
+        connection.execute(
+            pg_insert(articles_sections_table)
+            .values(sections_records)
+            .on_conflict_do_nothing(index_elements=["article_id", "news_section"])
+        )
+    return article_ids
+
+
+def existing_articles(content_keys: list) -> dict:
+    """
+    {content_key: {"article_id", "audio_key"}} for the keys already in the DB,
+    in one round trip. Used to skip articles before any work is done.
+    """
+    if not content_keys:
+        return {}
+    from sqlalchemy import select
+    from pipeline.db_schema import articles_table
+
+    query = (
+        select(articles_table.c.content_key, articles_table.c.article_id, articles_table.c.audio_key)
+        .where(articles_table.c.content_key.in_(list(content_keys)))
+    )
+    with get_engine().connect() as connection:
+        rows = connection.execute(query).all()
+    return {row[0]: {"article_id": row[1], "audio_key": row[2]} for row in rows}
 
 
-def push_articles_to_db(df: pd.DataFrame):
+def push_articles_to_db(df: "pd.DataFrame", batch_size: int = None):
     """
     Pushes DataFrame of articles to CockroachDB with normalized schema.
     df columns: title, description, news_source, created_at (datetime), audio_key
     topic column expected to be a list (or str)
+
+    Rows are written in batches of batch_size (DB_BATCH_SIZE), each batch in its
+    own transaction with its own retries, so a dropped connection only replays
+    the batch that was in flight.
     """
     if df.empty:
         return []
+    from sqlalchemy.exc import OperationalError
 
-    if not Config.COCKROACHDB_CONN_STRING:
-        raise RuntimeError("COCKROACHDB_CONN_STRING is not set.")
-
-    engine = create_engine(
-        Config.COCKROACHDB_CONN_STRING,
-        poolclass=NullPool,
-        connect_args={"application_name": "news_processor"},
-        pool_pre_ping=True
-    )
+    engine = get_engine()
+    _ensure_articles_schema(engine)
+    batch_size = batch_size or Config.DB_BATCH_SIZE
+    records, topics_data = _prepare_articles(df)
 
     inserted_article_ids = []
-
-    # Retry-safe DB session
-    max_retries = 3
-    for attempt in range(1, max_retries + 1):
-        try:
-            with engine.begin() as connection:
-                articles_df = df.copy()
-                articles_df.rename(columns={
-                    'content': 'description',
-                    'source': 'news_source',
-                    'published_date': 'created_at',
-                    # if CSV/DF still has audio_url, rename it to audio_key
-                    'audio_url': 'audio_key'
-                }, inplace=True)
-
-                # ensure created_at exists
-                if 'created_at' in articles_df.columns:
-                    articles_df['created_at'] = pd.to_datetime(articles_df['created_at'], errors='coerce')
+    max_retries = Config.DB_MAX_RETRIES
+    for start in range(0, len(records), batch_size):
+        batch = records[start:start + batch_size]
+        batch_topics = topics_data[start:start + batch_size]
+
+        # Retry-safe DB session, per batch
+        for attempt in range(1, max_retries + 1):
+            try:
+                with metrics.DB_BATCH_SECONDS.time():
+                    with engine.begin() as connection:
+                        article_ids = _insert_batch(connection, batch, batch_topics)
+                inserted_article_ids.extend(article_ids)
+                metrics.DB_ROWS.inc(len(article_ids))
+                break  # ✅ success → next batch
+
+            except OperationalError as e:
+                metrics.DB_ERRORS.inc(cause=metrics.error_cause(e))
+                log.warning("⚠️ Database connection lost on batch %d (attempt %d/%d): %s",
+                            start // batch_size + 1, attempt, max_retries, e)
+                if attempt < max_retries:
+                    wait_time = 2 ** attempt
+                    log.info("🔁 Retrying batch in %ds...", wait_time)
+                    time.sleep(wait_time)
+                    continue
                 else:
-                    articles_df['created_at'] = pd.Timestamp.now()
+                    log.error("❌ Max retries reached. Database still unavailable.")
+                    raise e
 
-                topics_data = articles_df.get('topic', pd.Series([[]]*len(articles_df))).tolist()
+    return inserted_article_ids
 
-                # ensure columns for insert (add audio_key)
-                if 'audio_key' not in articles_df.columns:
-                    articles_df['audio_key'] = None
 
-                # ensure embedding exists, and normalize to list[float] for FLOAT8[]
-                if 'embedding' not in articles_df.columns:
-                    articles_df['embedding'] = None
-                else:
-                    articles_df['embedding'] = articles_df['embedding'].apply(_normalize_embedding)
-
-                insert_cols = ['title', 'description', 'news_source', 'created_at', 'audio_key', 'embedding']
-                articles_df = articles_df[insert_cols]
-
-                insert_query = text("""
-                                    INSERT INTO public.articles (title,
-                                                                 description,
-                                                                 news_source,
-                                                                 created_at,
-                                                                 audio_key,
-                                                                 embedding)
-                                    VALUES (:title,
-                                            :description,
-                                            :news_source,
-                                            :created_at,
-                                            :audio_key,
-                                            :embedding) RETURNING article_id
-                                    """)
-
-                articles_records = articles_df.to_dict('records')
-
-                article_ids = []
-                for record in articles_records:
-                    result = connection.execute(insert_query, record)
-                    article_id = result.fetchone()[0]
-                    article_ids.append(article_id)
-
-                # sections
-                sections_records = []
-                for idx, topics in enumerate(topics_data):
-                    article_id = article_ids[idx]
-                    if not isinstance(topics, list):
-                        topics = [topics] if pd.notna(topics) else []
-                    for topic in topics:
-                        topic_str = str(topic).strip()
-                        if topic_str and topic_str.lower() != 'nan':
-                            sections_records.append({'article_id': article_id, 'news_section': topic_str})
-
-                if sections_records:
-                    insert_sections_query = text("""
-                        INSERT INTO public.articles_sections (article_id, news_section)
-                        VALUES (:article_id, :news_section)
-                        ON CONFLICT (article_id, news_section) DO NOTHING
-                    """)
-                    for sr in sections_records:
-                        connection.execute(insert_sections_query, sr)
-
-                inserted_article_ids = article_ids
-            break  # ✅ success → exit retry loop
-
-        except OperationalError as e:
-            print(f"⚠️ Database connection lost (attempt {attempt}/{max_retries}): {e}")
-            if attempt < max_retries:
-                wait_time = 2 ** attempt
-                print(f"🔁 Retrying in {wait_time}s...")
-                time.sleep(wait_time)
-                continue
-            else:
-                print("❌ Max retries reached. Database still unavailable.")
-                raise e
+def fetch_recent_embeddings(hours: float, limit: int):
+    """
+    (audio_keys, embeddings) of the newest articles from the last `hours` that
+    have both, newest first, at most `limit` rows. Used to seed dedup.
+    """
+    from sqlalchemy import select
+    from pipeline.db_schema import articles_table
+
+    since = datetime.now(timezone.utc) - timedelta(hours=hours)
+    query = (
+        select(articles_table.c.audio_key, articles_table.c.embedding)
+        .where(articles_table.c.created_at >= since)
+        .where(articles_table.c.embedding.isnot(None))
+        .where(articles_table.c.audio_key.isnot(None))
+        .order_by(articles_table.c.created_at.desc())
+        .limit(limit)
+    )
+    with get_engine().connect() as connection:
+        rows = connection.execute(query).all()
+    return [row[0] for row in rows], [row[1] for row in rows]
 
-    return inserted_article_ids
 
+class BufferedArticleWriter:
+    """
+    Collects successful article records and pushes them to the DB in the
+    background every `flush_every` records or `flush_interval` seconds,
+    whichever comes first, so articles land in the DB while the run is going.
+
+    Records from a batch that fails to insert end up in `failures`.
+    on_flushed(records, article_ids) is called after every successful flush.
+    """
+
+    def __init__(self, flush_every: int = None, flush_interval: float = None, push=None, on_flushed=None):
+        self.flush_every = flush_every or Config.DB_FLUSH_EVERY
+        self.flush_interval = flush_interval or Config.DB_FLUSH_INTERVAL
+        self._push = push or push_articles_to_db
+        self._on_flushed = on_flushed
+        self._buffer = []
+        self._cond = threading.Condition()
+        self._closed = False
+        self.inserted_ids = []
+        self.failures = []
+        self._thread = threading.Thread(target=self._loop, name="db-writer", daemon=True)
+        self._thread.start()
+
+    def add(self, record: dict):
+        with self._cond:
+            self._buffer.append(record)
+            if len(self._buffer) >= self.flush_every:
+                self._cond.notify()
+
+    def close(self):
+        """Flush whatever is left and wait for the writer thread."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join()
+
+    def _loop(self):
+        last_flush = time.monotonic()
+        while True:
+            with self._cond:
+                while not self._closed and len(self._buffer) < self.flush_every:
+                    remaining = self.flush_interval - (time.monotonic() - last_flush)
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch, self._buffer = self._buffer, []
+                closed = self._closed
+            if batch:
+                self._flush(batch)
+            last_flush = time.monotonic()
+            if closed:
+                with self._cond:
+                    if not self._buffer:
+                        return
+
+    def _flush(self, batch):
+        import pandas as pd
+
+        try:
+            ids = self._push(pd.DataFrame(batch))
+            self.inserted_ids.extend(ids)
+            log.info("💾 Flushed %d articles to DB (%d so far).", len(batch), len(self.inserted_ids))
+        except Exception as e:
+            log.error("❌ DB flush of %d articles failed: %s", len(batch), e)
+            self.failures.extend({"record": rec, "error": str(e), "stage": "db"} for rec in batch)
+            return
+        if self._on_flushed:
+            try:
+                self._on_flushed(batch, ids)
+            except Exception as e:
+                log.warning("⚠️ on_flushed callback failed: %s", e)
@@ -0,0 +1,87 @@
+# pipeline/db_schema.py
+from sqlalchemy import MetaData, Table, Column, Index, Integer, String, DateTime, inspect, text
+from sqlalchemy.dialects.postgresql import ARRAY, DOUBLE_PRECISION, JSONB
+
+# SQLAlchemy table definitions. Kept apart from pipeline.db_pusher so that
+# SQLAlchemy is only imported once a run actually reads or writes the DB.
+
+_metadata = MetaData()
+
+articles_table = Table(
+    "articles", _metadata,
+    Column("article_id"),
+    Column("title", String),
+    Column("description", String),
+    Column("news_source", String),
+    Column("created_at", DateTime(timezone=True)),
+    Column("audio_key", String),
+    Column("embedding", ARRAY(DOUBLE_PRECISION)),
+    # article_key() of the row; UNIQUE, so re-ingesting a story updates it in place
+    Column("content_key", String),
+    schema="public",
+)
+
+# content_key came after public.articles; the upsert in db_pusher needs the
+# column and a unique index on it for ON CONFLICT (content_key)
+CONTENT_KEY_MIGRATION = (
+    "ALTER TABLE public.articles ADD COLUMN IF NOT EXISTS content_key TEXT",
+    "CREATE UNIQUE INDEX IF NOT EXISTS articles_content_key_idx ON public.articles (content_key)",
+)
+
+
+def has_content_key(engine) -> bool:
+    """True if public.articles has content_key with a unique index or constraint on it."""
+    inspector = inspect(engine)
+    if not any(c["name"] == "content_key" for c in inspector.get_columns("articles", schema="public")):
+        return False
+    return any(
+        ix["unique"] and ix["column_names"] == ["content_key"]
+        for ix in inspector.get_indexes("articles", schema="public")
+    ) or any(
+        uc["column_names"] == ["content_key"]
+        for uc in inspector.get_unique_constraints("articles", schema="public")
+    )
+
+
+def ensure_content_key(engine):
+    """Apply CONTENT_KEY_MIGRATION if it is missing (idempotent)."""
+    if has_content_key(engine):
+        return
+    try:
+        with engine.begin() as connection:
+            for statement in CONTENT_KEY_MIGRATION:
+                connection.execute(text(statement))
+    except Exception as e:
+        raise RuntimeError(
+            "public.articles has no unique content_key column and adding it failed "
+            f"({e}). Apply it as a user that may alter the table:\n"
+            + ";\n".join(CONTENT_KEY_MIGRATION) + ";"
+        ) from e
+
+
+articles_sections_table = Table(
+    "articles_sections", _metadata,
+    Column("article_id"),
+    Column("news_section", String),
+    schema="public",
+)
+
+# Distributed work queue (pipeline.job_queue), one row per article content key.
+# status: queued -> leased -> done | failed; a leased row whose lease expired is
+# claimable again. progress holds the finished stages and what they left behind.
+pipeline_jobs_table = Table(
+    "pipeline_jobs", _metadata,
+    Column("content_key", String, primary_key=True),
+    Column("article", JSONB, nullable=False),
+    Column("status", String, nullable=False, server_default="queued"),
+    Column("attempts", Integer, nullable=False, server_default=text("0")),
+    Column("progress", JSONB, nullable=False, server_default=text("'{}'::JSONB")),
+    Column("lease_owner", String),
+    Column("lease_expires_at", DateTime(timezone=True)),
+    Column("failed_stage", String),
+    Column("error", String),
+    Column("enqueued_at", DateTime(timezone=True), nullable=False, server_default=text("now()")),
+    Column("updated_at", DateTime(timezone=True), nullable=False, server_default=text("now()")),
+    Index("pipeline_jobs_claim_idx", "status", "enqueued_at"),
+    schema="public",
+)
@@ -0,0 +1,213 @@
+# pipeline/dedup.py
+import threading
+
+import numpy as np
+
+from pipeline.config import Config
+from pipeline.db_pusher import fetch_recent_embeddings
+from pipeline.embeddings import parse_embeddings
+from pipeline.log import get_logger
+
+log = get_logger(__name__)
+
+
+def _unit_rows(matrix: np.ndarray) -> np.ndarray:
+    """Rows scaled to length 1, so a dot product is the cosine similarity."""
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (matrix / norms).astype(np.float32, copy=False)
+
+
+class EmbeddingIndex:
+    """
+    Brute-force cosine index: unit float32 rows in one growable matrix. A batch
+    query is a single matrix product, which for a few tens of thousands of
+    recent articles is faster than keeping an ANN structure up to date.
+    """
+
+    def __init__(self, dim: int, capacity: int = 1024):
+        self.dim = dim
+        self._rows = np.zeros((capacity, dim), dtype=np.float32)
+        self._active = np.zeros(capacity, dtype=bool)
+        self.size = 0
+
+    def add(self, unit_vector: np.ndarray) -> int:
+        if self.size == len(self._rows):
+            grow = len(self._rows)
+            self._rows = np.vstack([self._rows, np.zeros((grow, self.dim), dtype=np.float32)])
+            self._active = np.concatenate([self._active, np.zeros(grow, dtype=bool)])
+        self._rows[self.size] = unit_vector
+        self._active[self.size] = True
+        self.size += 1
+        return self.size - 1
+
+    def deactivate(self, idx: int):
+        self._active[idx] = False
+
+    def is_active(self, idx: int) -> bool:
+        return bool(self._active[idx])
+
+    def similarities(self, unit_queries: np.ndarray) -> np.ndarray:
+        """(queries x size) cosine similarities; inactive rows score -inf."""
+        sims = unit_queries @ self._rows[:self.size].T
+        sims[:, ~self._active[:self.size]] = -np.inf
+        return sims
+
+
+class Deduplicator:
+    """
+    Near-duplicate suppression on the article embeddings, ahead of the
+    Gemini/Azure/B2 stages.
+
+    route() takes a batch of jobs and returns the ones that still need the
+    pipeline. A job whose embedding is within DEDUP_THRESHOLD cosine similarity
+    of an already published article (DB history or earlier in this run) gets
+    that article's audio_key and skips every stage. A job matching an article
+    that is still in flight becomes its follower: it is held back and settled
+    by settle() with the canonical article's outcome, audio or failure.
+    """
+
+    def __init__(self, threshold: float = None):
+        self.threshold = Config.DEDUP_THRESHOLD if threshold is None else threshold
+        self.index = None
+        self._entries = []  # per index row: {"key", "audio_key", "followers"}
+        self._lock = threading.Lock()
+        self.num_published_duplicates = 0
+        self.num_inflight_duplicates = 0
+
+    # --- history ---
+
+    def add_history(self, audio_keys: list, embeddings: list):
+        """Seed the index with published articles (audio_key + embedding)."""
+        matrix, valid = parse_embeddings(embeddings)
+        with self._lock:
+            for audio_key, row, ok in zip(audio_keys, matrix, valid):
+                if ok and audio_key:
+                    self._add(row, {"key": None, "audio_key": audio_key, "followers": []})
+
+    def _add(self, vector: np.ndarray, entry: dict):
+        if self.index is None:
+            self.index = EmbeddingIndex(vector.size)
+        if vector.size != self.index.dim:
+            return None
+        idx = self.index.add(_unit_rows(vector.reshape(1, -1))[0])
+        self._entries.append(entry)
+        return idx
+
+    # --- routing ---
+
+    def route(self, jobs: list) -> list:
+        """Jobs that must go through the pipeline (published duplicates included, with every stage done)."""
+        to_submit = []
+        with self._lock:
+            candidates = [
+                (job, job["article_row"].get("embedding")) for job in jobs
+                if not job.get("audio") and isinstance(job["article_row"].get("embedding"), np.ndarray)
+            ]
+            dim = self.index.dim if self.index is not None else (candidates[0][1].size if candidates else 0)
+            candidates = [(job, emb) for job, emb in candidates if emb.size == dim]
+            queries = _unit_rows(np.stack([emb for _, emb in candidates])) if candidates else None
+            history = self.index.similarities(queries) if queries is not None and self.index is not None else None
+            history_size = self.index.size if self.index is not None else 0
+            # Similarity between the batch's own rows, for copies inside this batch
+            within = queries @ queries.T if queries is not None else None
+            batch_rows = {}  # candidate position -> index row, for canonicals added from this batch
+
+            candidate_pos = {id(job): pos for pos, (job, _) in enumerate(candidates)}
+            for job in jobs:
+                pos = candidate_pos.get(id(job))
+                if pos is None:
+                    if job.get("audio"):
+                        # Finished in an earlier run (resume): its audio is reusable
+                        emb = job["article_row"].get("embedding")
+                        if isinstance(emb, np.ndarray):
+                            self._add(emb, {"key": job["key"], "audio_key": job["audio"]["hls_playlist_object"],
+                                            "followers": []})
+                    to_submit.append(job)
+                    continue
+
+                best_idx, best_sim = None, -np.inf
+                if history is not None and history_size:
+                    i = int(np.argmax(history[pos]))
+                    best_idx, best_sim = i, float(history[pos, i])
+                for other_pos, idx in batch_rows.items():
+                    if within[pos, other_pos] > best_sim and self.index.is_active(idx):
+                        best_idx, best_sim = idx, float(within[pos, other_pos])
+
+                if best_idx is not None and best_sim >= self.threshold:
+                    entry = self._entries[best_idx]
+                    job["duplicate_of"] = entry["key"] or entry["audio_key"]
+                    job["duplicate_similarity"] = round(best_sim, 4)
+                    if entry["audio_key"]:
+                        self._reuse_audio(job, entry["audio_key"])
+                        self.num_published_duplicates += 1
+                        to_submit.append(job)
+                    else:
+                        entry["followers"].append(job)
+                        self.num_inflight_duplicates += 1
+                    continue
+
+                idx = self._add(candidates[pos][1], {"key": job["key"], "audio_key": None, "followers": []})
+                job["dedup_id"] = idx
+                batch_rows[pos] = idx
+                to_submit.append(job)
+        return to_submit
+
+    @staticmethod
+    def _reuse_audio(job: dict, audio_key: str):
+        job["audio"] = {
+            "original_local_path": None,
+            "hls_prefix": audio_key.rsplit("/", 1)[0],
+            "hls_playlist_object": audio_key,
+            "segment_count": None,
+        }
+        job["completed_stages"] = ["ssml", "tts", "hls", "upload"]
+
+    # --- completion ---
+
+    def settle(self, job: dict) -> list:
+        """
+        Called with every finished job; returns its followers, now finished too:
+        sharing its audio on success, failed with its error otherwise.
+        """
+        idx = job.get("dedup_id")
+        if idx is None:
+            return []
+        with self._lock:
+            entry = self._entries[idx]
+            followers, entry["followers"] = entry["followers"], []
+            if job.get("success"):
+                entry["audio_key"] = job["audio"]["hls_playlist_object"]
+            else:
+                # Later copies get a fresh attempt instead of inheriting the failure
+                self.index.deactivate(idx)
+        for follower in followers:
+            if job.get("success"):
+                self._reuse_audio(follower, entry["audio_key"])
+                follower["success"] = True
+            else:
+                follower["success"] = False
+                follower["failed_stage"] = job.get("failed_stage")
+                follower["error"] = f"duplicate of failed article {job['key'][:12]}: {job.get('error')}"
+        return followers
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "published": self.num_published_duplicates,
+                "in_flight": self.num_inflight_duplicates,
+            }
+
+
+def open_deduplicator():
+    """Deduplicator seeded with recent DB articles, or None when DEDUP_ENABLED is off."""
+    if not Config.DEDUP_ENABLED:
+        return None
+    deduper = Deduplicator()
+    try:
+        audio_keys, embeddings = fetch_recent_embeddings(Config.DEDUP_HISTORY_HOURS, Config.DEDUP_HISTORY_LIMIT)
+        deduper.add_history(audio_keys, embeddings)
+        log.info("🔎 Dedup history: %d recent articles (threshold %s).", len(audio_keys), deduper.threshold)
+    except Exception as e:
+        log.warning("⚠️ Could not load dedup history from DB (%s); deduplicating within this run only.", e)
+    return deduper
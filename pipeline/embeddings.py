@@ -0,0 +1,103 @@
+# pipeline/embeddings.py
+import math
+import warnings
+from collections import Counter
+
+import numpy as np
+
+from pipeline.config import Config
+from pipeline.log import get_logger
+
+log = get_logger(__name__)
+
+
+def _embedding_text(val):
+    """The comma-separated numbers of an embedding string ("[0.1, 0.2]" or "0.1, 0.2"), or None."""
+    s = val.strip()
+    if s[:1] == "[" and s[-1:] == "]":
+        s = s[1:-1].strip()
+    return s or None
+
+
+def _fromstring(text: str):
+    """np.fromstring text parse; an empty array if any token is not a number."""
+    try:
+        with warnings.catch_warnings():
+            # older numpy warns and stops early on a bad token, newer numpy raises
+            warnings.simplefilter("ignore")
+            return np.fromstring(text, dtype=np.float32, sep=",")
+    except ValueError:
+        return np.empty(0, dtype=np.float32)
+
+
+def parse_embeddings(values, dim: int = None):
+    """
+    Parse a column of embeddings into one contiguous float32 matrix.
+
+    values may hold strings like "[0.01, 0.02, ...]", lists/arrays, or
+    None/NaN. All strings are joined and parsed by a single np.fromstring call
+    instead of float() per number.
+
+    Every embedding must have `dim` values (EMBEDDING_DIM, or when that is 0
+    the most common length in this column); rows that do not, or that do not
+    parse, are reported and treated as missing.
+
+    Returns:
+        (matrix, valid): float32 array of shape (len(values), dim) and a bool
+        mask of rows that hold an embedding (other rows are zeros).
+    """
+    n = len(values)
+    texts = {}
+    arrays = {}
+    for i, val in enumerate(values):
+        if val is None or (isinstance(val, float) and math.isnan(val)):
+            continue
+        if isinstance(val, str):
+            text = _embedding_text(val)
+            if text is not None:
+                texts[i] = text
+        elif isinstance(val, (list, tuple, np.ndarray)):
+            arrays[i] = np.asarray(val, dtype=np.float32).ravel()
+
+    lengths = {i: t.count(",") + 1 for i, t in texts.items()}
+    lengths.update({i: a.size for i, a in arrays.items()})
+
+    dim = dim or Config.EMBEDDING_DIM
+    if not dim:
+        dim = Counter(lengths.values()).most_common(1)[0][0] if lengths else 0
+    matrix = np.zeros((n, dim), dtype=np.float32)
+    valid = np.zeros(n, dtype=bool)
+    if not dim:
+        return matrix, valid
+
+    wrong_dim = [i for i, length in lengths.items() if length != dim]
+    if wrong_dim:
+        log.warning("⚠️ %d embeddings do not have %d values; storing NULL for those rows.", len(wrong_dim), dim)
+
+    rows = [i for i in texts if lengths[i] == dim]
+    if rows:
+        flat = _fromstring(",".join(texts[i] for i in rows))
+        if flat.size == len(rows) * dim:
+            matrix[rows] = flat.reshape(len(rows), dim)
+            valid[rows] = True
+        else:
+            # Some row has a token that is not a number; find it row by row
+            for i in rows:
+                parsed = _fromstring(texts[i])
+                if parsed.size == dim:
+                    matrix[i] = parsed
+                    valid[i] = True
+                else:
+                    log.warning("⚠️ Could not parse embedding string, storing NULL. Sample: %r", texts[i][:80])
+
+    for i, arr in arrays.items():
+        if arr.size == dim:
+            matrix[i] = arr
+            valid[i] = True
+    return matrix, valid
+
+
+def embeddings_for_insert(values, dim: int = None) -> list:
+    """Python float lists (or None) for a FLOAT8[] insert, converted in one tolist() call."""
+    matrix, valid = parse_embeddings(values, dim)
+    return [row if ok else None for row, ok in zip(matrix.tolist(), valid.tolist())]
@@ -0,0 +1,290 @@
+# pipeline/hls_segmenter.py
+import math
+import struct
+
+# Pure-Python HLS packager for audio that is already encoded (no FFmpeg, no
+# re-encode). It walks the MPEG audio (MP3) or ADTS (AAC) frames, cuts them
+# into ~N second packed-audio segments and writes the playlist, using each
+# frame header's sample count for exact durations.
+
+# HLS packed audio: every segment starts with an ID3 PRIV frame carrying the
+# 33-bit MPEG-2 PTS (90 kHz) of its first sample.
+TIMESTAMP_OWNER = b"com.apple.streaming.transportStreamTimestamp"
+
+_MPEG_SAMPLE_RATES = {
+    3: (44100, 48000, 32000),  # MPEG-1
+    2: (22050, 24000, 16000),  # MPEG-2
+    0: (11025, 12000, 8000),   # MPEG-2.5
+}
+
+# kbps by (is MPEG-1, layer) and bitrate index
+_MPEG_BITRATES = {
+    (True, 1): (0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448),
+    (True, 2): (0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384),
+    (True, 3): (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    (False, 1): (0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256),
+    (False, 2): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+    (False, 3): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+
+_ADTS_SAMPLE_RATES = (96000, 88200, 64000, 48000, 44100, 32000, 24000, 22050,
+                      16000, 12000, 11025, 8000, 7350)
+
+
+class AudioFrame:
+    """One parsed frame header: its length in bytes and how much audio it holds."""
+
+    __slots__ = ("codec", "length", "samples", "sample_rate", "header_size", "channels", "mpeg1")
+
+    def __init__(self, codec, length, samples, sample_rate, header_size=4, channels=1, mpeg1=True):
+        self.codec = codec
+        self.length = length
+        self.samples = samples
+        self.sample_rate = sample_rate
+        self.header_size = header_size
+        self.channels = channels
+        self.mpeg1 = mpeg1
+
+    @property
+    def duration(self) -> float:
+        return self.samples / self.sample_rate
+
+
+def parse_frame_header(buf, pos: int = 0):
+    """AudioFrame for an MP3 or ADTS header at buf[pos], or None if there is none."""
+    if len(buf) - pos < 7 or buf[pos] != 0xFF or (buf[pos + 1] & 0xE0) != 0xE0:
+        return None
+    b1, b2, b3 = buf[pos + 1], buf[pos + 2], buf[pos + 3]
+
+    if (b1 & 0xF6) == 0xF0:
+        # ADTS: 12 sync bits, then layer == 00
+        sr_index = (b2 >> 2) & 0x0F
+        if sr_index >= len(_ADTS_SAMPLE_RATES):
+            return None
+        length = ((b3 & 0x03) << 11) | (buf[pos + 4] << 3) | (buf[pos + 5] >> 5)
+        header_size = 7 if b1 & 0x01 else 9
+        if length <= header_size:
+            return None
+        blocks = (buf[pos + 6] & 0x03) + 1
+        channels = ((b2 & 0x01) << 2) | (b3 >> 6)
+        return AudioFrame("aac", length, 1024 * blocks, _ADTS_SAMPLE_RATES[sr_index],
+                          header_size=header_size, channels=channels)
+
+    version = (b1 >> 3) & 0x03
+    layer = 4 - ((b1 >> 1) & 0x03)
+    bitrate_index = b2 >> 4
+    sr_index = (b2 >> 2) & 0x03
+    if version == 1 or layer == 4 or bitrate_index in (0, 15) or sr_index == 3:
+        # reserved values (and "free format", which we cannot size)
+        return None
+    mpeg1 = version == 3
+    bitrate = _MPEG_BITRATES[(mpeg1, layer)][bitrate_index] * 1000
+    sample_rate = _MPEG_SAMPLE_RATES[version][sr_index]
+    padding = (b2 >> 1) & 0x01
+    if layer == 1:
+        samples = 384
+        length = (12 * bitrate // sample_rate + padding) * 4
+    else:
+        samples = 1152 if (layer == 2 or mpeg1) else 576
+        length = samples // 8 * bitrate // sample_rate + padding
+    channels = 1 if (b3 >> 6) == 3 else 2
+    return AudioFrame("mp3", length, samples, sample_rate, channels=channels, mpeg1=mpeg1)
+
+
+def id3_tag_size(buf, pos: int = 0):
+    """Total size of an ID3v2 tag at buf[pos], None if there is no tag, 0 if the header is incomplete."""
+    if buf[pos:pos + 3] != b"ID3":
+        return None
+    if len(buf) - pos < 10:
+        return 0
+    size = 0
+    for b in buf[pos + 6:pos + 10]:
+        size = (size << 7) | (b & 0x7F)
+    footer = 10 if buf[pos + 5] & 0x10 else 0
+    return 10 + size + footer
+
+
+def is_info_frame(frame: AudioFrame, data) -> bool:
+    """True for the Xing/Info/VBRI header frame some encoders put first; it holds no audio."""
+    if frame.codec != "mp3":
+        return False
+    if frame.mpeg1:
+        side_info = 17 if frame.channels == 1 else 32
+    else:
+        side_info = 9 if frame.channels == 1 else 17
+    tag = bytes(data[4 + side_info:8 + side_info])
+    return tag in (b"Xing", b"Info") or bytes(data[36:40]) == b"VBRI"
+
+
+def iter_frames(buf, pos: int = 0, codec: str = None):
+    """
+    Yield (AudioFrame, offset) for each complete frame in buf from pos on.
+    ID3 tags, and bytes that do not parse as a frame (of `codec`, once known),
+    are skipped until the next valid sync word. Stops at the first incomplete
+    frame or tag, so a streaming caller can retry once more data has arrived.
+    """
+    while True:
+        tag = id3_tag_size(buf, pos)
+        if tag is not None:
+            if tag == 0 or len(buf) - pos < tag:
+                return  # wait for the rest of the tag
+            pos += tag
+            continue
+        if len(buf) - pos < 10:
+            return
+        frame = parse_frame_header(buf, pos)
+        if frame is None or (codec and frame.codec != codec):
+            nxt = buf.find(b"\xff", pos + 1)
+            if nxt == -1:
+                return
+            pos = nxt
+            continue
+        if len(buf) - pos < frame.length:
+            return  # partial frame
+        codec = frame.codec
+        yield frame, pos
+        pos += frame.length
+
+
+def audio_frames(data: bytes) -> bytes:
+    """Just the audio frames of an MP3/ADTS file: ID3 tags and a leading Xing/Info frame removed."""
+    out = bytearray()
+    for i, (frame, start) in enumerate(iter_frames(data)):
+        frame_bytes = data[start:start + frame.length]
+        if i == 0 and is_info_frame(frame, frame_bytes):
+            continue
+        out += frame_bytes
+    return bytes(out)
+
+
+def _syncsafe(n: int) -> bytes:
+    return bytes(((n >> 21) & 0x7F, (n >> 14) & 0x7F, (n >> 7) & 0x7F, n & 0x7F))
+
+
+def timestamp_tag(pts_90khz: int) -> bytes:
+    """ID3v2.4 tag with the HLS transportStreamTimestamp PRIV frame."""
+    payload = TIMESTAMP_OWNER + b"\x00" + struct.pack(">Q", pts_90khz & 0x1FFFFFFFF)
+    frame = b"PRIV" + _syncsafe(len(payload)) + b"\x00\x00" + payload
+    return b"ID3\x04\x00\x00" + _syncsafe(len(frame)) + frame
+
+
+def render_playlist(segments: list, playlist_type: str = "VOD", ended: bool = True,
+                    target_duration: float = None) -> bytes:
+    """
+    index.m3u8 for [(name, duration seconds), ...]. playlist_type "VOD" or "EVENT";
+    ended adds #EXT-X-ENDLIST. target_duration is the upper bound announced to
+    players (defaults to the longest segment).
+    """
+    longest = max([d for _, d in segments] + [target_duration or 0])
+    lines = [
+        "#EXTM3U",
+        "#EXT-X-VERSION:3",
+        f"#EXT-X-TARGETDURATION:{max(1, math.ceil(longest))}",
+        "#EXT-X-MEDIA-SEQUENCE:0",
+        f"#EXT-X-PLAYLIST-TYPE:{playlist_type}",
+    ]
+    for name, duration in segments:
+        lines.append(f"#EXTINF:{duration:.3f},")
+        lines.append(name)
+    if ended:
+        lines.append("#EXT-X-ENDLIST")
+    return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+class HlsSegmenter:
+    """
+    Incremental packager: feed() encoded audio as it arrives (whole file or
+    streaming chunks) and get back finished segments; flush() returns the last
+    one. Each segment is (name, bytes, duration seconds).
+
+        seg = HlsSegmenter()
+        for chunk in chunks:
+            for name, data, duration in seg.feed(chunk): ...
+        tail = seg.flush()
+        playlist = seg.playlist()
+
+    ID3 tags and the Xing/Info frame are dropped from the input (see iter_frames).
+    """
+
+    def __init__(self, target_duration: float = 4.0, name_pattern: str = "seg_{:03d}"):
+        self.target_duration = target_duration
+        self.name_pattern = name_pattern
+        self.segments = []  # [(name, duration)] for the playlist
+        self.codec = None
+        self._buf = bytearray()
+        self._frames = bytearray()
+        self._frame_samples = 0
+        self._sample_rate = None
+        self._samples_done = 0  # samples in segments already emitted
+        self._first_frame = True
+
+    # --- input ---
+
+    def feed(self, data: bytes) -> list:
+        self._buf += data
+        out = []
+        pos = 0
+        for frame, start in iter_frames(self._buf, codec=self.codec):
+            frame_bytes = self._buf[start:start + frame.length]
+            pos = start + frame.length
+            if self._first_frame:
+                self._first_frame = False
+                if is_info_frame(frame, frame_bytes):
+                    continue
+            self._add_frame(frame, frame_bytes, out)
+        del self._buf[:pos]
+        return out
+
+    def _add_frame(self, frame: AudioFrame, frame_bytes, out: list):
+        if self.codec is None:
+            self.codec = frame.codec
+            self._sample_rate = frame.sample_rate
+        # Cut before the frame that would take the segment past the target
+        if self._frame_samples and (self._frame_samples + frame.samples) / self._sample_rate > self.target_duration:
+            out.append(self._emit())
+        self._frames += frame_bytes
+        self._frame_samples += frame.samples
+
+    def flush(self) -> list:
+        """Emit whatever is buffered as the final (shorter) segment."""
+        if not self._frame_samples:
+            return []
+        return [self._emit()]
+
+    def _emit(self):
+        pts = self._samples_done * 90000 // self._sample_rate
+        duration = self._frame_samples / self._sample_rate
+        name = self.name_pattern.format(len(self.segments)) + self.extension
+        data = timestamp_tag(pts) + bytes(self._frames)
+        self.segments.append((name, duration))
+        self._samples_done += self._frame_samples
+        self._frames = bytearray()
+        self._frame_samples = 0
+        return name, data, duration
+
+    # --- output ---
+
+    @property
+    def extension(self) -> str:
+        return ".aac" if self.codec == "aac" else ".mp3"
+
+    @property
+    def total_duration(self) -> float:
+        return self._samples_done / self._sample_rate if self._sample_rate else 0.0
+
+    def playlist(self, playlist_type: str = "VOD", ended: bool = True) -> bytes:
+        return render_playlist(self.segments, playlist_type, ended)
+
+
+def segment_audio(data: bytes, target_duration: float = 4.0) -> list:
+    """
+    Drop-in for b2_uploader.convert_bytes_to_hls without FFmpeg: the encoded
+    MP3/ADTS bytes become [(file name, bytes), ...], segments first, index.m3u8 last.
+    """
+    seg = HlsSegmenter(target_duration=target_duration)
+    parts = seg.feed(data) + seg.flush()
+    if not parts:
+        raise RuntimeError("No MP3/ADTS audio frames found; cannot build HLS segments.")
+    files = [(name, payload) for name, payload, _ in parts]
+    files.append(("index.m3u8", seg.playlist()))
+    return files
@@ -0,0 +1,523 @@
+# pipeline/job_queue.py
+import math
+import os
+import socket
+import threading
+from datetime import timedelta
+
+import numpy as np
+
+from pipeline.config import Config
+from pipeline.db_pusher import BufferedArticleWriter, get_engine
+from pipeline.dedup import open_deduplicator
+from pipeline.journal import RESUMABLE_STAGES, article_key
+from pipeline.orchestrator import (
+    build_pipeline,
+    drop_already_in_db,
+    failure_record,
+    iter_csv_records,
+    journal_fields,
+    record_outcome,
+    success_record,
+)
+from pipeline.worker import new_job, resume_job
+from pipeline.ssml_lint import violation_totals
+from pipeline import artifacts, metrics
+from pipeline.log import get_logger
+
+# Distributed mode: articles are enqueued once into public.pipeline_jobs and any
+# number of worker processes, on any number of machines, claim them with
+# "SELECT ... FOR UPDATE SKIP LOCKED" under a lease. A worker renews the leases
+# of everything it holds every QUEUE_HEARTBEAT_SECONDS; when a node dies its
+# leases run out and the jobs are claimed again elsewhere. Each finished stage
+# is written to the job's progress, so the next owner continues after the last
+# stage whose output is shared (the SSML text, or the uploaded HLS playlist).
+#
+# Progress writes and failures are fenced on lease_owner: a node that lost a
+# lease cannot overwrite the new owner's state. Two nodes finishing the same
+# article is harmless (the article upsert on content_key keeps one row), it only
+# costs the duplicated Gemini/Azure work.
+
+log = get_logger(__name__)
+
+# Local paths that mean nothing to another node's worker stay out of the queue
+# progress (the run journal keeps them: it is only read on the same machine)
+_LOCAL_ONLY_FIELDS = ("audio_path",)
+
+
+def default_worker_id() -> str:
+    return Config.QUEUE_WORKER_ID or f"{socket.gethostname()}-{os.getpid()}"
+
+
+def ensure_queue_table(engine=None):
+    """Create public.pipeline_jobs (and its claim index) if it does not exist yet."""
+    from pipeline.db_schema import _metadata, pipeline_jobs_table
+
+    _metadata.create_all(engine or get_engine(), tables=[pipeline_jobs_table])
+
+
+def _json_safe(rec: dict) -> dict:
+    """CSV record -> JSONB-able dict: numpy rows/scalars to lists/numbers, NaN to null."""
+    safe = {}
+    for name, value in rec.items():
+        if hasattr(value, "tolist"):
+            value = value.tolist()
+        if isinstance(value, float) and math.isnan(value):
+            value = None
+        safe[name] = value
+    return safe
+
+
+class JobQueue:
+    """
+    The pipeline_jobs table seen from one worker (owner). Every method runs in
+    its own short transaction.
+    """
+
+    def __init__(self, owner: str = None, engine=None, lease_seconds: float = None, max_attempts: int = None):
+        self.owner = owner or default_worker_id()
+        self.engine = engine or get_engine()
+        self.lease = timedelta(seconds=lease_seconds or Config.QUEUE_LEASE_SECONDS)
+        self.max_attempts = max_attempts or Config.QUEUE_MAX_ATTEMPTS
+
+    def enqueue(self, records: list) -> int:
+        """Insert records that are not queued yet (by content key); returns how many were new."""
+        from sqlalchemy.dialects.postgresql import insert as pg_insert
+        from pipeline.db_schema import pipeline_jobs_table as jobs
+
+        # ON CONFLICT cannot touch the same row twice in one statement: last copy wins
+        rows = {}
+        for rec in records:
+            rows[article_key(rec)] = {"content_key": article_key(rec), "article": _json_safe(rec)}
+        if not rows:
+            return 0
+        stmt = (
+            pg_insert(jobs)
+            .values(list(rows.values()))
+            .on_conflict_do_nothing(index_elements=["content_key"])
+            .returning(jobs.c.content_key)
+        )
+        with self.engine.begin() as connection:
+            return len(connection.execute(stmt).all())
+
+    def claim(self, limit: int) -> list:
+        """
+        Lease up to `limit` jobs that are queued or whose lease has expired,
+        oldest first. Rows locked by a concurrent claim are skipped, not waited
+        for. Returns the claimed rows (content_key, article, progress, attempts).
+        """
+        from sqlalchemy import and_, func, or_, select, update
+        from pipeline.db_schema import pipeline_jobs_table as jobs
+
+        now = func.now()
+        with self.engine.begin() as connection:
+            # Leases that ran out too many times belong to articles that keep
+            # killing their worker; stop handing them out
+            connection.execute(
+                update(jobs)
+                .where(jobs.c.status == "leased")
+                .where(jobs.c.lease_expires_at < now)
+                .where(jobs.c.attempts >= self.max_attempts)
+                .values(status="failed", lease_owner=None, lease_expires_at=None, updated_at=now,
+                        error=f"lease expired {self.max_attempts} times")
+            )
+            claimable = (
+                select(jobs.c.content_key)
+                .where(or_(jobs.c.status == "queued",
+                           and_(jobs.c.status == "leased", jobs.c.lease_expires_at < now)))
+                .where(jobs.c.attempts < self.max_attempts)
+                .order_by(jobs.c.enqueued_at)
+                .limit(limit)
+                .with_for_update(skip_locked=True)
+            )
+            rows = connection.execute(
+                update(jobs)
+                .where(jobs.c.content_key.in_(claimable.scalar_subquery()))
+                .values(status="leased", lease_owner=self.owner, lease_expires_at=now + self.lease,
+                        attempts=jobs.c.attempts + 1, updated_at=now)
+                .returning(jobs.c.content_key, jobs.c.article, jobs.c.progress, jobs.c.attempts)
+            ).all()
+        for row in rows:
+            metrics.QUEUE_JOBS.inc(event="reclaimed" if row.attempts > 1 else "claimed")
+        return rows
+
+    def heartbeat(self, keys) -> set:
+        """Extend this owner's leases on keys; returns the keys whose lease is no longer ours."""
+        from sqlalchemy import func, update
+        from pipeline.db_schema import pipeline_jobs_table as jobs
+
+        keys = set(keys)
+        if not keys:
+            return set()
+        now = func.now()
+        with self.engine.begin() as connection:
+            renewed = connection.execute(
+                update(jobs)
+                .where(jobs.c.content_key.in_(list(keys)))
+                .where(jobs.c.lease_owner == self.owner)
+                .where(jobs.c.status == "leased")
+                .values(lease_expires_at=now + self.lease, updated_at=now)
+                .returning(jobs.c.content_key)
+            ).scalars().all()
+        return keys - set(renewed)
+
+    def record_progress(self, key: str, progress: dict) -> bool:
+        """Store the job's progress; False if the lease is no longer ours."""
+        from sqlalchemy import func, update
+        from pipeline.db_schema import pipeline_jobs_table as jobs
+
+        with self.engine.begin() as connection:
+            result = connection.execute(
+                update(jobs)
+                .where(jobs.c.content_key == key)
+                .where(jobs.c.lease_owner == self.owner)
+                .where(jobs.c.status == "leased")
+                .values(progress=progress, updated_at=func.now())
+            )
+        return result.rowcount > 0
+
+    def complete(self, keys: list):
+        """Mark jobs done once their article is in the DB (whoever holds the lease now)."""
+        from sqlalchemy import func, update
+        from pipeline.db_schema import pipeline_jobs_table as jobs
+
+        if not keys:
+            return
+        with self.engine.begin() as connection:
+            connection.execute(
+                update(jobs)
+                .where(jobs.c.content_key.in_(list(keys)))
+                .where(jobs.c.status != "done")
+                .values(status="done", lease_owner=None, lease_expires_at=None,
+                        failed_stage=None, error=None, updated_at=func.now())
+            )
+        metrics.QUEUE_JOBS.inc(len(keys), event="done")
+
+    def fail(self, key: str, stage: str, error: str):
+        """Mark a job failed after its stage retries ran out (only while the lease is ours)."""
+        from sqlalchemy import func, update
+        from pipeline.db_schema import pipeline_jobs_table as jobs
+
+        with self.engine.begin() as connection:
+            connection.execute(
+                update(jobs)
+                .where(jobs.c.content_key == key)
+                .where(jobs.c.lease_owner == self.owner)
+                .where(jobs.c.status == "leased")
+                .values(status="failed", lease_owner=None, lease_expires_at=None,
+                        failed_stage=stage, error=(error or "")[:2000], updated_at=func.now())
+            )
+        metrics.QUEUE_JOBS.inc(event="failed")
+
+    def release(self, keys) -> int:
+        """Give unfinished jobs back to the queue on shutdown, without counting the attempt."""
+        from sqlalchemy import func, update
+        from pipeline.db_schema import pipeline_jobs_table as jobs
+
+        keys = list(keys)
+        if not keys:
+            return 0
+        with self.engine.begin() as connection:
+            result = connection.execute(
+                update(jobs)
+                .where(jobs.c.content_key.in_(keys))
+                .where(jobs.c.lease_owner == self.owner)
+                .where(jobs.c.status == "leased")
+                .values(status="queued", lease_owner=None, lease_expires_at=None,
+                        attempts=jobs.c.attempts - 1, updated_at=func.now())
+            )
+        metrics.QUEUE_JOBS.inc(result.rowcount, event="released")
+        return result.rowcount
+
+    def requeue_failed(self) -> int:
+        """Put every failed job back in the queue with a fresh attempt budget."""
+        from sqlalchemy import func, update
+        from pipeline.db_schema import pipeline_jobs_table as jobs
+
+        with self.engine.begin() as connection:
+            result = connection.execute(
+                update(jobs)
+                .where(jobs.c.status == "failed")
+                .values(status="queued", attempts=0, failed_stage=None, error=None, updated_at=func.now())
+            )
+        return result.rowcount
+
+    def counts(self) -> dict:
+        """{status: jobs}, with expired leases counted separately."""
+        from sqlalchemy import case, func, select
+        from pipeline.db_schema import pipeline_jobs_table as jobs
+
+        status = case(
+            ((jobs.c.status == "leased") & (jobs.c.lease_expires_at < func.now()), "lease_expired"),
+            else_=jobs.c.status,
+        )
+        with self.engine.connect() as connection:
+            rows = connection.execute(select(status, func.count()).group_by(status)).all()
+        return {row[0]: row[1] for row in rows}
+
+
+def enqueue_csv(csv_path: str, chunk_size: int = None, retry_failed: bool = False) -> dict:
+    """Stream the CSV into the queue, DB_BATCH_SIZE rows per INSERT. Re-enqueueing is a no-op."""
+    chunk_size = chunk_size or Config.DB_BATCH_SIZE
+    ensure_queue_table()
+    queue = JobQueue()
+    summary = {"csv": csv_path, "articles": 0, "enqueued": 0}
+    if retry_failed:
+        summary["requeued_failed"] = queue.requeue_failed()
+    batch = []
+    for rec in iter_csv_records(csv_path, chunk_size):
+        batch.append(rec)
+        if len(batch) >= chunk_size:
+            summary["enqueued"] += queue.enqueue(batch)
+            summary["articles"] += len(batch)
+            batch = []
+    if batch:
+        summary["enqueued"] += queue.enqueue(batch)
+        summary["articles"] += len(batch)
+    summary["already_queued"] = summary["articles"] - summary["enqueued"]
+    summary["queue"] = queue.counts()
+    log.info("📥 Enqueued %d of %d articles from %s.", summary["enqueued"], summary["articles"], csv_path)
+    return summary
+
+
+# --- worker ---
+
+def job_from_row(row) -> tuple:
+    """(job, progress) for a claimed row, resumed after its last shared stage."""
+    article = dict(row.article)
+    if isinstance(article.get("embedding"), list):
+        # Dedup expects the float32 row iter_csv_records produces
+        article["embedding"] = np.asarray(article["embedding"], dtype=np.float32)
+    job = new_job(article)
+    progress = dict(row.progress or {})
+    progress["completed"] = set(progress.get("completed", []))
+    if progress["completed"]:
+        resume_job(job, progress)
+        if not job.get("completed_stages") and progress.get("ssml"):
+            # Another node made the SSML; its local SSML cache is not ours
+            job["ssml"] = progress["ssml"]
+            job["ssml_hash"] = progress.get("ssml_hash")
+            job["completed_stages"] = ["ssml"]
+    return job, progress
+
+
+class _LeaseKeeper:
+    """
+    The jobs this worker holds, their progress, and a thread renewing their
+    leases every QUEUE_HEARTBEAT_SECONDS.
+    """
+
+    def __init__(self, queue: JobQueue, interval: float = None):
+        self.queue = queue
+        self.interval = interval or Config.QUEUE_HEARTBEAT_SECONDS
+        self._lock = threading.Lock()
+        self._progress = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name="queue-heartbeat", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def hold(self, key: str, progress: dict):
+        with self._lock:
+            self._progress[key] = progress
+
+    def drop(self, keys):
+        with self._lock:
+            for key in keys:
+                self._progress.pop(key, None)
+
+    def held(self) -> list:
+        with self._lock:
+            return list(self._progress)
+
+    def on_stage_complete(self, job: dict, stage_name: str):
+        """StagedPipeline hook: store what the finished stage left behind in the job's progress."""
+        if stage_name not in RESUMABLE_STAGES:
+            return
+        with self._lock:
+            progress = self._progress.get(job["key"])
+            if progress is None:
+                return
+            progress["completed"].add(stage_name)
+            progress.update({name: value for name, value in journal_fields(job, stage_name).items()
+                             if name not in _LOCAL_ONLY_FIELDS})
+            if stage_name == "ssml" and job.get("ssml"):
+                # The SSML itself, so a node without this one's cache can skip Gemini
+                progress["ssml"] = job["ssml"]
+            snapshot = dict(progress, completed=sorted(progress["completed"]))
+        try:
+            if not self.queue.record_progress(job["key"], snapshot):
+                log.warning("⚠️ Lease on '%s' is gone; its progress was not recorded.", job["key"][:12])
+        except Exception as e:
+            log.warning("⚠️ Could not record progress of '%s' after stage '%s': %s", job["key"][:12], stage_name, e)
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            try:
+                lost = self.queue.heartbeat(self.held())
+            except Exception as e:
+                # Keep going: the lease only needs one renewal before it runs out
+                log.warning("⚠️ Lease heartbeat failed: %s", e)
+                continue
+            if lost:
+                metrics.QUEUE_JOBS.inc(len(lost), event="lease_lost")
+                log.warning("⚠️ Lost the lease on %d jobs; another worker may be redoing them.", len(lost))
+
+
+def _take_slots(in_flight: threading.Semaphore, want: int, stop: threading.Event) -> int:
+    """Block for one free in-flight slot, then take up to want-1 more that are free right now."""
+    while not in_flight.acquire(timeout=1.0):
+        if stop.is_set():
+            return 0
+    taken = 1
+    while taken < want and in_flight.acquire(blocking=False):
+        taken += 1
+    return taken
+
+
+def _claim_loop(engine, queue: JobQueue, keeper: _LeaseKeeper, in_flight: threading.Semaphore,
+                counter: dict, deduper, stop: threading.Event, drain: bool):
+    try:
+        while not stop.is_set():
+            slots = _take_slots(in_flight, Config.QUEUE_CLAIM_BATCH, stop)
+            if not slots:
+                break
+            try:
+                rows = queue.claim(slots)
+                claimed = True
+            except Exception as e:
+                log.warning("⚠️ Claiming jobs failed (%s); retrying in %.0fs.", e, Config.QUEUE_IDLE_WAIT)
+                rows, claimed = [], False
+            for _ in range(slots - len(rows)):
+                in_flight.release()
+            if not rows:
+                # A failed claim does not mean the queue is empty
+                if drain and claimed:
+                    log.info("🏁 Queue drained.")
+                    break
+                stop.wait(Config.QUEUE_IDLE_WAIT)
+                continue
+
+            jobs = []
+            for row in rows:
+                job, progress = job_from_row(row)
+                keeper.hold(job["key"], progress)
+                jobs.append(job)
+            counter["claimed"] += len(jobs)
+            counter["fed"] += len(jobs)
+
+            remaining = drop_already_in_db(jobs, counter)
+            if len(remaining) < len(jobs):
+                stored = {job["key"] for job in jobs} - {job["key"] for job in remaining}
+                queue.complete(list(stored))
+                keeper.drop(stored)
+            batch = deduper.route(remaining) if deduper is not None else remaining
+            # Held-back near-duplicates finish with their leader and take no slot
+            for _ in range(len(jobs) - len(batch)):
+                in_flight.release()
+            for job in batch:
+                metrics.IN_FLIGHT.inc()
+                engine.submit(job)
+    finally:
+        engine.close()
+
+
+def run_queue_worker(drain: bool = False, stop: threading.Event = None, owner: str = None):
+    """
+    Claim and process jobs from public.pipeline_jobs until `stop` is set (or,
+    with drain=True, until nothing is claimable). Uses the same staged engine,
+    DB writer, pre-check and dedup as run_pipeline_from_csv; instead of the
+    run journal, stage progress goes to the queue row, and a job is done once
+    its article is in the DB.
+
+    On the way out, jobs this worker still holds are given back to the queue.
+    """
+    stop = stop or threading.Event()
+    failures = []
+    num_success = 0
+    counter = {"fed": 0, "claimed": 0, "already_in_db": 0}
+    in_flight = threading.Semaphore(Config.MAX_IN_FLIGHT)
+
+    ensure_queue_table()
+    queue = JobQueue(owner)
+    keeper = _LeaseKeeper(queue).start()
+    log.info("🛠️ Queue worker %s started (lease %.0fs).", queue.owner, queue.lease.total_seconds())
+
+    def on_flushed(records, article_ids):
+        keys = [rec["pipeline_key"] for rec in records]
+        try:
+            queue.complete(keys)
+        except Exception as e:
+            # The lease runs out and the next owner finds the article in the DB
+            log.warning("⚠️ Could not mark %d jobs done: %s", len(keys), e)
+        keeper.drop(keys)
+
+    exporter = metrics.MetricsExporter().start()
+    deduper = open_deduplicator()
+    engine = build_pipeline(on_stage_complete=keeper.on_stage_complete).start()
+    writer = BufferedArticleWriter(on_flushed=on_flushed)
+    claimer = threading.Thread(
+        target=_claim_loop,
+        args=(engine, queue, keeper, in_flight, counter, deduper, stop, drain),
+        name="queue-claimer",
+        daemon=True,
+    )
+    claimer.start()
+
+    try:
+        for job in engine.results():
+            in_flight.release()
+            metrics.IN_FLIGHT.dec()
+            followers = deduper.settle(job) if deduper is not None else []
+            for finished in [job] + followers:
+                record_outcome(finished)
+                if finished.get("success"):
+                    writer.add(success_record(finished))
+                    num_success += 1
+                    continue
+                failures.append(failure_record(finished))
+                try:
+                    queue.fail(finished["key"], finished.get("failed_stage"), finished.get("error"))
+                except Exception as e:
+                    log.warning("⚠️ Could not mark job '%s' failed: %s", finished["key"][:12], e)
+                keeper.drop([finished["key"]])
+    finally:
+        stop.set()
+        writer.close()
+        for failure in writer.failures:
+            key = failure["record"].get("pipeline_key")
+            try:
+                queue.fail(key, "db", failure["error"])
+            except Exception as e:
+                log.warning("⚠️ Could not mark job '%s' failed: %s", (key or "")[:12], e)
+            keeper.drop([key])
+        keeper.stop()
+        try:
+            released = queue.release(keeper.held())
+            if released:
+                log.info("↩️ Gave %d unfinished jobs back to the queue.", released)
+        except Exception as e:
+            log.warning("⚠️ Could not release leases (%s); they expire in %.0fs.", e, queue.lease.total_seconds())
+        artifacts.flush()
+        exporter.stop()
+    claimer.join()
+
+    failures.extend(writer.failures)
+    return {
+        "worker": queue.owner,
+        "num_claimed": counter["claimed"],
+        "num_already_in_db": counter["already_in_db"],
+        "num_success_audio": num_success,
+        "num_failures": len(failures),
+        "failures": failures,
+        "ssml_repairs": violation_totals(),
+        "duplicates": deduper.stats() if deduper is not None else None,
+        "metrics": metrics.REGISTRY.snapshot(),
+        "inserted_article_ids": writer.inserted_ids,
+    }
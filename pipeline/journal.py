@@ -0,0 +1,125 @@
+# pipeline/journal.py
+import json
+import os
+import pathlib
+import threading
+import time
+
+from pipeline.cache import content_hash
+from pipeline.log import get_logger
+
+log = get_logger(__name__)
+
+# Stages that leave something durable behind and can be skipped on --resume.
+# "hls" only produces a temp dir, so it is redone whenever "upload" is not done.
+RESUMABLE_STAGES = ("ssml", "tts", "upload", "db")
+
+
+def _normalized(row: dict, *names) -> str:
+    """First non-empty field among names, lowercased with whitespace collapsed ("" if none)."""
+    for name in names:
+        value = row.get(name)
+        if value is None or (isinstance(value, float) and value != value):  # None / NaN
+            continue
+        text = " ".join(str(value).split()).lower()
+        if text:
+            return text
+    return ""
+
+
+def article_key(row: dict) -> str:
+    """
+    Stable content key of an article (normalized title + source + text). The
+    same story pulled twice gets the same key, in the journal, in the B2 path
+    and in the DB's content_key column.
+    """
+    return content_hash(
+        _normalized(row, "title"),
+        _normalized(row, "news_source", "source"),
+        _normalized(row, "description", "content"),
+    )
+
+
+class RunJournal:
+    """
+    Append-only JSONL log of stage completions, one line per event:
+
+        {"key": "<article key>", "stage": "tts", "ts": 1731300000.0, "audio_path": "..."}
+
+    Every line is flushed and fsync'd before record() returns, so after a crash
+    the journal holds every stage that finished. A torn last line is ignored
+    when loading.
+    """
+
+    def __init__(self, path: str, resume: bool = False):
+        self.path = pathlib.Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        # A fresh run starts a fresh journal; --resume keeps appending to the old one
+        if not resume and self.path.exists() and self.path.stat().st_size > 0:
+            self._rotate()
+        self._file = open(self.path, "a" if resume else "w", encoding="utf-8")
+        if resume and self._file.tell() > 0:
+            # Terminate a torn last line so the next event starts on its own line
+            with open(self.path, "rb") as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    self._file.write("\n")
+
+    def _rotate(self):
+        """Move the previous run's journal aside instead of truncating it."""
+        unfinished = sum(1 for state in RunJournal.load(self.path).values() if "db" not in state["completed"])
+        rotated = self.path.with_name(f"{self.path.name}.{time.strftime('%Y%m%d-%H%M%S')}")
+        n = 1
+        while rotated.exists():
+            rotated = self.path.with_name(f"{self.path.name}.{time.strftime('%Y%m%d-%H%M%S')}.{n}")
+            n += 1
+        os.replace(self.path, rotated)
+        if unfinished:
+            log.warning(
+                "⚠️ The previous journal has %d unfinished articles; kept it as %s "
+                "(continue it with --journal %s --resume).", unfinished, rotated, rotated,
+            )
+        else:
+            log.info("🗂️ Previous journal kept as %s", rotated)
+
+    def record(self, key: str, stage: str, **fields):
+        line = json.dumps({"key": key, "stage": stage, "ts": time.time(), **fields}, default=str)
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def close(self):
+        with self._lock:
+            if not self._file.closed:
+                self._file.close()
+
+    @staticmethod
+    def load(path: str) -> dict:
+        """
+        Fold the journal into {key: state}, where state holds "completed" (set of
+        stage names) plus the latest fields recorded for that article.
+        """
+        states = {}
+        if not os.path.exists(path):
+            return states
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    event = json.loads(line)
+                except json.JSONDecodeError:
+                    # Torn write from a crash; everything before it is intact
+                    continue
+                key = event.pop("key", None)
+                stage = event.pop("stage", None)
+                if not key or not stage:
+                    continue
+                state = states.setdefault(key, {"completed": set()})
+                state["completed"].add(stage)
+                event.pop("ts", None)
+                state.update(event)
+        return states
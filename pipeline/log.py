@@ -0,0 +1,65 @@
+# pipeline/log.py
+import atexit
+import logging
+import logging.handlers
+import queue
+import sys
+import threading
+
+from pipeline.config import Config
+
+# Leveled logging for the pipeline. Worker threads only put records on an
+# in-memory queue (QueueHandler); one listener thread formats them and does the
+# actual stream/file writes, so a slow terminal or disk never stalls a stage.
+# Nothing is configured on import: entry points (run_pipeline.py, the benchmark)
+# call setup_logging(), and an app embedding the pipeline keeps its own setup.
+
+ROOT = "newspods"
+FORMAT = "%(asctime)s %(levelname)-7s [%(threadName)s] %(name)s: %(message)s"
+
+_listener = None
+_setup_lock = threading.Lock()
+
+
+def setup_logging(level: str = None, log_file: str = None):
+    """
+    Route the "newspods" loggers through a queue to stderr (and LOG_FILE). Idempotent.
+    Records still propagate, so handlers on the root logger see them too.
+    """
+    global _listener
+    with _setup_lock:
+        if _listener is not None:
+            return
+        handlers = [logging.StreamHandler(sys.stderr)]
+        log_file = log_file or Config.LOG_FILE
+        if log_file:
+            handlers.append(logging.FileHandler(log_file, encoding="utf-8"))
+        formatter = logging.Formatter(FORMAT)
+        for handler in handlers:
+            handler.setFormatter(formatter)
+
+        log_queue = queue.SimpleQueue()
+        root = logging.getLogger(ROOT)
+        root.setLevel((level or Config.LOG_LEVEL).upper())
+        root.addHandler(logging.handlers.QueueHandler(log_queue))
+
+        _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+        _listener.start()
+        atexit.register(shutdown_logging)
+
+
+def shutdown_logging():
+    """Flush queued records and stop the listener thread."""
+    global _listener
+    with _setup_lock:
+        if _listener is None:
+            return
+        _listener.stop()
+        _listener = None
+        for handler in logging.getLogger(ROOT).handlers[:]:
+            logging.getLogger(ROOT).removeHandler(handler)
+
+
+def get_logger(name: str) -> logging.Logger:
+    """Logger for a pipeline module, e.g. get_logger(__name__) -> "newspods.worker"."""
+    return logging.getLogger(f"{ROOT}.{name.rsplit('.', 1)[-1]}")
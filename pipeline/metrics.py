@@ -0,0 +1,362 @@
+# pipeline/metrics.py
+import bisect
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from pipeline.config import Config
+from pipeline.log import get_logger
+
+log = get_logger(__name__)
+
+# Minimal Prometheus-style instrumentation (counters, gauges, histograms with
+# labels) rendered in the text exposition format. Everything is in-process and
+# lock-protected, so the stage threads, executors and the event loop can all
+# record into the same registry.
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+def _label_text(names: tuple, values: tuple) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(
+        '%s="%s"' % (n, str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for n, v in zip(names, values)
+    )
+    return "{" + pairs + "}"
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels: dict) -> tuple:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.append(f"{self.name}{_label_text(self.labelnames, key)} {_number(value)}")
+        return lines
+
+    def snapshot(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        if not self.labelnames:
+            return items[0][1] if items else 0
+        return {"/".join(key): value for key, value in items}
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # per-bucket counts (last one is +Inf), sum, count
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][bisect.bisect_left(self.buckets, value)] += 1
+            state[1] += value
+            state[2] += 1
+
+    def time(self, **labels):
+        """Context manager observing the wall time of its block."""
+        return _Timer(self, labels)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        names = self.labelnames + ("le",)
+        with self._lock:
+            items = sorted((key, [list(state[0]), state[1], state[2]]) for key, state in self._values.items())
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                cumulative += n
+                lines.append(f"{self.name}_bucket{_label_text(names, key + (_number(bound),))} {cumulative}")
+            lines.append(f"{self.name}_sum{_label_text(self.labelnames, key)} {_number(total)}")
+            lines.append(f"{self.name}_count{_label_text(self.labelnames, key)} {count}")
+        return lines
+
+    def _quantile(self, counts: list, count: int, q: float) -> float:
+        """Estimate from the buckets (linear within a bucket), as histogram_quantile does."""
+        rank = q * count
+        cumulative = 0
+        for i, n in enumerate(counts):
+            if n and cumulative + n >= rank:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                if i == len(self.buckets):
+                    return lower  # +Inf bucket: the best we can say is "above the top bound"
+                return lower + (self.buckets[i] - lower) * (rank - cumulative) / n
+            cumulative += n
+        return 0.0
+
+    def snapshot(self):
+        with self._lock:
+            items = sorted((key, [list(state[0]), state[1], state[2]]) for key, state in self._values.items())
+        out = {}
+        for key, (counts, total, count) in items:
+            out["/".join(key) or "all"] = {
+                "count": count,
+                "mean": round(total / count, 4) if count else 0.0,
+                "p50": round(self._quantile(counts, count, 0.50), 4),
+                "p95": round(self._quantile(counts, count, 0.95), 4),
+                "p99": round(self._quantile(counts, count, 0.99), 4),
+            }
+        return out
+
+
+class _Timer:
+    def __init__(self, histogram: Histogram, labels: dict):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.histogram.observe(time.perf_counter() - self._start, **self.labels)
+        return False
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+
+    def _get(self, cls, name, documentation, labelnames, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, documentation, labelnames, **kwargs)
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames=()) -> Counter:
+        return self._get(Counter, name, documentation, labelnames)
+
+    def gauge(self, name: str, documentation: str, labelnames=()) -> Gauge:
+        return self._get(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name: str, documentation: str, labelnames=(), buckets=LATENCY_BUCKETS) -> Histogram:
+        return self._get(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def render(self) -> str:
+        """Prometheus text exposition format."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> dict:
+        """JSON-friendly view for the run summary (histograms as count/mean/p50/p95/p99)."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {metric.name: metric.snapshot() for metric in metrics}
+
+
+REGISTRY = Registry()
+
+# --- pipeline metrics ---
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "newspods_stage_seconds", "Time spent in one stage call (a whole batch for batched SSML).", ["stage"])
+STAGE_ERRORS = REGISTRY.counter(
+    "newspods_stage_errors_total", "Failed stage attempts by cause.", ["stage", "cause"])
+STAGE_RETRIES = REGISTRY.counter(
+    "newspods_stage_retries_total", "Stage attempts scheduled again after a failure.", ["stage"])
+QUEUE_DEPTH = REGISTRY.gauge(
+    "newspods_stage_queue_depth", "Jobs waiting in a stage's input queue.", ["stage"])
+STAGE_ACTIVE = REGISTRY.gauge(
+    "newspods_stage_active", "Stage calls currently running.", ["stage"])
+IN_FLIGHT = REGISTRY.gauge(
+    "newspods_articles_in_flight", "Articles submitted and not yet finished.")
+ARTICLES = REGISTRY.counter(
+    "newspods_articles_total", "Finished articles by outcome.", ["outcome"])
+
+SERVICE_SECONDS = REGISTRY.histogram(
+    "newspods_service_call_seconds", "Latency of calls to an external service.", ["service"])
+SERVICE_WAIT_SECONDS = REGISTRY.histogram(
+    "newspods_service_wait_seconds", "Time spent waiting for a rate-limiter slot.", ["service"])
+SERVICE_ERRORS = REGISTRY.counter(
+    "newspods_service_errors_total", "Failed calls to an external service by cause.", ["service", "cause"])
+SERVICE_ACTIVE = REGISTRY.gauge(
+    "newspods_service_active", "Calls to an external service currently running.", ["service"])
+
+GEMINI_CHARS = REGISTRY.counter(
+    "newspods_gemini_prompt_chars_total", "Prompt characters sent to Gemini.")
+GEMINI_TOKENS = REGISTRY.counter(
+    "newspods_gemini_tokens_total", "Tokens reported by Gemini.", ["kind"])
+TTS_BYTES = REGISTRY.counter(
+    "newspods_tts_audio_bytes_total", "Audio bytes synthesized by Azure.")
+UPLOAD_BYTES = REGISTRY.counter(
+    "newspods_upload_bytes_total", "Bytes uploaded to B2.")
+UPLOAD_OBJECTS = REGISTRY.counter(
+    "newspods_upload_objects_total", "Objects uploaded to B2.")
+DB_ROWS = REGISTRY.counter(
+    "newspods_db_rows_total", "Article rows written to the DB.")
+DB_BATCH_SECONDS = REGISTRY.histogram(
+    "newspods_db_batch_seconds", "Time to write one batch of articles.")
+DB_ERRORS = REGISTRY.counter(
+    "newspods_db_errors_total", "Failed DB batch writes by cause.", ["cause"])
+QUEUE_JOBS = REGISTRY.counter(
+    "newspods_queue_jobs_total",
+    "Distributed queue events on this node (claimed, reclaimed, done, failed, lease_lost, released).",
+    ["event"])
+
+
+def error_cause(exc: BaseException) -> str:
+    """Coarse error label: throttled, timeout, auth, or the exception class name."""
+    # rate_limit records into this module, so import it here rather than at the top
+    from pipeline.rate_limit import is_throttle_error
+
+    if is_throttle_error(exc):
+        return "throttled"
+    text = f"{type(exc).__name__} {exc}".lower()
+    if isinstance(exc, TimeoutError) or "timeout" in text or "timed out" in text:
+        return "timeout"
+    if "unauthorized" in text or "401" in text or "403" in text or "authtoken" in text:
+        return "auth"
+    return type(exc).__name__
+
+
+def record_gemini_usage(response, prompt_chars: int):
+    GEMINI_CHARS.inc(prompt_chars)
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None:
+        return
+    for kind, attr in (("prompt", "prompt_token_count"), ("output", "candidates_token_count")):
+        value = getattr(usage, attr, None)
+        if isinstance(value, (int, float)):
+            GEMINI_TOKENS.inc(value, kind=kind)
+
+
+# --- exposure ---
+
+def write_metrics_file(path: str = None):
+    """Write the text format to METRICS_FILE (atomically, for node_exporter's textfile collector)."""
+    path = path or Config.METRICS_FILE
+    if not path:
+        return
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(REGISTRY.render())
+    os.replace(tmp, path)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?", 1)[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = REGISTRY.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # scrapes every few seconds would drown the run output
+
+
+class MetricsExporter:
+    """
+    Serves /metrics on METRICS_PORT and/or rewrites METRICS_FILE every
+    METRICS_FILE_INTERVAL seconds while a run is going; stop() writes the
+    file one last time.
+    """
+
+    def __init__(self, port: int = None, path: str = None, interval: float = None):
+        self.port = Config.METRICS_PORT if port is None else port
+        self.path = Config.METRICS_FILE if path is None else path
+        self.interval = interval or Config.METRICS_FILE_INTERVAL
+        self._server = None
+        self._stop = threading.Event()
+        self._writer = None
+
+    def start(self):
+        if self.port:
+            try:
+                self._server = ThreadingHTTPServer(("0.0.0.0", self.port), _MetricsHandler)
+                self._server.daemon_threads = True
+                threading.Thread(target=self._server.serve_forever, name="metrics-http", daemon=True).start()
+                log.info("📈 Metrics on http://0.0.0.0:%d/metrics", self.port)
+            except OSError as e:
+                log.warning("⚠️ Could not serve metrics on port %d: %s", self.port, e)
+                self._server = None
+        if self.path:
+            self._writer = threading.Thread(target=self._write_loop, name="metrics-file", daemon=True)
+            self._writer.start()
+        return self
+
+    def _write_loop(self):
+        while not self._stop.wait(self.interval):
+            self._write()
+
+    def _write(self):
+        try:
+            write_metrics_file(self.path)
+        except OSError as e:
+            log.warning("⚠️ Could not write metrics to %s: %s", self.path, e)
+
+    def stop(self):
+        self._stop.set()
+        if self._writer is not None:
+            self._writer.join()
+        if self.path:
+            self._write()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
@@ -1,54 +1,301 @@
 # pipeline/orchestrator.py
-import pandas as pd
-from concurrent.futures import ThreadPoolExecutor, as_completed
 from pipeline.config import Config
-from pipeline.worker import process_single_article
-from pipeline.db_pusher import push_articles_to_db
+from pipeline.stages import Stage, StagedPipeline
+from pipeline.worker import (
+    new_job,
+    resume_job,
+    stage_generate_ssml,
+    stage_generate_ssml_batch,
+    stage_synthesize,
+    stage_convert_hls,
+    stage_upload_hls,
+    stage_stream_to_hls,
+    cleanup_job,
+)
+from pipeline.db_pusher import BufferedArticleWriter, existing_articles
+from pipeline.journal import RunJournal, RESUMABLE_STAGES
+from pipeline.ssml_lint import violation_totals
+from pipeline.embeddings import parse_embeddings
+from pipeline.dedup import open_deduplicator
+from pipeline import artifacts, metrics
+from pipeline.log import get_logger
 import threading
-import time
 
-sem = threading.Semaphore(Config.RATE_LIMIT_CONCURRENCY)
+log = get_logger(__name__)
 
-def _worker_wrapper(row_dict):
-    with sem:
-        return process_single_article(row_dict, attempt_limit=Config.MAX_RETRIES)
 
-def run_pipeline_from_csv(csv_path: str, chunk_size: int = 50):
+def journal_fields(job: dict, stage_name: str) -> dict:
+    """What each stage leaves behind that a resumed run can pick up."""
+    if stage_name == "ssml":
+        return {"ssml_hash": job.get("ssml_hash"), "hls_prefix": job.get("hls_prefix")}
+    if stage_name == "tts":
+        return {"audio_path": job.get("audio_path")}
+    if stage_name == "upload":
+        audio = job.get("audio", {})
+        return {
+            "hls_prefix": audio.get("hls_prefix"),
+            "hls_playlist_object": audio.get("hls_playlist_object"),
+            "segment_count": audio.get("segment_count"),
+        }
+    return {}
+
+
+def build_pipeline(journal: RunJournal = None, on_stage_complete=None) -> StagedPipeline:
+    """
+    SSML (Gemini) -> TTS (Azure) -> HLS (FFmpeg) -> upload (B2), each stage with
+    its own queue, worker count and retries. Each service stage sits behind its
+    own circuit breaker; the service calls themselves go through the per-service
+    adaptive limiters in pipeline.rate_limit.
+
+    on_stage_complete(job, stage_name) overrides the default of journaling
+    each resumable stage (the distributed queue records progress in the DB).
+    """
+    if Config.GEMINI_BATCH_SIZE > 1:
+        # Several short articles per Gemini request (RPM-bound, not token-bound)
+        ssml_stage = Stage("ssml", stage_generate_ssml_batch, workers=Config.SSML_WORKERS, service="gemini",
+                           batch_size=Config.GEMINI_BATCH_SIZE, batch_wait=Config.GEMINI_BATCH_WAIT)
+    else:
+        ssml_stage = Stage("ssml", stage_generate_ssml, workers=Config.SSML_WORKERS, service="gemini")
+    if Config.HLS_STREAMING:
+        # TTS -> segments -> B2 in one stage. It is named "upload" because that is
+        # what it finishes, so the journal and --resume treat it like the 3-stage path.
+        stages = [
+            ssml_stage,
+            Stage("upload", stage_stream_to_hls, workers=Config.TTS_WORKERS, service="azure"),
+        ]
+    else:
+        stages = [
+            ssml_stage,
+            Stage("tts", stage_synthesize, workers=Config.TTS_WORKERS, service="azure"),
+            Stage("hls", stage_convert_hls, workers=Config.HLS_WORKERS),
+            Stage("upload", stage_upload_hls, workers=Config.UPLOAD_WORKERS, service="b2"),
+        ]
+
+    if on_stage_complete is None and journal is not None:
+        def on_stage_complete(job, stage_name):
+            if stage_name in RESUMABLE_STAGES:
+                journal.record(job["key"], stage_name, **journal_fields(job, stage_name))
+
+    return StagedPipeline(stages, cleanup=cleanup_job, on_stage_complete=on_stage_complete)
+
+
+def iter_csv_records(csv_path: str, chunk_size: int = 50):
+    """
+    Stream article records from the CSV, reading chunk_size rows at a time.
+    Each chunk's embedding strings are parsed into one float32 matrix and every
+    record carries its row (or None) instead of the text.
+    """
+    import pandas as pd
+
+    for chunk in pd.read_csv(csv_path, chunksize=chunk_size):
+        # Normalize expected column names
+        chunk.rename(columns={'content': 'description', 'source': 'news_source'}, inplace=True)
+        if 'embedding' not in chunk.columns:
+            yield from chunk.to_dict('records')
+            continue
+        matrix, valid = parse_embeddings(chunk['embedding'].tolist())
+        records = chunk.drop(columns=['embedding']).to_dict('records')
+        for rec, row, ok in zip(records, matrix, valid):
+            rec['embedding'] = row if ok else None
+        yield from records
+
+
+def prepare_job(rec: dict, resume_state: dict, counter: dict):
+    """New job for a CSV record, resumed from the journal state; None if already in the DB."""
+    counter["fed"] += 1
+    job = new_job(rec)
+    state = resume_state.get(job["key"])
+    if state is not None:
+        if "db" in state["completed"]:
+            # Finished end to end in an earlier run
+            counter["already_done"] += 1
+            metrics.ARTICLES.inc(outcome="already_done")
+            return None
+        resume_job(job, state)
+    return job
+
+
+def open_journal(journal_path: str = None, resume: bool = False):
+    """(journal to append to, {key: state} from the previous run when resuming)."""
+    journal_path = journal_path or Config.JOURNAL_PATH
+    resume_state = RunJournal.load(journal_path) if resume else {}
+    if resume:
+        log.info("⏯️ Resuming from %s (%d articles with progress).", journal_path, len(resume_state))
+    return RunJournal(journal_path, resume=resume), resume_state
+
+
+def journal_db_callback(journal: RunJournal):
+    """BufferedArticleWriter on_flushed hook that journals the 'db' stage."""
+    def on_flushed(records, article_ids):
+        for rec, article_id in zip(records, article_ids):
+            journal.record(rec["pipeline_key"], "db", article_id=article_id)
+    return on_flushed
+
+
+def success_record(job: dict) -> dict:
+    """Article row + audio key, ready for the DB writer."""
+    # append audio metadata and content into a record to insert into DB.
+    rec = job["article_row"].copy()
+    # attach audio URL / key (we store object_name)
+    rec["audio_url"] = job["audio"]["hls_playlist_object"]
+    rec["pipeline_key"] = job["key"]
+    rec["content_key"] = job["key"]
+    return rec
+
+
+def record_outcome(job: dict):
+    if job.get("duplicate_of"):
+        outcome = "duplicate" if job.get("success") else "duplicate_failed"
+    else:
+        outcome = "success" if job.get("success") else "failed"
+    metrics.ARTICLES.inc(outcome=outcome)
+    artifacts.capture(job)
+
+
+def failure_record(job: dict) -> dict:
+    return {
+        "record": job["article_row"],
+        "error": job.get("error"),
+        "stage": job.get("failed_stage"),
+    }
+
+
+def drop_already_in_db(batch: list, counter: dict) -> list:
+    """
+    One bulk lookup of the batch's content keys; articles that are already in
+    the DB with audio are dropped before any Gemini/Azure/B2 work.
+    """
+    if not Config.DB_PRECHECK or not batch:
+        return batch
+    try:
+        found = existing_articles({job["key"] for job in batch})
+    except Exception as e:
+        # The upsert on content_key still keeps the table free of duplicates
+        log.warning("⚠️ DB pre-check failed (%s); processing the batch anyway.", e)
+        return batch
+    remaining = []
+    for job in batch:
+        row = found.get(job["key"])
+        if row is not None and row["audio_key"]:
+            counter["already_in_db"] += 1
+            metrics.ARTICLES.inc(outcome="already_in_db")
+        else:
+            remaining.append(job)
+    return remaining
+
+
+def iter_job_batches(records, resume_state: dict, counter: dict, batch_size: int, deduper=None):
+    """
+    Jobs to run, batch_size records at a time. Each batch is checked against
+    the DB first, then (with a deduplicator) routed so near-duplicates skip
+    the expensive stages.
+    """
+    def _ready(batch):
+        batch = drop_already_in_db(batch, counter)
+        return deduper.route(batch) if deduper is not None else batch
+
+    batch = []
+    for rec in records:
+        job = prepare_job(rec, resume_state, counter)
+        if job is not None:
+            batch.append(job)
+        if len(batch) >= batch_size:
+            yield _ready(batch)
+            batch = []
+    if batch:
+        yield _ready(batch)
+
+
+def _feed(engine: StagedPipeline, batches, in_flight: threading.Semaphore, errors: list):
+    """
+    Submit every job, then close the engine. An error reading the CSV is kept
+    in `errors` for the caller to re-raise: closing the engine alone would end
+    the run as if the input had been complete.
+    """
+    try:
+        for batch in batches:
+            for job in batch:
+                # Cap how many records are held in memory across all stages
+                in_flight.acquire()
+                metrics.IN_FLIGHT.inc()
+                engine.submit(job)
+    except Exception as e:
+        log.error("❌ Reading the input failed; finishing the articles already submitted: %s", e)
+        errors.append(e)
+    finally:
+        engine.close()
+
+
+def run_pipeline_from_csv(csv_path: str, chunk_size: int = 50, resume: bool = False, journal_path: str = None):
     """
     csv must have columns like: title, description (or content), source (or news_source), topic (optional), published_date (optional)
+
+    With DEDUP_ENABLED, near-duplicate articles reuse the audio of the first copy
+    (see pipeline.dedup) instead of being synthesized again.
+
+    The CSV is streamed chunk_size rows at a time, at most MAX_IN_FLIGHT articles are
+    in the pipeline at once, and successes are flushed to the DB every DB_FLUSH_EVERY
+    articles or DB_FLUSH_INTERVAL seconds.
+
+    Every finished stage is appended to the run journal (JOURNAL_PATH). With
+    resume=True the previous journal is read first: articles already in the DB
+    are skipped and the rest continue after their last finished stage.
     Returns: dict with lists of success/failure and DB insertion ids
     """
-    df = pd.read_csv(csv_path)
-    # Normalize expected column names
-    df.rename(columns={'content': 'description', 'source': 'news_source'}, inplace=True)
-    records = df.to_dict('records')
-    successes = []
     failures = []
-    with ThreadPoolExecutor(max_workers=Config.MAX_WORKERS) as ex:
-        futures = {ex.submit(_worker_wrapper, rec): rec for rec in records}
-        for fut in as_completed(futures):
-            res = fut.result()
-            if res.get("success"):
-                # append audio metadata and content into a record to later insert into DB.
-                rec = res["article_row"].copy()
-                # attach audio URL / key (we store object_name)
-                rec["audio_url"] = res["audio"]["hls_playlist_object"]
-                successes.append(rec)
-            else:
-                failures.append({"record": res["article_row"], "error": res.get("error")})
-
-    # Push successes to DB as a batch DataFrame
-    success_df = pd.DataFrame(successes)
-    inserted_ids = []
-    if not success_df.empty:
-        inserted_ids = push_articles_to_db(success_df)
+    num_success = 0
+    counter = {"fed": 0, "already_done": 0, "already_in_db": 0}
+    in_flight = threading.Semaphore(Config.MAX_IN_FLIGHT)
+
+    exporter = metrics.MetricsExporter().start()
+    journal, resume_state = open_journal(journal_path, resume)
+    deduper = open_deduplicator()
+    engine = build_pipeline(journal).start()
+    writer = BufferedArticleWriter(on_flushed=journal_db_callback(journal))
+    batches = iter_job_batches(iter_csv_records(csv_path, chunk_size), resume_state, counter, chunk_size, deduper)
+    # Submitting blocks on the first stage's bounded queue, so feed from a thread
+    feed_errors = []
+    feeder = threading.Thread(
+        target=_feed,
+        args=(engine, batches, in_flight, feed_errors),
+        name="feeder",
+        daemon=True,
+    )
+    feeder.start()
 
+    try:
+        for job in engine.results():
+            in_flight.release()
+            metrics.IN_FLIGHT.dec()
+            # Near-duplicates held back for this article finish with it
+            followers = deduper.settle(job) if deduper is not None else []
+            for finished in [job] + followers:
+                record_outcome(finished)
+                if finished.get("success"):
+                    writer.add(success_record(finished))
+                    num_success += 1
+                else:
+                    failures.append(failure_record(finished))
+    finally:
+        writer.close()
+        journal.close()
+        artifacts.flush()
+        exporter.stop()
+    feeder.join()
+    if feed_errors:
+        # Everything submitted is finished and flushed; the input was not complete
+        raise feed_errors[0]
+
+    failures.extend(writer.failures)
     return {
-        "num_total": len(records),
-        "num_success_audio": len(successes),
+        "num_total": counter["fed"],
+        "num_already_done": counter["already_done"],
+        "num_already_in_db": counter["already_in_db"],
+        "num_success_audio": num_success,
         "num_failures": len(failures),
         "failures": failures,
-        "inserted_article_ids": inserted_ids
+        "ssml_repairs": violation_totals(),
+        "duplicates": deduper.stats() if deduper is not None else None,
+        "metrics": metrics.REGISTRY.snapshot(),
+        "inserted_article_ids": writer.inserted_ids
     }
-
-print("Orchestrator module loaded.")
\ No newline at end of file
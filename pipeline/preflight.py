@@ -0,0 +1,118 @@
+# pipeline/preflight.py
+import math
+
+from pipeline.config import Config
+from pipeline.journal import RunJournal, RESUMABLE_STAGES, article_key
+from pipeline.orchestrator import iter_csv_records
+
+# Checks behind the fast run_pipeline.py subcommands (validate, dry-run, config).
+# They read the CSV and the journal only: no Gemini, Azure, B2 or DB calls, and
+# none of the cloud SDKs get imported.
+
+SECRET_SETTINGS = ("GOOGLE_API_KEY", "AZURE_SPEECH_KEY", "B2_KEY_ID", "B2_APP_KEY", "COCKROACHDB_CONN_STRING")
+
+
+def _text(rec: dict, *names) -> str:
+    for name in names:
+        value = rec.get(name)
+        if isinstance(value, str) and value.strip():
+            return value.strip()
+    return ""
+
+
+def validate_csv(csv_path: str, chunk_size: int = 500) -> dict:
+    """
+    Read the whole CSV the way a run would and report what would go wrong:
+    missing columns, rows without a title or text, repeated articles and
+    embeddings that do not parse. "ok" is False when a run would fail or
+    produce empty audio.
+    """
+    report = {
+        "csv": csv_path,
+        "rows": 0,
+        "missing_columns": [],
+        "rows_without_title": 0,
+        "rows_without_text": 0,
+        "repeated_articles": 0,
+        "rows_without_embedding": 0,
+    }
+    seen = set()
+    columns = set()
+    for rec in iter_csv_records(csv_path, chunk_size):
+        report["rows"] += 1
+        columns.update(rec)
+        if not _text(rec, "title"):
+            report["rows_without_title"] += 1
+        if not _text(rec, "description"):
+            report["rows_without_text"] += 1
+        if "embedding" in rec and rec["embedding"] is None:
+            report["rows_without_embedding"] += 1
+        key = article_key(rec)
+        if key in seen:
+            report["repeated_articles"] += 1
+        seen.add(key)
+
+    # iter_csv_records already maps content -> description and source -> news_source
+    report["missing_columns"] = [c for c in ("title", "description", "news_source") if c not in columns]
+    report["ok"] = (
+        report["rows"] > 0
+        and not {"title", "description"} & set(report["missing_columns"])
+        and report["rows_without_text"] == 0
+    )
+    return report
+
+
+def dry_run(csv_path: str, resume: bool = False, journal_path: str = None, chunk_size: int = 500) -> dict:
+    """
+    What a run over csv_path would do, without doing it: how many articles
+    are new, already finished or resumable from the journal (with resume),
+    and roughly how much Gemini and Azure work that is. Articles already in
+    the DB are not looked up, so they still count as work here.
+    """
+    journal_path = journal_path or Config.JOURNAL_PATH
+    resume_state = RunJournal.load(journal_path) if resume else {}
+    plan = {
+        "csv": csv_path,
+        "journal": journal_path if resume else None,
+        "articles": 0,
+        "repeated_in_csv": 0,
+        "already_done": 0,
+        "resume_after": {stage: 0 for stage in RESUMABLE_STAGES if stage != "db"},
+        "to_process": 0,
+        "text_chars": 0,
+    }
+    seen = set()
+    for rec in iter_csv_records(csv_path, chunk_size):
+        plan["articles"] += 1
+        key = article_key(rec)
+        if key in seen:
+            # Same content key: the DB upsert keeps one row for both
+            plan["repeated_in_csv"] += 1
+        seen.add(key)
+        completed = resume_state.get(key, {}).get("completed", set())
+        if "db" in completed:
+            plan["already_done"] += 1
+            continue
+        last = [stage for stage in RESUMABLE_STAGES if stage in completed]
+        if last:
+            plan["resume_after"][last[-1]] += 1
+        plan["to_process"] += 1
+        plan["text_chars"] += len(_text(rec, "title")) + len(_text(rec, "description"))
+
+    fresh = plan["to_process"] - sum(plan["resume_after"].values())
+    plan["gemini_requests"] = math.ceil(fresh / max(1, Config.GEMINI_BATCH_SIZE))
+    plan["tts_articles"] = fresh + plan["resume_after"]["ssml"]
+    return plan
+
+
+def effective_config() -> dict:
+    """Every Config setting as the pipeline sees it (.env applied), secrets masked."""
+    settings = {}
+    for name in sorted(vars(Config)):
+        if not name.isupper():
+            continue
+        value = getattr(Config, name)
+        if name in SECRET_SETTINGS:
+            value = "***" if value else None
+        settings[name] = value
+    return settings
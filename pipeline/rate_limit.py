@@ -0,0 +1,199 @@
+# pipeline/rate_limit.py
+import threading
+import time
+
+from pipeline.config import Config
+from pipeline import metrics, tracing
+from pipeline.log import get_logger
+
+log = get_logger(__name__)
+
+# Substrings that mark an error as "slow down" rather than a real failure
+_THROTTLE_MARKERS = (
+    "429",
+    "too many requests",
+    "toomanyrequests",
+    "resource exhausted",
+    "resourceexhausted",
+    "quota",
+    "rate limit",
+    "ratelimit",
+    "throttl",
+)
+
+
+def is_throttle_error(exc: BaseException) -> bool:
+    """True if the exception looks like a 429 / quota / throttling response."""
+    for attr in ("code", "status_code", "status"):
+        value = getattr(exc, attr, None)
+        if value == 429 or str(value) == "429":
+            return True
+    text = f"{type(exc).__name__} {exc}".lower()
+    return any(marker in text for marker in _THROTTLE_MARKERS)
+
+
+class AdaptiveLimiter:
+    """
+    Per-service limiter: a concurrency cap plus an optional token bucket for
+    requests per minute. Both limits adapt AIMD-style: halved when the service
+    reports throttling, then raised a little with every successful call until
+    they are back at the configured maximum.
+
+    Use as a context manager around the actual service call:
+
+        with get_limiter("gemini"):
+            model.generate_content(prompt)
+    """
+
+    # Ignore further throttle signals for this long after a decrease, so one
+    # burst of 429s from the same window only halves the limits once.
+    COOLDOWN_SECONDS = 2.0
+
+    def __init__(self, name: str, max_concurrency: int, rate_per_minute: float = 0, min_concurrency: int = 1):
+        self.name = name
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.min_concurrency = max(1, min(int(min_concurrency), self.max_concurrency))
+        self.max_rate = float(rate_per_minute or 0) / 60.0  # tokens per second, 0 = unlimited
+        self._cond = threading.Condition()
+        self._limit = float(self.max_concurrency)
+        self._rate = self.max_rate
+        self._tokens = max(1.0, self.max_rate)  # allow up to one second of burst
+        self._refilled_at = time.monotonic()
+        self._in_flight = 0
+        self._last_decrease = 0.0
+        self._local = threading.local()
+
+    # --- introspection ---
+
+    @property
+    def limit(self) -> int:
+        with self._cond:
+            return int(self._limit)
+
+    @property
+    def rate_per_minute(self) -> float:
+        with self._cond:
+            return self._rate * 60.0
+
+    @property
+    def in_flight(self) -> int:
+        with self._cond:
+            return self._in_flight
+
+    # --- acquire / release ---
+
+    def _refill(self, now: float):
+        if self._rate > 0:
+            capacity = max(1.0, self._rate)
+            self._tokens = min(capacity, self._tokens + (now - self._refilled_at) * self._rate)
+        self._refilled_at = now
+
+    def _try_acquire(self) -> float:
+        """Take a slot (and a token) if possible. Returns 0 on success, else seconds to wait."""
+        now = time.monotonic()
+        self._refill(now)
+        if self._in_flight >= int(self._limit):
+            return 0.05  # woken early by release()
+        if self._rate > 0 and self._tokens < 1.0:
+            return (1.0 - self._tokens) / self._rate
+        if self._rate > 0:
+            self._tokens -= 1.0
+        self._in_flight += 1
+        return 0.0
+
+    def acquire(self):
+        with self._cond:
+            while True:
+                wait = self._try_acquire()
+                if wait == 0.0:
+                    return
+                self._cond.wait(wait)
+
+    def release(self):
+        with self._cond:
+            self._in_flight = max(0, self._in_flight - 1)
+            self._cond.notify()
+
+    # --- AIMD feedback ---
+
+    def on_success(self):
+        with self._cond:
+            # Additive increase: roughly +1 slot per `limit` successful calls
+            self._limit = min(float(self.max_concurrency), self._limit + 1.0 / max(1.0, self._limit))
+            if self.max_rate > 0:
+                self._rate = min(self.max_rate, self._rate + self.max_rate * 0.02)
+            self._cond.notify()
+
+    def on_throttle(self):
+        with self._cond:
+            now = time.monotonic()
+            if now - self._last_decrease < self.COOLDOWN_SECONDS:
+                return
+            self._last_decrease = now
+            # Multiplicative decrease
+            self._limit = max(float(self.min_concurrency), self._limit / 2.0)
+            if self.max_rate > 0:
+                self._rate = max(self.max_rate * 0.05, self._rate / 2.0)
+                self._tokens = min(self._tokens, 0.0)
+            log.warning("🐢 '%s' is throttling: limit %d concurrent, %.0f req/min.",
+                        self.name, int(self._limit), self._rate * 60)
+
+    def begin(self) -> float:
+        """
+        Take a slot for one call and return its start time. end() gives the slot
+        back and may run on another thread (e.g. an SDK completion callback).
+        """
+        waited_from = time.perf_counter()
+        self.acquire()
+        started = time.perf_counter()
+        metrics.SERVICE_WAIT_SECONDS.observe(started - waited_from, service=self.name)
+        if started - waited_from > 0.001:
+            tracing.record(f"wait {self.name}", "limiter", waited_from, started)
+        metrics.SERVICE_ACTIVE.inc(service=self.name)
+        return started
+
+    def end(self, started: float, exc: BaseException = None):
+        self.release()
+        ended = time.perf_counter()
+        metrics.SERVICE_ACTIVE.dec(service=self.name)
+        metrics.SERVICE_SECONDS.observe(ended - started, service=self.name)
+        tracing.record(self.name, "service", started, ended, ok=exc is None)
+        if exc is None:
+            self.on_success()
+        else:
+            metrics.SERVICE_ERRORS.inc(service=self.name, cause=metrics.error_cause(exc))
+            if is_throttle_error(exc):
+                self.on_throttle()
+
+    def __enter__(self):
+        # Per-thread start time: the same limiter is entered by many threads at once
+        self._local.started = self.begin()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.end(self._local.started, exc)
+        return False
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def _limits_for(service: str):
+    """(max concurrency, requests/min) for each known service."""
+    if service == "gemini":
+        return Config.GEMINI_CONCURRENCY, Config.GEMINI_RPM
+    if service == "azure":
+        return Config.AZURE_CONCURRENCY, Config.AZURE_RPM
+    if service == "b2":
+        return Config.B2_CONCURRENCY, 0
+    return Config.RATE_LIMIT_CONCURRENCY, 0
+
+
+def get_limiter(service: str) -> AdaptiveLimiter:
+    """Process-wide limiter for a service name ("gemini", "azure", "b2")."""
+    with _limiters_lock:
+        if service not in _limiters:
+            concurrency, rpm = _limits_for(service)
+            _limiters[service] = AdaptiveLimiter(service, concurrency, rate_per_minute=rpm)
+        return _limiters[service]
@@ -0,0 +1,146 @@
+# pipeline/retry.py
+import heapq
+import itertools
+import queue
+import random
+import threading
+import time
+
+from pipeline.config import Config
+from pipeline.log import get_logger
+
+log = get_logger(__name__)
+
+
+def backoff_delay(attempt: int, base: float = None, cap: float = None) -> float:
+    """
+    Exponential backoff with jitter: somewhere between half and all of base ** attempt,
+    capped at RETRY_MAX_BACKOFF. The jitter keeps failed articles from retrying in lockstep.
+    """
+    base = Config.RETRY_BACKOFF_BASE if base is None else base
+    cap = Config.RETRY_MAX_BACKOFF if cap is None else cap
+    delay = min(cap, base ** attempt)
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+class RetryScheduler:
+    """
+    Delayed retry queue. Failed jobs are parked here instead of sleeping inside a
+    worker (and its concurrency slot), then put back on their stage queue when due.
+    """
+
+    def __init__(self):
+        self._heap = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._stopped = False
+        self._thread = threading.Thread(target=self._loop, name="retry-scheduler", daemon=True)
+        self._thread.start()
+
+    def schedule(self, delay: float, target_queue: queue.Queue, item):
+        """Put item on target_queue after delay seconds (never blocks the caller)."""
+        with self._cond:
+            heapq.heappush(self._heap, (time.monotonic() + delay, next(self._seq), target_queue, item))
+            self._cond.notify()
+
+    def pending(self) -> int:
+        with self._cond:
+            return len(self._heap)
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                while not self._stopped and (not self._heap or self._heap[0][0] > time.monotonic()):
+                    timeout = self._heap[0][0] - time.monotonic() if self._heap else None
+                    self._cond.wait(timeout)
+                if self._stopped:
+                    return
+                due, _, target_queue, item = heapq.heappop(self._heap)
+            try:
+                target_queue.put_nowait(item)
+            except queue.Full:
+                # Stage is saturated; try again shortly rather than blocking other retries
+                self.schedule(0.1, target_queue, item)
+
+
+class CircuitBreaker:
+    """
+    Per-service breaker. After `failure_threshold` consecutive failures the circuit
+    opens and no new calls are attempted for `reset_timeout` seconds; then a single
+    trial call is let through (half-open) and its outcome closes or re-opens it.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, failure_threshold: int = None, reset_timeout: float = None):
+        self.name = name
+        self.failure_threshold = failure_threshold or Config.BREAKER_FAILURE_THRESHOLD
+        self.reset_timeout = reset_timeout or Config.BREAKER_RESET_SECONDS
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state
+
+    def allow(self) -> bool:
+        """True if a call may be attempted now."""
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self._state = self.HALF_OPEN
+                self._trial_in_flight = False
+            if self._state == self.HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def retry_after(self) -> float:
+        """Seconds until the breaker will let a trial call through."""
+        with self._lock:
+            if self._state != self.OPEN:
+                return 1.0
+            return max(0.1, self.reset_timeout - (time.monotonic() - self._opened_at))
+
+    def record_success(self):
+        with self._lock:
+            if self._state != self.CLOSED:
+                log.info("🟢 Circuit '%s' closed again.", self.name)
+            self._state = self.CLOSED
+            self._failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    log.warning("🔴 Circuit '%s' open after %d failures; pausing calls for %.0fs.",
+                                self.name, self._failures, self.reset_timeout)
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+                self._trial_in_flight = False
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(service: str) -> CircuitBreaker:
+    """Process-wide breaker for a service name ("gemini", "azure", "b2", ...)."""
+    with _breakers_lock:
+        if service not in _breakers:
+            _breakers[service] = CircuitBreaker(service)
+        return _breakers[service]
@@ -1,35 +1,55 @@
 # pipeline/ssml_creator.py
-import os
+import json
 import re
+import threading
 import xml.etree.ElementTree as ET
 
 from pipeline.config import Config
-from dotenv import load_dotenv
-import google.generativeai as genai
+from pipeline.cache import DiskCache, content_hash
+from pipeline.rate_limit import get_limiter
+from pipeline.ssml_lint import lint_ssml
+from pipeline import metrics
+from pipeline.log import get_logger
 
-load_dotenv()
-
-if Config.GOOGLE_API_KEY:
-    genai.configure(api_key=Config.GOOGLE_API_KEY)
+log = get_logger(__name__)
 
 MODEL_NAME = "models/gemini-2.5-flash"  # change if you have another model
 
+# Bump whenever build_prompt (or the post-processing) changes so cached SSML
+# from the old version is not reused
+PROMPT_VERSION = "2"
 
-def build_prompt(
-    article_text: str,
-    voice1: str = "en-IN-NeerjaNeural",
-    voice2: str = "en-IN-PrabhatNeural",
-    pacing: str = "medium",
-) -> str:
-    """
-    Build a strict prompt so the model stops generating SSML that Azure rejects.
-    """
-    prompt = f"""
-You are an SSML generator that turns a news article into a podcast-style script with two speakers.
+_ssml_cache = None
+_ssml_cache_lock = threading.Lock()
+
+_model = None
+_model_lock = threading.Lock()
 
-Your response MUST obey ALL of the following:
 
-1) Output ONLY valid SSML. No markdown, no backticks, no commentary.
+def get_ssml_cache():
+    """Process-wide SSML cache, or None when SSML_CACHE_ENABLED is off."""
+    global _ssml_cache
+    if not Config.SSML_CACHE_ENABLED:
+        return None
+    with _ssml_cache_lock:
+        if _ssml_cache is None:
+            _ssml_cache = DiskCache(
+                Config.SSML_CACHE_DIR,
+                max_bytes=Config.SSML_CACHE_MAX_MB * 1024 * 1024,
+                max_age_seconds=Config.SSML_CACHE_MAX_AGE_DAYS * 86400,
+                suffix=".xml",
+            )
+        return _ssml_cache
+
+
+def ssml_cache_key(article_text: str, voice1: str, voice2: str, pacing: str) -> str:
+    """Everything that changes the generated SSML goes into the key."""
+    return content_hash(article_text, voice1, voice2, pacing, MODEL_NAME, PROMPT_VERSION)
+
+
+def _ssml_rules(voice1: str, voice2: str, pacing: str) -> str:
+    """The numbered SSML rules shared by the single and batched prompts."""
+    return f"""1) Output ONLY valid SSML. No markdown, no backticks, no commentary.
 2) Wrap the entire response in a single root element:
    <speak version="1.0" xmlns="http://www.w3.org/2001/10/synthesis" xml:lang="en-IN"> ... </speak>
 3) Use EXACTLY these two voices, alternating between them:
@@ -43,7 +63,24 @@ Your response MUST obey ALL of the following:
 7) Ensure ALL XML tags are properly closed:
    - Every <voice> has a matching </voice>
    - Every <prosody>, <emphasis>, <p>, etc. is properly closed
-8) The script should sound conversational and be a summary of the article, not a verbatim readout.
+8) The script should sound conversational and be a summary of the article, not a verbatim readout."""
+
+
+def build_prompt(
+    article_text: str,
+    voice1: str = "en-IN-NeerjaNeural",
+    voice2: str = "en-IN-PrabhatNeural",
+    pacing: str = "medium",
+) -> str:
+    """
+    Build a strict prompt so the model stops generating SSML that Azure rejects.
+    """
+    prompt = f"""
+You are an SSML generator that turns a news article into a podcast-style script with two speakers.
+
+Your response MUST obey ALL of the following:
+
+{_ssml_rules(voice1, voice2, pacing)}
 
 Return ONLY the SSML.
 
@@ -53,6 +90,38 @@ Article:
     return prompt
 
 
+def build_batch_prompt(
+    article_texts: list,
+    voice1: str = "en-IN-NeerjaNeural",
+    voice2: str = "en-IN-PrabhatNeural",
+    pacing: str = "medium",
+) -> str:
+    """
+    One prompt for several articles. The model answers with a JSON array holding
+    one SSML document per article, in the same order.
+    """
+    articles = "\n\n".join(
+        f"<<<ARTICLE {i}>>>\n{text}\n<<<END ARTICLE {i}>>>" for i, text in enumerate(article_texts, start=1)
+    )
+    prompt = f"""
+You are an SSML generator that turns news articles into podcast-style scripts with two speakers.
+
+You will receive {len(article_texts)} articles, each between <<<ARTICLE n>>> and <<<END ARTICLE n>>>.
+Write one separate script per article.
+
+Every script MUST obey ALL of the following:
+
+{_ssml_rules(voice1, voice2, pacing)}
+
+Respond with a JSON array of exactly {len(article_texts)} strings and nothing else.
+Element n of the array is the complete <speak>...</speak> document for ARTICLE n.
+
+Articles:
+{articles}
+"""
+    return prompt
+
+
 def clean_ssml(raw: str) -> str:
     """
     Post-process the model output so Azure doesn't die on stupid formatting issues.
@@ -89,12 +158,54 @@ def validate_ssml(ssml: str) -> None:
         raise RuntimeError(f"Invalid SSML XML produced by LLM: {e}")
 
 
-def call_llm_to_ssml(prompt: str) -> str:
+def repair_ssml(
+    ssml: str,
+    voice1: str = "en-IN-NeerjaNeural",
+    voice2: str = "en-IN-PrabhatNeural",
+    pacing: str = "medium",
+) -> str:
+    """
+    Run the SSML linter (pipeline.ssml_lint) so rule violations Azure would
+    reject are fixed here instead of costing another Gemini + Azure attempt.
+    """
+    if not Config.SSML_LINT_ENABLED:
+        return ssml
+    fixed, violations = lint_ssml(ssml, voice1, voice2, pacing)
+    if violations:
+        summary = ", ".join(f"{rule}={n}" for rule, n in sorted(violations.items()))
+        log.info("🩹 Repaired SSML locally: %s", summary)
+    return fixed
+
+
+def get_model():
+    """
+    GenerativeModel for MODEL_NAME, built once and shared by all threads.
+    google.generativeai is imported and configured here, on the first Gemini
+    call, rather than when the module is imported.
+    """
+    global _model
+    with _model_lock:
+        if _model is None:
+            import google.generativeai as genai
+            if Config.GOOGLE_API_KEY:
+                genai.configure(api_key=Config.GOOGLE_API_KEY)
+            _model = genai.GenerativeModel(MODEL_NAME)
+        return _model
+
+
+def call_llm_to_ssml(
+    prompt: str,
+    voice1: str = "en-IN-NeerjaNeural",
+    voice2: str = "en-IN-PrabhatNeural",
+    pacing: str = "medium",
+) -> str:
     if not Config.GOOGLE_API_KEY:
         raise RuntimeError("GOOGLE_API_KEY not set.")
 
-    model = genai.GenerativeModel(MODEL_NAME)
-    response = model.generate_content(prompt)
+    model = get_model()
+    with get_limiter("gemini"):
+        response = model.generate_content(prompt)
+    metrics.record_gemini_usage(response, len(prompt))
 
     if not response.text:
         raise RuntimeError("LLM returned empty SSML response.")
@@ -102,19 +213,164 @@ def call_llm_to_ssml(prompt: str) -> str:
     raw_ssml = response.text
     ssml = clean_ssml(raw_ssml)
     validate_ssml(ssml)  # will raise if badly formed XML
+    ssml = repair_ssml(ssml, voice1, voice2, pacing)
 
     return ssml
 
 
+def cached_ssml_for(
+    article_text: str,
+    voice1: str = "en-IN-NeerjaNeural",
+    voice2: str = "en-IN-PrabhatNeural",
+    pacing: str = "medium",
+):
+    """SSML already generated for these inputs, or None (never calls Gemini)."""
+    cache = get_ssml_cache()
+    if cache is None:
+        return None
+    return cache.get_text(ssml_cache_key(article_text, voice1, voice2, pacing))
+
+
 def article_to_double_ssml(
     article_text: str,
     voice1: str = "en-IN-NeerjaNeural",
     voice2: str = "en-IN-PrabhatNeural",
     pacing: str = "medium",
 ) -> str:
+    cache = get_ssml_cache()
+    key = ssml_cache_key(article_text, voice1, voice2, pacing)
+    if cache is not None:
+        cached = cache.get_text(key)
+        if cached:
+            log.debug("♻️ SSML cache hit (%s)", key[:12])
+            return cached
+
     prompt = build_prompt(article_text, voice1, voice2, pacing)
-    ssml = call_llm_to_ssml(prompt)
+    ssml = call_llm_to_ssml(prompt, voice1, voice2, pacing)
+
+    if cache is not None:
+        cache.set_text(key, ssml)
     return ssml
 
 
-print("SSML Creator module loaded.")
+def call_llm_to_ssml_batch(
+    prompt: str,
+    expected: int,
+    voice1: str = "en-IN-NeerjaNeural",
+    voice2: str = "en-IN-PrabhatNeural",
+    pacing: str = "medium",
+) -> list:
+    """
+    Send a batch prompt and return one entry per article: the validated SSML,
+    or the exception explaining why that article's document was unusable.
+    Only a failure of the request itself (429, 5xx, timeout) raises; a reply
+    that cannot be parsed counts as leaving every document out.
+    """
+    if not Config.GOOGLE_API_KEY:
+        raise RuntimeError("GOOGLE_API_KEY not set.")
+
+    model = get_model()
+    with get_limiter("gemini"):
+        response = model.generate_content(
+            prompt,
+            generation_config={"response_mime_type": "application/json"},
+        )
+    metrics.record_gemini_usage(response, len(prompt))
+
+    if not response.text:
+        return [RuntimeError("LLM returned empty batch response.")] * expected
+
+    try:
+        documents = json.loads(clean_json(response.text))
+    except json.JSONDecodeError as e:
+        return [RuntimeError(f"LLM batch response is not valid JSON: {e}")] * expected
+    if not isinstance(documents, list):
+        return [RuntimeError("LLM batch response is not a JSON array.")] * expected
+
+    results = []
+    for i in range(expected):
+        if i >= len(documents) or not isinstance(documents[i], str):
+            results.append(RuntimeError(f"LLM batch response has no SSML for article {i + 1}."))
+            continue
+        try:
+            ssml = clean_ssml(documents[i])
+            validate_ssml(ssml)
+            results.append(repair_ssml(ssml, voice1, voice2, pacing))
+        except Exception as e:
+            results.append(e)
+    return results
+
+
+def clean_json(raw: str) -> str:
+    """Strip ```json fences the model sometimes adds despite the JSON mime type."""
+    text = raw.strip()
+    if text.startswith("```"):
+        text = re.sub(r"^```[a-zA-Z0-9]*\s*", "", text)
+        text = re.sub(r"\s*```$", "", text).strip()
+    return text
+
+
+def articles_to_double_ssml_batch(
+    article_texts: list,
+    voice1: str = "en-IN-NeerjaNeural",
+    voice2: str = "en-IN-PrabhatNeural",
+    pacing: str = "medium",
+    batch_size: int = None,
+    max_chars: int = None,
+) -> list:
+    """
+    SSML for many articles with as few Gemini requests as possible.
+
+    Cache hits are served first. Remaining articles up to max_chars long are packed
+    batch_size at a time into one request; longer ones, and any article whose
+    document the batch response left out or that fails validate_ssml, go
+    through article_to_double_ssml on their own.
+
+    A failed batch request (429, 5xx, timeout) raises, so the SSML stage
+    retries the whole batch and the gemini breaker sees the failure; documents
+    already generated are in the cache by then.
+
+    Returns a list aligned with article_texts holding SSML strings, or the
+    exception for articles that could not be generated.
+    """
+    batch_size = batch_size or Config.GEMINI_BATCH_SIZE
+    max_chars = max_chars or Config.GEMINI_BATCH_MAX_CHARS
+    cache = get_ssml_cache()
+    results = [None] * len(article_texts)
+
+    batchable, single = [], []
+    for i, text in enumerate(article_texts):
+        key = ssml_cache_key(text, voice1, voice2, pacing)
+        cached = cache.get_text(key) if cache is not None else None
+        if cached:
+            results[i] = cached
+        elif batch_size > 1 and len(text) <= max_chars:
+            batchable.append(i)
+        else:
+            single.append(i)
+
+    for start in range(0, len(batchable), batch_size):
+        group = batchable[start:start + batch_size]
+        if len(group) == 1:
+            single.extend(group)
+            continue
+        prompt = build_batch_prompt([article_texts[i] for i in group], voice1, voice2, pacing)
+        documents = call_llm_to_ssml_batch(prompt, len(group), voice1, voice2, pacing)
+        for i, doc in zip(group, documents):
+            if isinstance(doc, Exception):
+                log.warning("⚠️ Batched SSML for article %d rejected (%s); retrying it on its own.", i, doc)
+                single.append(i)
+                continue
+            results[i] = doc
+            if cache is not None:
+                cache.set_text(ssml_cache_key(article_texts[i], voice1, voice2, pacing), doc)
+        log.debug("📦 Batched SSML: %d/%d articles from one Gemini request.",
+                  len(group) - sum(isinstance(d, Exception) for d in documents), len(group))
+
+    for i in single:
+        try:
+            results[i] = article_to_double_ssml(article_texts[i], voice1, voice2, pacing)
+        except Exception as e:
+            results[i] = e
+    return results
+
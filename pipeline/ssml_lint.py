@@ -0,0 +1,321 @@
+# pipeline/ssml_lint.py
+import re
+import threading
+import xml.etree.ElementTree as ET
+from collections import Counter
+
+# Rule-based checks for the SSML rules build_prompt asks Gemini to follow, with
+# deterministic repairs. Everything fixed here is a Gemini + Azure round trip
+# (and a backoff sleep) that the retry loop no longer has to spend.
+
+SSML_NS = "http://www.w3.org/2001/10/synthesis"
+MSTTS_NS = "http://www.w3.org/2001/mstts"
+XML_LANG = "{http://www.w3.org/XML/1998/namespace}lang"
+
+ET.register_namespace("", SSML_NS)
+ET.register_namespace("mstts", MSTTS_NS)
+
+# Elements Azure accepts inside <speak> (mstts:* extensions are always allowed)
+SUPPORTED_TAGS = {
+    "speak", "voice", "prosody", "break", "emphasis", "p", "s", "say-as", "sub",
+    "phoneme", "audio", "lang", "lexicon", "bookmark",
+}
+
+_RATE_WORDS = {"x-slow", "slow", "medium", "fast", "x-fast", "default"}
+_PITCH_WORDS = {"x-low", "low", "medium", "high", "x-high", "default"}
+_VOLUME_WORDS = {"silent", "x-soft", "soft", "medium", "loud", "x-loud", "default"}
+_BREAK_STRENGTHS = {"none", "x-weak", "weak", "medium", "strong", "x-strong"}
+_EMPHASIS_LEVELS = {"reduced", "none", "moderate", "strong"}
+
+_RELATIVE = re.compile(r"^[+-]?\d+(\.\d+)?%$")
+_NUMBER = re.compile(r"^[+-]?\d+(\.\d+)?$")
+_PITCH_VALUE = re.compile(r"^[+-]?\d+(\.\d+)?(Hz|st|%)$")
+_BREAK_TIME = re.compile(r"^\d+(\.\d+)?(ms|s)$")
+# Azure rejects longer breaks
+MAX_BREAK_MS = 5000
+
+_totals = Counter()
+_totals_lock = threading.Lock()
+
+
+def violation_totals() -> dict:
+    """Violation counts (by rule) across every document linted in this process."""
+    with _totals_lock:
+        return dict(_totals)
+
+
+def _local(tag) -> str:
+    if not isinstance(tag, str):
+        return ""  # comments / processing instructions
+    return tag.rsplit("}", 1)[-1]
+
+
+def _is_mstts(tag) -> bool:
+    return isinstance(tag, str) and tag.startswith("{" + MSTTS_NS + "}")
+
+
+def _qualify(name: str) -> str:
+    return "{%s}%s" % (SSML_NS, name)
+
+
+def _valid_rate(value: str) -> bool:
+    return value in _RATE_WORDS or bool(_RELATIVE.match(value)) or bool(_NUMBER.match(value))
+
+
+def _valid_pitch(value: str) -> bool:
+    return value in _PITCH_WORDS or bool(_PITCH_VALUE.match(value))
+
+
+def _valid_volume(value: str) -> bool:
+    return value in _VOLUME_WORDS or bool(_NUMBER.match(value)) or bool(_RELATIVE.match(value))
+
+
+def _break_ms(value: str):
+    m = _BREAK_TIME.match(value)
+    if not m:
+        return None
+    number = float(value[:-len(m.group(2))])
+    return number * 1000 if m.group(2) == "s" else number
+
+
+# --- tree helpers (ElementTree has no parent pointers or text nodes) ---
+
+def _separator(before: str, after: str) -> str:
+    """A space if joining before and after would run two words together."""
+    if before and after and not before[-1].isspace() and not after[0].isspace():
+        return " "
+    return ""
+
+
+def _leading_text(el) -> str:
+    return el.text or ("".join(el[0].itertext()) if len(el) else "")
+
+
+def _append_text(el, text: str):
+    if not text:
+        return
+    if len(el):
+        before = el[-1].tail or "".join(el[-1].itertext())
+        el[-1].tail = (el[-1].tail or "") + _separator(before, text) + text
+    else:
+        el.text = (el.text or "") + _separator(el.text or "", text) + text
+
+
+def _prepend(el, items: list):
+    """Insert [("text", str) | ("elem", Element)] at the start of el, in order."""
+    for kind, item in reversed(items):
+        after = _leading_text(el)
+        if kind == "text":
+            el.text = item + _separator(item, after) + (el.text or "")
+        else:
+            gap = _separator("".join(item.itertext()), after)
+            item.tail = (gap + el.text) if el.text else (gap or None)
+            el.text = None
+            el.insert(0, item)
+
+
+def _unwrap(parent, index: int):
+    """Replace parent[index] with its own text and children."""
+    child = parent[index]
+    prev = parent[index - 1] if index > 0 else None
+    if child.text:
+        if prev is None:
+            parent.text = (parent.text or "") + child.text
+        else:
+            prev.tail = (prev.tail or "") + child.text
+    grandchildren = list(child)
+    parent.remove(child)
+    for offset, gc in enumerate(grandchildren):
+        parent.insert(index + offset, gc)
+    if child.tail:
+        last = grandchildren[-1] if grandchildren else prev
+        if last is None:
+            parent.text = (parent.text or "") + child.tail
+        else:
+            last.tail = (last.tail or "") + child.tail
+
+
+# --- rules ---
+
+def _fix_speak(root, counts: Counter):
+    if not root.tag.startswith("{"):
+        # No SSML namespace: qualify every unprefixed tag so the output carries xmlns
+        counts["speak_attributes"] += 1
+        for el in root.iter():
+            if isinstance(el.tag, str) and not el.tag.startswith("{"):
+                el.tag = _qualify(el.tag)
+    if root.get("version") is None:
+        counts["speak_attributes"] += 1
+        root.set("version", "1.0")
+    if root.get(XML_LANG) is None:
+        counts["speak_attributes"] += 1
+        root.set(XML_LANG, "en-IN")
+
+
+def _fix_top_level(root, voice1: str, counts: Counter):
+    """Move <break>s, text and other content sitting directly under <speak> into a <voice>."""
+    items = []
+    if root.text and root.text.strip():
+        items.append(("text", root.text))
+    for child in list(root):
+        tail = child.tail
+        child.tail = None
+        items.append(("elem", child))
+        if tail and tail.strip():
+            items.append(("text", tail))
+        root.remove(child)
+    root.text = None
+
+    voices, pending, last = [], [], None
+    for kind, item in items:
+        if kind == "elem" and _local(item.tag) == "voice":
+            if pending:
+                _prepend(item, pending)
+                pending = []
+            voices.append(item)
+            last = item
+            continue
+        if kind == "elem" and (_local(item.tag) == "lexicon" or _is_mstts(item.tag)):
+            # allowed directly under <speak>
+            voices.append(item)
+            continue
+        if kind == "elem" and _local(item.tag) == "break":
+            counts["break_outside_voice"] += 1
+        else:
+            counts["content_outside_voice"] += 1
+        if last is None:
+            pending.append((kind, item))
+        elif kind == "text":
+            _append_text(last, item)
+        else:
+            last.append(item)
+
+    if pending:
+        voice = ET.Element(_qualify("voice"), {"name": voice1})
+        _prepend(voice, pending)
+        voices.append(voice)
+    for el in voices:
+        root.append(el)
+
+
+def _fix_voices(root, voice1: str, voice2: str, pacing: str, counts: Counter):
+    previous = None
+    for voice in list(root):
+        if _local(voice.tag) != "voice":
+            continue
+        if not "".join(voice.itertext()).strip():
+            counts["empty_voice"] += 1
+            root.remove(voice)
+            continue
+        name = voice.get("name")
+        if name not in (voice1, voice2):
+            counts["unknown_voice"] += 1
+            name = voice2 if previous == voice1 else voice1
+            voice.set("name", name)
+        previous = name
+
+        if not any(_local(el.tag) == "prosody" for el in voice.iter()):
+            counts["missing_prosody"] += 1
+            prosody = ET.Element(_qualify("prosody"), {"rate": pacing})
+            prosody.text, voice.text = voice.text, None
+            for child in list(voice):
+                voice.remove(child)
+                prosody.append(child)
+            voice.append(prosody)
+
+
+def _fix_elements(parent, pacing: str, counts: Counter, inside_voice: bool = False):
+    i = 0
+    while i < len(parent):
+        el = parent[i]
+        name = _local(el.tag)
+        if not name or _is_mstts(el.tag):
+            i += 1
+            continue
+        if name not in SUPPORTED_TAGS or name == "speak" or (name == "voice" and inside_voice):
+            counts["nested_voice" if name == "voice" else "unsupported_tag"] += 1
+            _unwrap(parent, i)
+            continue  # re-check whatever took its place
+
+        if name == "prosody":
+            for attr, valid in (("rate", _valid_rate), ("pitch", _valid_pitch), ("volume", _valid_volume)):
+                value = el.get(attr)
+                if value is not None and not valid(value.strip()):
+                    counts["invalid_prosody"] += 1
+                    if attr == "rate":
+                        el.set("rate", pacing)
+                    else:
+                        del el.attrib[attr]
+        elif name == "break":
+            time_value = el.get("time")
+            if time_value is not None:
+                ms = _break_ms(time_value.strip())
+                if ms is None:
+                    counts["invalid_break"] += 1
+                    del el.attrib["time"]
+                elif ms > MAX_BREAK_MS:
+                    counts["invalid_break"] += 1
+                    el.set("time", f"{MAX_BREAK_MS}ms")
+            strength = el.get("strength")
+            if strength is not None and strength not in _BREAK_STRENGTHS:
+                counts["invalid_break"] += 1
+                del el.attrib["strength"]
+            if len(el) or (el.text and el.text.strip()):
+                # <break> is empty; keep its text after it
+                counts["invalid_break"] += 1
+                text = "".join(el.itertext())
+                for child in list(el):
+                    el.remove(child)
+                el.text = None
+                el.tail = text + (el.tail or "")
+        elif name == "emphasis":
+            level = el.get("level")
+            if level is not None and level not in _EMPHASIS_LEVELS:
+                counts["invalid_emphasis"] += 1
+                del el.attrib["level"]
+
+        _fix_elements(el, pacing, counts, inside_voice or name == "voice")
+        i += 1
+
+
+def lint_ssml(
+    ssml: str,
+    voice1: str = "en-IN-NeerjaNeural",
+    voice2: str = "en-IN-PrabhatNeural",
+    pacing: str = "medium",
+):
+    """
+    Check SSML against the build_prompt rules and repair what can be repaired.
+
+    Returns:
+        (fixed SSML, {rule: count}) -- the input string is returned untouched
+        when there is nothing to fix.
+
+    Raises:
+        RuntimeError: if the XML does not parse (same as validate_ssml).
+    """
+    try:
+        root = ET.fromstring(ssml)
+    except ET.ParseError as e:
+        raise RuntimeError(f"Invalid SSML XML produced by LLM: {e}")
+    counts = Counter()
+    if _local(root.tag) != "speak":
+        # A bare <voice>... document: give it a <speak> root
+        counts["missing_speak"] += 1
+        speak = ET.Element(_qualify("speak") if root.tag.startswith("{") else "speak")
+        speak.append(root)
+        root = speak
+
+    _fix_speak(root, counts)
+    _fix_top_level(root, voice1, counts)
+    _fix_elements(root, pacing, counts)
+    _fix_voices(root, voice1, voice2, pacing, counts)
+
+    if not any(_local(el.tag) == "voice" for el in root):
+        raise RuntimeError("SSML has no spoken content.")
+
+    with _totals_lock:
+        _totals.update(counts)
+    if not counts:
+        return ssml, {}
+    return ET.tostring(root, encoding="unicode"), dict(counts)
@@ -0,0 +1,275 @@
+# pipeline/stages.py
+import queue
+import threading
+import time
+
+from pipeline.config import Config
+from pipeline.retry import RetryScheduler, backoff_delay, get_breaker
+from pipeline import artifacts, metrics, tracing
+from pipeline.log import get_logger
+
+log = get_logger(__name__)
+
+# Sentinel pushed into every stage queue on shutdown
+_STOP = object()
+
+
+class Stage:
+    """
+    One step of the pipeline (e.g. SSML, TTS, HLS, upload).
+
+    func: callable(job: dict) -> None, mutates the job in place with its output
+    workers: number of threads pulling from this stage's queue
+    queue_size: bound of the input queue (gives backpressure to the previous stage)
+    retries: attempts for this stage only before the job is marked failed
+    limiter: optional context manager (e.g. a Semaphore) held around each call
+    service: external service name ("gemini", "azure", "b2"); calls go through its circuit breaker
+    batch_size: if > 1, func takes a list of up to batch_size jobs (collected for at most
+                batch_wait seconds) and returns one exception-or-None per job
+    """
+
+    def __init__(self, name, func, workers=1, queue_size=None, retries=None, limiter=None, service=None,
+                 batch_size=1, batch_wait=0.2):
+        self.name = name
+        self.func = func
+        self.workers = max(1, int(workers))
+        self.queue = queue.Queue(maxsize=queue_size or Config.STAGE_QUEUE_SIZE)
+        self.retries = retries or Config.MAX_RETRIES
+        self.limiter = limiter
+        self.breaker = get_breaker(service) if service else None
+        self.batch_size = max(1, int(batch_size))
+        self.batch_wait = batch_wait
+
+    def __repr__(self):
+        return f"Stage({self.name!r}, workers={self.workers})"
+
+
+class StagedPipeline:
+    """
+    Runs jobs through a chain of stages, each with its own bounded queue and
+    worker threads, so slow network calls, FFmpeg and uploads overlap.
+
+    A failing stage is retried on its own; the work of earlier stages is kept
+    on the job dict. Retries wait in a RetryScheduler, so the worker (and any
+    limiter slot) is free for other jobs during the backoff. While a service's
+    circuit breaker is open, jobs for that stage are parked instead of attempted.
+    Finished jobs (success or failure) come out of results().
+
+    Usage:
+        engine = StagedPipeline([...stages...])
+        engine.start()
+        engine.submit(job)   # blocks while the first stage is full
+        engine.close()       # no more input
+        for job in engine.results(): ...
+    """
+
+    def __init__(self, stages, cleanup=None, on_stage_complete=None):
+        if not stages:
+            raise ValueError("StagedPipeline needs at least one stage.")
+        self.stages = list(stages)
+        self.cleanup = cleanup
+        # callable(job, stage_name) run after each successful stage (e.g. the resume journal)
+        self.on_stage_complete = on_stage_complete
+        self._done = queue.Queue()
+        self._lock = threading.Lock()
+        self._submitted = 0
+        self._closed = False
+        self._threads = []
+        self._retries = RetryScheduler()
+
+    # --- lifecycle ---
+
+    def start(self):
+        for idx, stage in enumerate(self.stages):
+            for n in range(stage.workers):
+                t = threading.Thread(
+                    target=self._stage_loop,
+                    args=(idx,),
+                    name=f"{stage.name}-{n}",
+                    daemon=True,
+                )
+                t.start()
+                self._threads.append(t)
+        return self
+
+    def submit(self, job: dict):
+        """
+        Queue a job at its first stage not listed in job["completed_stages"]
+        (a resumed job skips the stages it already finished).
+        """
+        if self._closed:
+            raise RuntimeError("Cannot submit to a closed pipeline.")
+        completed = job.setdefault("completed_stages", [])
+        with self._lock:
+            self._submitted += 1
+        for stage in self.stages:
+            if stage.name not in completed:
+                stage.queue.put(job)
+                metrics.QUEUE_DEPTH.set(stage.queue.qsize(), stage=stage.name)
+                return
+        job["success"] = True
+        self._finish(job)
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+        # Wake results() in case everything already finished
+        self._done.put(_STOP)
+
+    def results(self):
+        """Yield finished jobs until the pipeline is closed and drained."""
+        yielded = 0
+        while True:
+            item = self._done.get()
+            if item is not _STOP:
+                yielded += 1
+                yield item
+            with self._lock:
+                drained = self._closed and yielded >= self._submitted
+            if drained:
+                break
+        self._shutdown()
+
+    def _shutdown(self):
+        self._retries.stop()
+        for stage in self.stages:
+            for _ in range(stage.workers):
+                stage.queue.put(_STOP)
+
+    # --- internals ---
+
+    def _finish(self, job):
+        if self.cleanup:
+            try:
+                self.cleanup(job)
+            except Exception as e:
+                log.warning("⚠️ Cleanup failed for job: %s", e)
+        self._done.put(job)
+
+    def _forward(self, idx, job):
+        name = self.stages[idx].name
+        job["completed_stages"].append(name)
+        if self.on_stage_complete:
+            try:
+                self.on_stage_complete(job, name)
+            except Exception as e:
+                log.warning("⚠️ on_stage_complete failed after stage '%s': %s", name, e)
+        if idx + 1 < len(self.stages):
+            next_stage = self.stages[idx + 1]
+            next_stage.queue.put(job)
+            metrics.QUEUE_DEPTH.set(next_stage.queue.qsize(), stage=next_stage.name)
+        else:
+            job["success"] = True
+            self._finish(job)
+
+    def _run_stage(self, stage, jobs):
+        """Run the stage on a list of jobs; returns one exception-or-None per job."""
+        if stage.limiter is not None:
+            with stage.limiter:
+                return self._call_stage(stage, jobs)
+        return self._call_stage(stage, jobs)
+
+    def _call_stage(self, stage, jobs):
+        if stage.batch_size > 1:
+            errors = stage.func(jobs)
+            return list(errors) if errors is not None else [None] * len(jobs)
+        try:
+            stage.func(jobs[0])
+            return [None]
+        except Exception as e:
+            return [e]
+
+    def _take_batch(self, stage, first):
+        """first plus whatever else arrives within batch_wait, up to batch_size jobs."""
+        jobs = [first]
+        stop = False
+        deadline = time.monotonic() + stage.batch_wait
+        while len(jobs) < stage.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                job = stage.queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if job is _STOP:
+                stop = True
+                break
+            jobs.append(job)
+        return jobs, stop
+
+    def _handle_outcome(self, idx, job, error):
+        stage = self.stages[idx]
+        if error is None:
+            self._forward(idx, job)
+            return
+
+        title = job.get("article_row", {}).get("title", "untitled")
+        attempt = job["attempts"][stage.name]
+        metrics.STAGE_ERRORS.inc(stage=stage.name, cause=metrics.error_cause(error))
+        job.setdefault("errors", []).append(artifacts.error_context(stage.name, attempt, error))
+        log.warning("[%s %d/%d] Error processing article '%s': %s", stage.name, attempt, stage.retries, title, error)
+        log.debug("Traceback for '%s' at stage '%s'", title, stage.name, exc_info=error)
+        if attempt < stage.retries:
+            delay = backoff_delay(attempt)
+            log.info("Retrying stage '%s' for '%s' in %.1fs...", stage.name, title, delay)
+            metrics.STAGE_RETRIES.inc(stage=stage.name)
+            tracing.article_wait(job.get("key"), f"backoff {stage.name}", delay, attempt=attempt)
+            self._retries.schedule(delay, stage.queue, job)
+        else:
+            log.error("Max retries reached at stage '%s' for article '%s'. Skipping.", stage.name, title)
+            job["success"] = False
+            job["failed_stage"] = stage.name
+            job["error"] = str(error)
+            self._finish(job)
+
+    def _stage_loop(self, idx):
+        stage = self.stages[idx]
+        while True:
+            job = stage.queue.get()
+            if job is _STOP:
+                return
+            metrics.QUEUE_DEPTH.set(stage.queue.qsize(), stage=stage.name)
+
+            stop = False
+            if stage.batch_size > 1:
+                jobs, stop = self._take_batch(stage, job)
+            else:
+                jobs = [job]
+
+            if stage.breaker is not None and not stage.breaker.allow():
+                # Service is down: park the jobs without spending an attempt
+                for parked in jobs:
+                    wait = stage.breaker.retry_after()
+                    self._retries.schedule(wait, stage.queue, parked)
+                    tracing.article_wait(parked.get("key"), f"circuit open {stage.name}", wait)
+                if stop:
+                    return
+                continue
+
+            for j in jobs:
+                attempts = j.setdefault("attempts", {})
+                attempts[stage.name] = attempts.get(stage.name, 0) + 1
+            metrics.STAGE_ACTIVE.inc(stage=stage.name)
+            started = time.perf_counter()
+            try:
+                with tracing.span(stage.name, "stage", key=[j.get("key") for j in jobs if j.get("key")],
+                                  attempt=jobs[0]["attempts"][stage.name], articles=len(jobs)):
+                    errors = self._run_stage(stage, jobs)
+            except Exception as e:
+                # A batch func that raises fails the whole batch
+                errors = [e] * len(jobs)
+            finally:
+                metrics.STAGE_ACTIVE.dec(stage=stage.name)
+                metrics.STAGE_SECONDS.observe(time.perf_counter() - started, stage=stage.name)
+
+            if stage.breaker is not None:
+                if any(err is None for err in errors):
+                    stage.breaker.record_success()
+                else:
+                    stage.breaker.record_failure()
+
+            for j, err in zip(jobs, errors):
+                self._handle_outcome(idx, j, err)
+            if stop:
+                return
@@ -0,0 +1,205 @@
+# pipeline/tracing.py
+import collections
+import json
+import os
+import re
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+from pipeline.config import Config
+from pipeline.log import get_logger
+
+log = get_logger(__name__)
+
+# Span tracing exported as Chrome trace / Perfetto JSON (open the file in
+# ui.perfetto.dev or chrome://tracing), plus a sampling profiler writing folded
+# stacks. Both are off unless a run turns them on, and a disabled span costs
+# one global lookup.
+#
+# Two kinds of tracks end up in the trace:
+# - one per thread: stage calls, service calls, limiter waits and segment
+#   uploads as nested "complete" events, showing busy and idle workers;
+# - one per article (async events keyed by the article key): its stages,
+#   retry attempts and backoff waits, end to end across threads.
+
+_tracer = None
+
+
+class Tracer:
+    def __init__(self, max_events: int = None):
+        self.max_events = max_events or Config.TRACE_MAX_EVENTS
+        self._lock = threading.Lock()
+        self._events = []
+        self._threads = {}
+        self.dropped = 0
+        self.origin = time.perf_counter()
+        self._pid = os.getpid()
+
+    def now_us(self) -> float:
+        return (time.perf_counter() - self.origin) * 1e6
+
+    def _add(self, events: list):
+        with self._lock:
+            if len(self._events) + len(events) > self.max_events:
+                self.dropped += len(events)
+                return
+            self._events.extend(events)
+
+    def _tid(self) -> int:
+        thread = threading.current_thread()
+        tid = thread.native_id or thread.ident
+        if tid not in self._threads:
+            with self._lock:
+                self._threads[tid] = thread.name
+        return tid
+
+    def complete(self, name: str, cat: str, start_us: float, end_us: float, args: dict = None):
+        """A span on the calling thread's track."""
+        event = {"name": name, "cat": cat, "ph": "X", "ts": round(start_us, 1),
+                 "dur": round(end_us - start_us, 1), "pid": self._pid, "tid": self._tid()}
+        if args:
+            event["args"] = args
+        self._add([event])
+
+    def article_span(self, key: str, name: str, cat: str, start_us: float, end_us: float, args: dict = None):
+        """
+        A span on the article's own track: an async begin/end pair with id=key.
+        All of them share one category so each article is a single track.
+        """
+        common = {"name": name, "cat": "article", "id": key, "pid": self._pid, "tid": 0}
+        begin = dict(common, ph="b", ts=round(start_us, 1), args=dict(args or {}, kind=cat))
+        self._add([begin, dict(common, ph="e", ts=round(end_us, 1))])
+
+    def export(self) -> dict:
+        with self._lock:
+            events = list(self._events)
+            threads = dict(self._threads)
+        meta = [{"name": "process_name", "ph": "M", "pid": self._pid, "tid": 0, "args": {"name": "newspods pipeline"}}]
+        meta += [{"name": "thread_name", "ph": "M", "pid": self._pid, "tid": tid, "args": {"name": name}}
+                 for tid, name in threads.items()]
+        return {"traceEvents": meta + events, "displayTimeUnit": "ms",
+                "otherData": {"dropped_events": self.dropped}}
+
+    def write(self, path: str):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.export(), f)
+
+
+def start_tracing(max_events: int = None) -> Tracer:
+    global _tracer
+    _tracer = Tracer(max_events)
+    return _tracer
+
+
+def stop_tracing(path: str):
+    """Stop recording and write the Chrome trace JSON to path."""
+    global _tracer
+    tracer, _tracer = _tracer, None
+    if tracer is None:
+        return
+    tracer.write(path)
+    note = f" ({tracer.dropped} events dropped over TRACE_MAX_EVENTS)" if tracer.dropped else ""
+    log.info("🧭 Trace written to %s%s", path, note)
+
+
+def enabled() -> bool:
+    return _tracer is not None
+
+
+@contextmanager
+def span(name: str, cat: str = "pipeline", key=None, thread: bool = True, **args):
+    """
+    Time the block. thread=True puts it on the calling thread's track; key (an
+    article key, or a list of them for a batch) puts it on those articles'
+    tracks too. Coroutines sharing the event loop thread pass thread=False,
+    since their spans would not nest on one thread track.
+    """
+    tracer = _tracer
+    if tracer is None:
+        yield
+        return
+    start = tracer.now_us()
+    try:
+        yield
+    except BaseException as e:
+        args["error"] = f"{type(e).__name__}: {e}"[:200]
+        raise
+    finally:
+        end = tracer.now_us()
+        if thread:
+            tracer.complete(name, cat, start, end, args)
+        for k in ([key] if isinstance(key, str) else key or ()):
+            tracer.article_span(k, name, cat, start, end, args)
+
+
+def record(name: str, cat: str, started: float, ended: float, **args):
+    """A span on the calling thread's track from two time.perf_counter() readings."""
+    tracer = _tracer
+    if tracer is None:
+        return
+    tracer.complete(name, cat, (started - tracer.origin) * 1e6, (ended - tracer.origin) * 1e6, args)
+
+
+def article_wait(key: str, name: str, seconds: float, **args):
+    """A wait that starts now and lasts `seconds` (e.g. a scheduled retry backoff) on the article's track."""
+    tracer = _tracer
+    if tracer is None or key is None:
+        return
+    start = tracer.now_us()
+    tracer.article_span(key, name, "backoff", start, start + seconds * 1e6, args)
+
+
+# --- sampling profiler ---
+
+class SamplingProfiler:
+    """
+    Samples every thread's stack every `interval` seconds via
+    sys._current_frames() and counts identical stacks. write() produces folded
+    stacks ("thread;outer;...;inner count"), the input format of flamegraph.pl,
+    speedscope and inferno. Nothing is hooked into the interpreter, so the
+    overhead is one stack walk per thread per sample.
+    """
+
+    def __init__(self, interval: float = None):
+        self.interval = interval or Config.PROFILE_INTERVAL_MS / 1000.0
+        self.stacks = collections.Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name="sampling-profiler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _loop(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                self.stacks[self._fold(names.get(ident, str(ident)), frame)] += 1
+            self.samples += 1
+
+    @staticmethod
+    def _fold(thread_name: str, frame) -> str:
+        parts = []
+        while frame is not None:
+            code = frame.f_code
+            parts.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+            frame = frame.f_back
+        # "b2-upload_3" and "b2-upload_7" fold into one root
+        parts.append(re.sub(r"[-_]\d+$", "", thread_name).replace(";", ":"))
+        return ";".join(reversed(parts))
+
+    def write(self, path: str):
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        log.info("🔬 Profile written to %s (%d samples, %d distinct stacks)", path, self.samples, len(self.stacks))
@@ -1,11 +1,24 @@
+import os
+import shutil
 import time
-import traceback
 from pipeline.config import Config
-from pipeline.ssml_creator import article_to_double_ssml
-from pipeline.azure_tts import synthesize_ssml_to_tempfile
+from pipeline.cache import content_hash
+from pipeline.journal import article_key
+from pipeline.ssml_creator import article_to_double_ssml, articles_to_double_ssml_batch, cached_ssml_for
+from pipeline.azure_tts import synthesize_ssml_to_tempfile, synthesize_ssml_to_bytes, stream_ssml_audio
 # MODIFIED: We now import the new HLS uploader function
-from pipeline.b2_uploader import upload_as_hls
-from retrying import retry
+from pipeline.b2_uploader import (
+    convert_to_hls,
+    upload_hls_dir,
+    convert_bytes_to_hls,
+    upload_hls_buffers,
+    HlsStreamPublisher,
+)
+from pipeline.hls_segmenter import HlsSegmenter, segment_audio
+from pipeline import artifacts, tracing
+from pipeline.log import get_logger
+
+log = get_logger(__name__)
 
 
 def exponential_backoff_sleep(attempt, base_seconds):
@@ -13,8 +26,203 @@ def exponential_backoff_sleep(attempt, base_seconds):
     time.sleep(base_seconds ** attempt)
 
 
+# --- Job state shared by the stage functions ---
+
+def new_job(article_row: dict) -> dict:
+    """
+    Build the job dict that travels through the pipeline stages.
+    Every stage reads what the previous one stored and adds its own output.
+    """
+    title = article_row.get("title", "untitled")
+    key = article_key(article_row)
+
+    # Prefix for all HLS segments, derived from the content key so re-running
+    # the same article writes to the same place, e.g. "AI_News_3f9a1c...".
+    clean_title = (str(title)[:30].replace(" ", "_").replace("/", "_") or "news").strip()
+    unique_prefix = f"{clean_title}_{key[:16]}"
+
+    return {
+        "article_row": article_row,
+        "key": key,
+        "unique_prefix": unique_prefix,
+        # This will be the "folder" on B2, e.g., "audio/hls/AI_News_3f9a1c..."
+        "hls_prefix": f"audio/hls/{unique_prefix}",
+    }
+
+
+def _article_text(row: dict) -> str:
+    return row.get("description") or row.get("content") or ""
+
+
+def stage_generate_ssml(job: dict):
+    """Stage 1: article text -> SSML (Gemini)."""
+    ssml = article_to_double_ssml(_article_text(job["article_row"]))
+    if not ssml:
+        raise RuntimeError("SSML generation returned empty string.")
+    job["ssml"] = ssml
+    job["ssml_hash"] = content_hash(ssml)
+
+
+def stage_generate_ssml_batch(jobs: list) -> list:
+    """
+    Stage 1, batched: several short articles share one Gemini request.
+    Returns one exception-or-None per job for the staged engine.
+    """
+    results = articles_to_double_ssml_batch([_article_text(job["article_row"]) for job in jobs])
+    errors = []
+    for job, ssml in zip(jobs, results):
+        if isinstance(ssml, Exception):
+            errors.append(ssml)
+        elif not ssml:
+            errors.append(RuntimeError("SSML generation returned empty string."))
+        else:
+            job["ssml"] = ssml
+            job["ssml_hash"] = content_hash(ssml)
+            errors.append(None)
+    return errors
+
+
+def stage_synthesize(job: dict):
+    """
+    Stage 2: SSML -> MP3 (Azure). A local file for FFmpeg to read, or with
+    AUDIO_IN_MEMORY the MP3 bytes on the job.
+    """
+    if Config.AUDIO_IN_MEMORY:
+        job["audio_bytes"] = synthesize_ssml_to_bytes(job["ssml"])
+    else:
+        job["audio_path"] = synthesize_ssml_to_tempfile(job["ssml"], prefix=job["unique_prefix"] + "_")
+
+
+def native_hls_files(job: dict) -> list:
+    """HLS_SEGMENTER=native: cut the MP3 frames into segments in memory, no FFmpeg."""
+    data = job.get("audio_bytes")
+    if data is None:
+        with open(job["audio_path"], "rb") as f:
+            data = f.read()
+    return segment_audio(data, Config.HLS_SEGMENT_SECONDS)
+
+
+def stage_convert_hls(job: dict):
+    """Stage 3: MP3 -> HLS segments in a temp dir, or in memory (FFmpeg, CPU bound)."""
+    if Config.HLS_SEGMENTER == "native":
+        job["hls_files"] = native_hls_files(job)
+        return
+    if job.get("audio_bytes") is not None:
+        job["hls_files"] = convert_bytes_to_hls(job["audio_bytes"])
+        return
+    # Drop a half-written dir from a failed attempt before converting again
+    _remove_hls_dir(job)
+    job["hls_dir"] = convert_to_hls(job["audio_path"])
+
+
+def stage_upload_hls(job: dict):
+    """Stage 4: HLS segments -> B2."""
+    b2_hls_prefix = job["hls_prefix"]
+    if job.get("hls_files") is not None:
+        uploaded_segments = upload_hls_buffers(job["hls_files"], b2_hls_prefix)
+    else:
+        uploaded_segments = upload_hls_dir(job["hls_dir"], b2_hls_prefix)
+
+    # The most important piece of info to save to your database is the
+    # path to the master playlist (index.m3u8).
+    job["audio"] = {
+        "original_local_path": job.get("audio_path"),
+        "hls_prefix": b2_hls_prefix,
+        "hls_playlist_object": f"{b2_hls_prefix}/index.m3u8",
+        "segment_count": len(uploaded_segments)
+    }
+
+
+def stage_stream_to_hls(job: dict):
+    """
+    HLS_STREAMING: TTS, segmenting and upload in one pass. Azure's audio chunks
+    are cut into segments as they arrive and each segment is uploaded and added
+    to a live EVENT playlist right away; the playlist is closed with
+    #EXT-X-ENDLIST once synthesis completes.
+    """
+    b2_hls_prefix = job["hls_prefix"]
+    segmenter = HlsSegmenter(target_duration=Config.HLS_SEGMENT_SECONDS)
+    publisher = HlsStreamPublisher(b2_hls_prefix)
+    audio = stream_ssml_audio(job["ssml"])
+    try:
+        for chunk in audio:
+            for name, data, duration in segmenter.feed(chunk):
+                publisher.add(name, data, duration)
+        for name, data, duration in segmenter.flush():
+            publisher.add(name, data, duration)
+        uploaded_segments = publisher.finish()
+    except Exception:
+        publisher.abort()
+        raise
+    finally:
+        # An upload failure leaves the generator suspended; closing it stops Azure
+        audio.close()
+
+    job["audio"] = {
+        "original_local_path": None,
+        "hls_prefix": b2_hls_prefix,
+        "hls_playlist_object": publisher.playlist_object,
+        "segment_count": len(uploaded_segments),
+    }
+
+
+def resume_job(job: dict, state: dict) -> dict:
+    """
+    Apply a journal state (see pipeline.journal) to a fresh job so the engine
+    skips the stages whose output is still available. A stage is only skipped
+    if everything after it can pick up from what it left behind.
+    """
+    completed = state.get("completed", set())
+    if state.get("hls_prefix"):
+        # Keep the B2 folder stable so a finished upload is reused
+        job["hls_prefix"] = state["hls_prefix"]
+        job["unique_prefix"] = state["hls_prefix"].rsplit("/", 1)[-1]
+
+    if "upload" in completed and state.get("hls_playlist_object"):
+        job["audio"] = {
+            "original_local_path": state.get("audio_path"),
+            "hls_prefix": job["hls_prefix"],
+            "hls_playlist_object": state["hls_playlist_object"],
+            "segment_count": state.get("segment_count"),
+        }
+        job["completed_stages"] = ["ssml", "tts", "hls", "upload"]
+        return job
+
+    # With HLS_STREAMING there is no "tts" stage: the upload stage synthesizes
+    # from job["ssml"] itself, so a finished tts file is no use to it
+    if (not Config.HLS_STREAMING and "tts" in completed
+            and state.get("audio_path") and os.path.exists(state["audio_path"])):
+        job["audio_path"] = state["audio_path"]
+        job["completed_stages"] = ["ssml", "tts"]
+        return job
+
+    if "ssml" in completed:
+        ssml = cached_ssml_for(_article_text(job["article_row"]))
+        if ssml and content_hash(ssml) == state.get("ssml_hash"):
+            job["ssml"] = ssml
+            job["ssml_hash"] = state["ssml_hash"]
+            job["completed_stages"] = ["ssml"]
+    return job
+
+
+def _remove_hls_dir(job: dict):
+    hls_dir = job.pop("hls_dir", None)
+    if hls_dir:
+        shutil.rmtree(hls_dir, ignore_errors=True)
+
+
+def cleanup_job(job: dict):
+    """Called once per finished job (success or failure) to drop temp files and buffers."""
+    _remove_hls_dir(job)
+    job.pop("audio_bytes", None)
+    job.pop("hls_files", None)
+
+
 def process_single_article(article_row: dict, attempt_limit: int = None):
     """
+    Runs every stage for one article in the calling thread.
+    The orchestrator uses the staged engine instead; this is kept for one-off runs.
+
     article_row: dict with keys e.g. title, description, source, topic, published_date (optional)
     returns: dict with success status and audio info if success
     """
@@ -22,70 +230,55 @@ def process_single_article(article_row: dict, attempt_limit: int = None):
     base = Config.RETRY_BACKOFF_BASE
 
     title = article_row.get("title", "untitled")
-    description = article_row.get("description") or article_row.get("content") or ""
-
-    # MODIFIED: Create a unique prefix for all HLS segments.
-    # We use time to ensure it's unique, e.g., "AI_News_169987...""
-    clean_title = (title[:30].replace(" ", "_") or "news").strip()
-    unique_prefix = f"{clean_title}_{time.time():.0f}"
+    job = new_job(article_row)
 
+    key = job["key"]
     last_err = None
     for attempt in range(1, attempt_limit + 1):
         try:
-            # 1. Create SSML
-            ssml = article_to_double_ssml(description)
-            if not ssml:
-                raise RuntimeError("SSML generation returned empty string.")
-
-            # 2. Synthesize SSML -> audio file (Azure)
-            # We still need the original MP3 as a source for FFmpeg
-            out_path = synthesize_ssml_to_tempfile(ssml, prefix=unique_prefix + "_")
-
-            # 3. Upload to B2 as HLS
-            # MODIFIED: This is the main change.
-            # We are calling upload_as_hls instead of upload_file.
-            # This function handles the FFmpeg conversion AND uploads all segments.
-
-            # This will be the "folder" on B2, e.g., "audio/hls/AI_News_169987..."
-            b2_hls_prefix = f"audio/hls/{unique_prefix}"
+            with tracing.span(f"attempt {attempt}", "article", key=key, title=title):
+                # 1. Create SSML
+                with tracing.span("ssml", "stage", key=key):
+                    stage_generate_ssml(job)
 
-            uploaded_segments = upload_as_hls(
-                local_mp3_path=out_path,
-                b2_object_prefix=b2_hls_prefix
-            )
+                # 2. Synthesize SSML -> audio file (Azure)
+                with tracing.span("tts", "stage", key=key):
+                    stage_synthesize(job)
 
-            # MODIFIED: The return payload is updated to be HLS-aware.
-            # The most important piece of info to save to your database is the
-            # path to the master playlist (index.m3u8).
-            master_playlist_path = f"{b2_hls_prefix}/index.m3u8"
+                # 3. Convert to HLS (FFmpeg) and upload to B2
+                with tracing.span("hls", "stage", key=key):
+                    stage_convert_hls(job)
+                with tracing.span("upload", "stage", key=key):
+                    stage_upload_hls(job)
 
             # 4. Return success payload including HLS info
             return {
                 "success": True,
                 "article_row": article_row,
-                "audio": {
-                    "original_local_path": out_path,
-                    "hls_prefix": b2_hls_prefix,
-                    "hls_playlist_object": master_playlist_path,
-                    "segment_count": len(uploaded_segments)
-                }
+                "audio": job["audio"]
             }
         except Exception as e:
             last_err = e
             # log
-            print(f"[Attempt {attempt}/{attempt_limit}] Error processing article '{title}': {e}")
-            traceback.print_exc()
+            job.setdefault("errors", []).append(artifacts.error_context("article", attempt, e))
+            log.warning("[Attempt %d/%d] Error processing article '%s': %s", attempt, attempt_limit, title, e)
+            log.debug("Traceback for '%s'", title, exc_info=True)
             if attempt < attempt_limit:
                 backoff = base ** attempt
-                print(f"Retrying in {backoff:.1f}s...")
-                time.sleep(backoff)
+                log.info("Retrying in %.1fs...", backoff)
+                with tracing.span("backoff", "backoff", key=key, attempt=attempt):
+                    time.sleep(backoff)
             else:
-                print(f"Max retries reached for article '{title}'. Skipping.")
+                log.error("Max retries reached for article '%s'. Skipping.", title)
+        finally:
+            cleanup_job(job)
+    job.update(success=False, error=str(last_err))
+    artifacts.capture(job)
+    artifacts.flush()
     return {"success": False, "article_row": article_row, "error": str(last_err)}
 
 
 # --- The test block remains the same, it will now test the full HLS pipeline ---
-print("Worker module loaded.")
 
 if __name__ == "__main__":
     print("Testing worker (HLS pipeline)...")
@@ -98,4 +291,4 @@ if __name__ == "__main__":
     import json
 
     print(json.dumps(result, indent=2))
-    print("--------------------------")
\ No newline at end of file
+    print("--------------------------")
@@ -1,17 +1,130 @@
 # run_pipeline.py
 import argparse
-from pipeline.orchestrator import run_pipeline_from_csv
 import json
+import signal
+import sys
+import threading
+from pipeline.config import Config
+from pipeline.log import setup_logging
 
-def main():
-    parser = argparse.ArgumentParser()
+# Only config is imported up front: the subcommands below that never touch
+# Gemini/Azure/B2/DB (validate, dry-run, config) must start fast, and the
+# pipeline modules load their SDKs on first use anyway.
+
+
+def _run_args() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(add_help=False)
     parser.add_argument("--csv", required=False, default="tests/random_articles.csv",
                         help="Path to input CSV of articles")
-    args = parser.parse_args()
+    parser.add_argument("--resume", action="store_true",
+                        help="Continue the previous run from its journal instead of starting over")
+    parser.add_argument("--journal", default=None,
+                        help="Journal file (defaults to JOURNAL_PATH)")
+    parser.add_argument("--async", dest="use_async", action="store_true",
+                        help="Run every stage on an asyncio event loop instead of stage threads")
+    parser.add_argument("--trace", default=Config.TRACE_PATH, metavar="PATH",
+                        help="Write a Chrome-trace/Perfetto JSON timeline of the run (stages, retries, uploads)")
+    parser.add_argument("--profile", default=Config.PROFILE_PATH, metavar="PATH",
+                        help="Sample every thread's stack during the run and write folded stacks")
+    return parser
+
+
+def build_parser() -> argparse.ArgumentParser:
+    run_args = _run_args()
+    # Without a subcommand the flags run the pipeline, as before
+    parser = argparse.ArgumentParser(parents=[run_args])
+    commands = parser.add_subparsers(dest="command", metavar="command")
+    commands.add_parser("run", parents=[run_args], help="Run the pipeline (the default)")
+
+    validate = commands.add_parser("validate", help="Check the CSV without calling any service")
+    validate.add_argument("--csv", default="tests/random_articles.csv", help="Path to input CSV of articles")
+
+    dry_run = commands.add_parser("dry-run", help="Show what a run would process, without calling any service")
+    dry_run.add_argument("--csv", default="tests/random_articles.csv", help="Path to input CSV of articles")
+    dry_run.add_argument("--resume", action="store_true", help="Account for the previous run's journal")
+    dry_run.add_argument("--journal", default=None, help="Journal file (defaults to JOURNAL_PATH)")
+
+    commands.add_parser("config", help="Print the effective configuration (secrets masked)")
+
+    # Distributed mode: one shared queue table, any number of workers
+    enqueue = commands.add_parser("enqueue", help="Add the CSV's articles to the shared job queue")
+    enqueue.add_argument("--csv", default="tests/random_articles.csv", help="Path to input CSV of articles")
+    enqueue.add_argument("--retry-failed", action="store_true",
+                         help="Also put the queue's failed jobs back with a fresh attempt budget")
+
+    worker = commands.add_parser("worker", help="Claim and process jobs from the shared queue")
+    worker.add_argument("--drain", action="store_true",
+                        help="Exit once nothing is left to claim instead of waiting for new jobs")
+    worker.add_argument("--worker-id", default=None, help="Lease owner name (defaults to QUEUE_WORKER_ID or host-pid)")
+
+    commands.add_parser("queue-status", help="Count the shared queue's jobs by status")
+    return parser
 
-    summary = run_pipeline_from_csv(args.csv)
+
+def _print_json(data):
+    # failed records may carry numpy embedding rows
+    print(json.dumps(data, indent=2, default=lambda o: o.tolist() if hasattr(o, "tolist") else str(o)))
+
+
+def run(args):
+    from pipeline import tracing
+
+    if args.trace:
+        tracing.start_tracing()
+    profiler = tracing.SamplingProfiler().start() if args.profile else None
+    try:
+        if args.use_async:
+            from pipeline.async_orchestrator import run_pipeline_from_csv_async_mode
+            summary = run_pipeline_from_csv_async_mode(args.csv, resume=args.resume, journal_path=args.journal)
+        else:
+            from pipeline.orchestrator import run_pipeline_from_csv
+            summary = run_pipeline_from_csv(args.csv, resume=args.resume, journal_path=args.journal)
+    finally:
+        if profiler is not None:
+            profiler.stop()
+            profiler.write(args.profile)
+        if args.trace:
+            tracing.stop_tracing(args.trace)
     print("\nPipeline Summary:")
-    print(json.dumps(summary, indent=2))
+    _print_json(summary)
+
+
+def work(args):
+    from pipeline.job_queue import run_queue_worker
+
+    # SIGTERM (container stop): stop claiming and finish what is in flight
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+    summary = run_queue_worker(drain=args.drain, stop=stop, owner=args.worker_id)
+    print("\nWorker Summary:")
+    _print_json(summary)
+
+
+def main():
+    args = build_parser().parse_args()
+    setup_logging()
+
+    if args.command == "validate":
+        from pipeline.preflight import validate_csv
+        report = validate_csv(args.csv)
+        _print_json(report)
+        sys.exit(0 if report["ok"] else 1)
+    elif args.command == "dry-run":
+        from pipeline.preflight import dry_run
+        _print_json(dry_run(args.csv, resume=args.resume, journal_path=args.journal))
+    elif args.command == "config":
+        from pipeline.preflight import effective_config
+        _print_json(effective_config())
+    elif args.command == "enqueue":
+        from pipeline.job_queue import enqueue_csv
+        _print_json(enqueue_csv(args.csv, retry_failed=args.retry_failed))
+    elif args.command == "worker":
+        work(args)
+    elif args.command == "queue-status":
+        from pipeline.job_queue import JobQueue
+        _print_json(JobQueue().counts())
+    else:
+        run(args)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,48 @@
+# tests/test_cache.py
+import os
+import time
+
+from pipeline.cache import DiskCache
+
+
+def _age(path, seconds: float):
+    past = time.time() - seconds
+    os.utime(path, (past, past))
+
+
+def test_eviction_trims_to_low_water(tmp_path):
+    cache = DiskCache(tmp_path, max_bytes=1000, max_age_seconds=0, suffix=".bin")
+    for i in range(10):
+        _age(cache.set_bytes(f"{i:02d}", b"x" * 100), 100 - i)  # 00 is the oldest
+    assert cache._bytes == 1000
+
+    cache.set_bytes("10", b"x" * 100)
+    assert cache._bytes <= 900
+    assert cache.lookup("00") is None and cache.lookup("01") is None
+    assert cache.lookup("10") is not None
+
+
+def test_full_cache_of_fresh_entries_is_not_rescanned_on_every_write(tmp_path, monkeypatch):
+    cache = DiskCache(tmp_path, max_bytes=1000, max_age_seconds=0, suffix=".bin", evict_grace_seconds=600)
+    scans = []
+    real_evict = cache.evict
+    monkeypatch.setattr(cache, "evict", lambda: scans.append(1) or real_evict())
+
+    for i in range(30):
+        cache.set_bytes(f"{i:02d}", b"x" * 100)
+    # Nothing is evictable (all inside the grace period): after each scan the
+    # next one waits for another 10% of max_bytes, i.e. every other write here
+    assert cache._bytes == 3000
+    assert len(scans) == 10
+
+
+def test_stale_temp_files_are_removed(tmp_path):
+    cache = DiskCache(tmp_path, max_bytes=100, max_age_seconds=0, suffix=".bin")
+    stale, fresh = cache.temp_path("aa"), cache.temp_path("ab")
+    stale.write_bytes(b"half")
+    fresh.write_bytes(b"half")
+    _age(stale, DiskCache.STALE_TEMP_SECONDS + 1)
+
+    cache.evict()
+    assert not stale.exists()
+    assert fresh.exists()
@@ -0,0 +1,59 @@
+# tests/test_db_schema.py
+import os
+
+import pytest
+
+# The content_key migration against a real Postgres. Uses the same throwaway
+# database as tests/test_job_queue.py (QUEUE_TEST_DB_URL); every test drops and
+# recreates public.articles there.
+
+DB_URL = os.getenv("QUEUE_TEST_DB_URL")
+pytestmark = pytest.mark.skipif(not DB_URL, reason="QUEUE_TEST_DB_URL is not set")
+
+
+@pytest.fixture
+def engine():
+    from sqlalchemy import create_engine, text
+
+    engine = create_engine(DB_URL)
+    with engine.begin() as connection:
+        connection.execute(text("DROP TABLE IF EXISTS public.articles"))
+        # The articles table as it was before content_key
+        connection.execute(text(
+            "CREATE TABLE public.articles (article_id BIGSERIAL PRIMARY KEY, title TEXT, description TEXT, "
+            "news_source TEXT, created_at TIMESTAMPTZ, audio_key TEXT, embedding FLOAT8[])"
+        ))
+    yield engine
+    with engine.begin() as connection:
+        connection.execute(text("DROP TABLE IF EXISTS public.articles"))
+    engine.dispose()
+
+
+def test_content_key_is_added_once(engine):
+    from sqlalchemy import text
+    from pipeline.db_schema import ensure_content_key, has_content_key
+
+    assert not has_content_key(engine)
+    ensure_content_key(engine)
+    assert has_content_key(engine)
+    ensure_content_key(engine)  # already there: nothing to do
+
+    upsert = text(
+        "INSERT INTO public.articles (title, content_key) VALUES (:title, 'k') "
+        "ON CONFLICT (content_key) DO UPDATE SET title = EXCLUDED.title RETURNING article_id"
+    )
+    with engine.begin() as connection:
+        first = connection.execute(upsert, {"title": "a"}).scalar()
+        second = connection.execute(upsert, {"title": "b"}).scalar()
+    assert first == second
+
+
+def test_column_without_unique_index_gets_the_index(engine):
+    from sqlalchemy import text
+    from pipeline.db_schema import ensure_content_key, has_content_key
+
+    with engine.begin() as connection:
+        connection.execute(text("ALTER TABLE public.articles ADD COLUMN content_key TEXT"))
+    assert not has_content_key(engine)
+    ensure_content_key(engine)
+    assert has_content_key(engine)
@@ -0,0 +1,187 @@
+# tests/test_job_queue.py
+import os
+import threading
+
+import pytest
+
+# The lease/fencing SQL of pipeline.job_queue against a real Postgres. Point
+# QUEUE_TEST_DB_URL at a throwaway database: every test drops and recreates
+# public.pipeline_jobs there.
+#
+#   QUEUE_TEST_DB_URL=postgresql://postgres@localhost/queue_test python -m pytest tests
+
+DB_URL = os.getenv("QUEUE_TEST_DB_URL")
+pytestmark = pytest.mark.skipif(not DB_URL, reason="QUEUE_TEST_DB_URL is not set")
+
+
+@pytest.fixture
+def engine():
+    from sqlalchemy import create_engine
+    from pipeline.db_schema import pipeline_jobs_table
+    from pipeline.job_queue import ensure_queue_table
+
+    # A claim that waits on a row lock instead of skipping it fails fast
+    engine = create_engine(DB_URL, connect_args={"options": "-c lock_timeout=2000"})
+    pipeline_jobs_table.drop(engine, checkfirst=True)
+    ensure_queue_table(engine)
+    yield engine
+    pipeline_jobs_table.drop(engine, checkfirst=True)
+    engine.dispose()
+
+
+def _queue(engine, owner, **kwargs):
+    from pipeline.job_queue import JobQueue
+
+    return JobQueue(owner=owner, engine=engine, lease_seconds=kwargs.pop("lease_seconds", 60), **kwargs)
+
+
+def _enqueue(queue, n: int) -> list:
+    from pipeline.journal import article_key
+
+    records = [{"title": f"Story {i}", "description": f"Text of story {i}.", "news_source": "Wire"}
+               for i in range(n)]
+    assert queue.enqueue(records) == n
+    return [article_key(rec) for rec in records]
+
+
+def _row(engine, key):
+    from sqlalchemy import select
+    from pipeline.db_schema import pipeline_jobs_table as jobs
+
+    with engine.connect() as connection:
+        return connection.execute(select(jobs).where(jobs.c.content_key == key)).one()
+
+
+def _expire_leases(engine):
+    from sqlalchemy import text
+
+    with engine.begin() as connection:
+        connection.execute(text("UPDATE public.pipeline_jobs SET lease_expires_at = now() - interval '1 second'"))
+
+
+def test_enqueue_is_idempotent(engine):
+    queue = _queue(engine, "a")
+    _enqueue(queue, 3)
+    assert queue.enqueue([{"title": "Story 0", "description": "Text of story 0.", "news_source": "Wire"}]) == 0
+    assert queue.counts() == {"queued": 3}
+
+
+def test_claim_skips_rows_locked_by_another_claim(engine):
+    from sqlalchemy import select
+    from pipeline.db_schema import pipeline_jobs_table as jobs
+
+    queue = _queue(engine, "b")
+    keys = _enqueue(queue, 6)
+    locked = set(keys[:2])
+
+    # Another worker's claim transaction, still open, holding two rows
+    with engine.connect() as other:
+        with other.begin():
+            other.execute(select(jobs.c.content_key).where(jobs.c.content_key.in_(locked)).with_for_update())
+            rows = queue.claim(10)
+
+    claimed = {row.content_key for row in rows}
+    assert claimed == set(keys) - locked
+    assert all(row.attempts == 1 for row in rows)
+    assert queue.claim(10) and queue.counts() == {"leased": 6}
+
+
+def test_concurrent_claims_never_share_a_job(engine):
+    keys = _enqueue(_queue(engine, "setup"), 60)
+    claimed = {}
+    start = threading.Barrier(3)
+
+    def work(owner):
+        queue = _queue(engine, owner)
+        start.wait()
+        mine = []
+        while True:
+            rows = queue.claim(4)
+            if not rows:
+                break
+            mine.extend(row.content_key for row in rows)
+        claimed[owner] = mine
+
+    threads = [threading.Thread(target=work, args=(f"w{i}",)) for i in range(3)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    everything = [key for mine in claimed.values() for key in mine]
+    assert sorted(everything) == sorted(keys)
+
+
+def test_expired_lease_is_taken_over(engine):
+    first, second = _queue(engine, "first"), _queue(engine, "second")
+    [key] = _enqueue(first, 1)
+    assert [row.content_key for row in first.claim(1)] == [key]
+    # Lease still valid: nothing for anyone else
+    assert second.claim(1) == []
+
+    _expire_leases(engine)
+    rows = second.claim(1)
+    assert [(row.content_key, row.attempts) for row in rows] == [(key, 2)]
+    assert _row(engine, key).lease_owner == "second"
+    # The old owner's heartbeat finds the lease gone and does not take it back
+    assert first.heartbeat([key]) == {key}
+    assert second.heartbeat([key]) == set()
+
+
+def test_expired_lease_past_max_attempts_fails(engine):
+    queue = _queue(engine, "a", max_attempts=1)
+    [key] = _enqueue(queue, 1)
+    assert len(queue.claim(1)) == 1
+    _expire_leases(engine)
+    assert queue.claim(1) == []
+    row = _row(engine, key)
+    assert (row.status, row.lease_owner) == ("failed", None)
+
+
+def test_progress_and_fail_are_fenced_on_the_lease_owner(engine):
+    first, second = _queue(engine, "first"), _queue(engine, "second")
+    [key] = _enqueue(first, 1)
+    first.claim(1)
+    assert first.record_progress(key, {"completed": ["ssml"], "ssml": "<speak/>"})
+
+    _expire_leases(engine)
+    second.claim(1)
+
+    # The node that lost the lease can neither overwrite progress nor fail the job
+    assert not first.record_progress(key, {"completed": []})
+    first.fail(key, "tts", "stale owner")
+    row = _row(engine, key)
+    assert (row.status, row.lease_owner) == ("leased", "second")
+    assert row.progress == {"completed": ["ssml"], "ssml": "<speak/>"}
+
+    assert second.record_progress(key, {"completed": ["ssml", "upload"]})
+    second.fail(key, "db", "boom")
+    row = _row(engine, key)
+    assert (row.status, row.lease_owner, row.failed_stage, row.error) == ("failed", None, "db", "boom")
+    assert row.progress == {"completed": ["ssml", "upload"]}
+
+
+def test_release_returns_the_attempt(engine):
+    queue = _queue(engine, "a")
+    [key] = _enqueue(queue, 1)
+    queue.claim(1)
+    assert queue.release([key]) == 1
+    row = _row(engine, key)
+    assert (row.status, row.attempts, row.lease_owner) == ("queued", 0, None)
+
+
+def test_stage_progress_leaves_out_local_paths(engine):
+    from pipeline.job_queue import _LeaseKeeper
+
+    queue = _queue(engine, "a")
+    [key] = _enqueue(queue, 1)
+    queue.claim(1)
+    keeper = _LeaseKeeper(queue)
+    keeper.hold(key, {"completed": set()})
+    keeper.on_stage_complete({"key": key, "ssml": "<speak/>", "ssml_hash": "h", "hls_prefix": "p"}, "ssml")
+    keeper.on_stage_complete({"key": key, "audio_path": "/tmp/news_1.mp3"}, "tts")
+
+    progress = _row(engine, key).progress
+    assert progress["completed"] == ["ssml", "tts"]
+    assert progress["ssml"] == "<speak/>"
+    assert "audio_path" not in progress
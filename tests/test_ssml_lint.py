@@ -0,0 +1,108 @@
+# tests/test_ssml_lint.py
+import pytest
+
+from pipeline.ssml_lint import lint_ssml
+
+# Input -> expected output for each repair rule of pipeline.ssml_lint.
+# Run with: python -m pytest tests
+
+SPEAK = '<speak xmlns="http://www.w3.org/2001/10/synthesis" version="1.0" xml:lang="en-IN">'
+V1 = '<voice name="en-IN-NeerjaNeural">'
+V2 = '<voice name="en-IN-PrabhatNeural">'
+PROSODY = '<prosody rate="medium">'
+
+
+def _doc(body: str) -> str:
+    return f"{SPEAK}{body}</speak>"
+
+
+CASES = [
+    (
+        "missing_speak",
+        f"{V1}{PROSODY}Hi</prosody></voice>",
+        _doc(f"{V1}{PROSODY}Hi</prosody></voice>"),
+        {"missing_speak": 1, "speak_attributes": 3},
+    ),
+    (
+        "text_before_voice_keeps_words_apart",
+        '<speak>Hello<voice name="x">Hi there</voice></speak>',
+        _doc(f"{V1}{PROSODY}Hello Hi there</prosody></voice>"),
+        {"speak_attributes": 3, "content_outside_voice": 1, "unknown_voice": 1, "missing_prosody": 1},
+    ),
+    (
+        "text_after_voice_keeps_words_apart",
+        _doc(f"{V1}{PROSODY}Hi there</prosody></voice>Bye"),
+        _doc(f"{V1}{PROSODY}Hi there</prosody> Bye</voice>"),
+        {"content_outside_voice": 1},
+    ),
+    (
+        "element_before_voice_keeps_words_apart",
+        _doc(f"<emphasis>Big</emphasis>{V1}news today</voice>"),
+        _doc(f"{V1}{PROSODY}<emphasis>Big</emphasis> news today</prosody></voice>"),
+        {"content_outside_voice": 1, "missing_prosody": 1},
+    ),
+    (
+        "existing_whitespace_is_not_doubled",
+        _doc(f"Hello {V1}Hi</voice>"),
+        _doc(f"{V1}{PROSODY}Hello Hi</prosody></voice>"),
+        {"content_outside_voice": 1, "missing_prosody": 1},
+    ),
+    (
+        "break_outside_voice",
+        _doc(f'<break time="500ms"/>{V1}{PROSODY}Hi</prosody></voice>'),
+        _doc(f'{V1}<break time="500ms" />{PROSODY}Hi</prosody></voice>'),
+        {"break_outside_voice": 1},
+    ),
+    (
+        "unknown_voice_alternates",
+        _doc(f'{V1}{PROSODY}One</prosody></voice><voice name="Someone">{PROSODY}Two</prosody></voice>'),
+        _doc(f"{V1}{PROSODY}One</prosody></voice>{V2}{PROSODY}Two</prosody></voice>"),
+        {"unknown_voice": 1},
+    ),
+    (
+        "missing_prosody",
+        _doc(f"{V1}Hi</voice>"),
+        _doc(f"{V1}{PROSODY}Hi</prosody></voice>"),
+        {"missing_prosody": 1},
+    ),
+    (
+        "invalid_prosody",
+        _doc(f'{V1}<prosody rate="very fast" pitch="up">Hi</prosody></voice>'),
+        _doc(f"{V1}{PROSODY}Hi</prosody></voice>"),
+        {"invalid_prosody": 2},
+    ),
+    (
+        "invalid_break",
+        _doc(f'{V1}{PROSODY}Hi<break time="9s"/>there<break time="soon"/></prosody></voice>'),
+        _doc(f'{V1}{PROSODY}Hi<break time="5000ms" />there<break /></prosody></voice>'),
+        {"invalid_break": 2},
+    ),
+    (
+        "unsupported_tag_and_nested_voice",
+        _doc(f"{V1}{PROSODY}A <b>bold</b> {V2}move</voice></prosody></voice>"),
+        _doc(f"{V1}{PROSODY}A bold move</prosody></voice>"),
+        {"unsupported_tag": 1, "nested_voice": 1},
+    ),
+    (
+        "empty_voice",
+        _doc(f"{V1}{PROSODY}Hi</prosody></voice>{V2} </voice>"),
+        _doc(f"{V1}{PROSODY}Hi</prosody></voice>"),
+        {"empty_voice": 1},
+    ),
+]
+
+
+@pytest.mark.parametrize("ssml, expected, counts", [c[1:] for c in CASES], ids=[c[0] for c in CASES])
+def test_lint_repairs(ssml, expected, counts):
+    assert lint_ssml(ssml) == (expected, counts)
+
+
+def test_clean_document_is_returned_untouched():
+    ssml = _doc(f"{V1}{PROSODY}Hi</prosody></voice>")
+    assert lint_ssml(ssml) == (ssml, {})
+
+
+@pytest.mark.parametrize("ssml", ["<speak><voice>unclosed</speak>", _doc(f"{V1} </voice>")])
+def test_unrepairable_documents_raise(ssml):
+    with pytest.raises(RuntimeError):
+        lint_ssml(ssml)